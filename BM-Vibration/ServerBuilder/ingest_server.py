@@ -0,0 +1,518 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+# ==============================================================================
+# INGESTION SERVER: ingest_server.py
+# Purpose: Collects Movesense accelerometer packets from many sensors at once
+#          (phones, or load_test.py as a stand-in) and runs every
+#          connection through preprocessing and ON/OFF detection as the data
+#          arrives.
+#
+# Protocol (TCP, one JSON object per line):
+#   optional first line  {"hello": {"sensor_serial": "...", "fs": 833.0}}
+#   then packets         {"acc": {"Timestamp": 150602, "ArrayAcc": [{"x":..,"y":..,"z":..}, ...]}}
+#   (the entries of a Movesense recording's "data" list; an optional "sent" field,
+#    the client's time.time() at sending, is used for end-to-end latency)
+#
+# Per connection: reader -> bounded queue -> consumer. A full queue stops the
+# reader, so TCP flow control slows the client down (backpressure). The consumer
+# lets packets collect for up to BATCH_DELAY_S, drains them into one block, runs
+# the ON/OFF detector, the chunked preprocessor and the Wh exposure meter (gated by the
+# detector) on it and buffers the results; they are written to
+# append-only files in batches (FLUSH_WINDOWS / FLUSH_INTERVAL_S), off the event loop.
+#
+# Output per connection: <output_dir>/<sensor>_<start UTC>_<n>/ (the sensor name
+# reduced to letters, digits, '.', '_' and '-'; session.json keeps the name as sent)
+#   segments.npy      (N, WINDOW_SIZE, 3) float32 filtered windows (SegmentStore)
+#   transitions.npy   ON/OFF transitions (TRANSITION_DTYPE)
+#   packets.npy       Timestamp, first sample index and size of every packet
+#   session.json      sensor, Fs, counts, ON time, hand-arm exposure (a_hv, A(8))
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '02_preprocessing', 'scripts'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '03_classifiers', 'on_off'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from vibration import instrument
+from vibration.exposure import ExposureMeter
+from onoff_model import TRANSITION_DTYPE, OnOffDetector, load_thresholds
+from preprocess_pipeline import ChunkedPreprocessor
+from segment_store import AppendableArray, SegmentStore
+from segmentation import WINDOW_SIZE
+
+# --- 1. Server Constants ---
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8833
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'sessions')
+# Packets buffered per connection before the reader stops reading the socket
+QUEUE_PACKETS = 512
+# Most packets merged into one processing block
+MAX_BATCH_PACKETS = 256
+# Time a block may wait for more packets; fewer, larger blocks cost far less per packet
+BATCH_DELAY_S = 0.05
+# Buffered windows / seconds before the results of a connection are written
+FLUSH_WINDOWS = 1024
+FLUSH_INTERVAL_S = 1.0
+# Longest accepted line (bytes); a Movesense packet is well below 1 kB
+MAX_LINE_BYTES = 1 << 16
+# Characters a client-chosen sensor name may bring into a folder name
+UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+MAX_NAME_LENGTH = 64
+# Latencies kept for the percentiles (most recent ones)
+LATENCY_HISTORY = 1 << 17
+
+PACKET_DTYPE = np.dtype([
+    ('timestamp', np.int64),
+    ('first_sample', np.int64),
+    ('n_samples', np.int32),
+])
+
+
+class IngestStats:
+    """
+    Server-wide counters and a ring of recent end-to-end latencies (ms).
+    """
+
+    def __init__(self, history=LATENCY_HISTORY):
+        self.started = time.time()
+        self.connections = 0
+        self.active = 0
+        self.packets = 0
+        self.samples = 0
+        self.bad_lines = 0
+        self.queue_full = 0
+        self.transitions = 0
+        self.flushes = 0
+        self.latency_ms = np.zeros(history)
+        self.n_latency = 0
+
+    def add_latencies(self, latency_ms):
+        n = len(latency_ms)
+        if n == 0:
+            return
+        history = len(self.latency_ms)
+        idx = (self.n_latency + np.arange(n)) % history
+        self.latency_ms[idx] = latency_ms
+        self.n_latency += n
+
+    def latency_percentiles(self, q=(50, 99)):
+        recent = self.latency_ms[:min(self.n_latency, len(self.latency_ms))]
+        if len(recent) == 0:
+            return {f'p{p}': float('nan') for p in q}
+        return {f'p{p}': float(v) for p, v in zip(q, np.percentile(recent, q))}
+
+    def to_dict(self):
+        stats = {
+            'uptime_s': time.time() - self.started,
+            'connections': self.connections,
+            'active': self.active,
+            'packets': self.packets,
+            'samples': self.samples,
+            'bad_lines': self.bad_lines,
+            'queue_full': self.queue_full,
+            'transitions': self.transitions,
+            'flushes': self.flushes,
+        }
+        stats.update({f'latency_{k}_ms': v for k, v in self.latency_percentiles().items()})
+        return stats
+
+
+class SensorSession:
+    """
+    Processing state and buffered output of one connection.
+    """
+
+    def __init__(self, session_dir, sensor_serial, fs, thresholds):
+        """
+        Parameters:
+        - session_dir (str): Output folder, or None to process without writing files.
+        - sensor_serial (str): Sensor name from the hello line (or the peer address).
+        - fs (float): Sampling rate (Hz).
+        - thresholds (dict): ON/OFF detector configuration.
+        """
+        self.session_dir = session_dir
+        self.sensor_serial = sensor_serial
+        self.fs = fs
+        self.detector = OnOffDetector(thresholds, fs=fs)
+        self.preprocessor = ChunkedPreprocessor(fs)
+        # No exposure below the lowest Fs of the Wh weighting; the session still runs
+        self.exposure = None
+        self.exposure_skipped = None
+        try:
+            self.exposure = ExposureMeter(fs)
+        except ValueError as e:
+            self.exposure_skipped = str(e)
+            print(f"Sensor {sensor_serial}: exposure skipped, {e}")
+        self.n_samples = 0
+        self.n_packets = 0
+        self.n_windows = 0
+        self.n_transitions = 0
+
+        if session_dir is not None:
+            os.makedirs(session_dir, exist_ok=True)
+            self.segments = SegmentStore(os.path.join(session_dir, 'segments.npy'), WINDOW_SIZE,
+                                         dtype=np.float32, mode='w')
+            self.transitions = AppendableArray(os.path.join(session_dir, 'transitions.npy'), (),
+                                               TRANSITION_DTYPE, 'w')
+            self.packets = AppendableArray(os.path.join(session_dir, 'packets.npy'), (), PACKET_DTYPE, 'w')
+
+        # Results waiting for the next batched write
+        self.pending = {'segments': [], 'transitions': [], 'packets': []}
+        self.pending_windows = 0
+        self.last_flush = time.monotonic()
+
+    def process(self, timestamps, blocks):
+        """
+        Runs one block of packets (lists of Timestamp and of the packets' (x, y, z)
+        sample tuples) through the detector, the preprocessor and the exposure meter and
+        buffers the results.
+
+        Returns:
+        - np.array: Transitions found in the block.
+        """
+        # One array for the whole block instead of one per packet
+        samples = np.array([sample for block in blocks for sample in block], dtype=np.float64)
+        sizes = np.fromiter((len(b) for b in blocks), dtype=np.int64, count=len(blocks))
+
+        packet_rows = np.empty(len(blocks), dtype=PACKET_DTYPE)
+        packet_rows['timestamp'] = timestamps
+        packet_rows['first_sample'] = self.n_samples + np.concatenate([[0], np.cumsum(sizes[:-1])])
+        packet_rows['n_samples'] = sizes
+
+        with instrument.stage('ingest.detector', samples=len(samples)):
+            transitions = self.detector.process(samples)
+        windows = self.preprocessor.process(samples)
+        if self.exposure is not None:
+            self.exposure.process(samples, transitions=transitions)
+
+        self.pending['packets'].append(packet_rows)
+        if len(transitions):
+            self.pending['transitions'].append(transitions)
+        if len(windows):
+            # The windows are views into the preprocessor's buffer: keep a float32 copy
+            self.pending['segments'].append(windows.astype(np.float32))
+            self.pending_windows += len(windows)
+        self.n_samples += len(samples)
+        self.n_packets += len(blocks)
+        self.n_windows += len(windows)
+        self.n_transitions += len(transitions)
+        return transitions
+
+    def should_flush(self):
+        return (self.pending_windows >= FLUSH_WINDOWS
+                or time.monotonic() - self.last_flush >= FLUSH_INTERVAL_S)
+
+    def take_pending(self):
+        pending = self.pending
+        self.pending = {'segments': [], 'transitions': [], 'packets': []}
+        self.pending_windows = 0
+        self.last_flush = time.monotonic()
+        return pending
+
+    def write(self, pending):
+        """
+        Appends one batch of buffered results (blocking; run in a worker thread).
+        """
+        if self.session_dir is None:
+            return
+        with instrument.stage('ingest.write', sensor=self.sensor_serial):
+            if pending['segments']:
+                self.segments.append(np.concatenate(pending['segments']))
+            if pending['transitions']:
+                self.transitions.append(np.concatenate(pending['transitions']))
+            if pending['packets']:
+                self.packets.append(np.concatenate(pending['packets']))
+
+    def close(self):
+        self.write(self.take_pending())
+        if self.session_dir is None:
+            return
+        self.segments.close()
+        self.transitions.close()
+        self.packets.close()
+        with open(os.path.join(self.session_dir, 'session.json'), 'w') as f:
+            json.dump({
+                'sensor_serial': self.sensor_serial,
+                'fs': self.fs,
+                'n_packets': self.n_packets,
+                'n_samples': self.n_samples,
+                'n_windows': self.n_windows,
+                'n_transitions': self.n_transitions,
+                'on_time_s': float(self.detector.on_time_s[0]),
+                'exposure': self.exposure.summary() if self.exposure is not None else None,
+                'exposure_skipped': self.exposure_skipped,
+            }, f, indent=2)
+
+
+def safe_name(name):
+    """
+    Folder-safe form of a client-supplied sensor name: only letters, digits, '.',
+    '_' and '-', no leading dots (so no '..'), at most MAX_NAME_LENGTH characters.
+    """
+    name = UNSAFE_NAME_CHARS.sub('_', str(name))[:MAX_NAME_LENGTH].lstrip('.')
+    return name or 'sensor'
+
+
+def parse_packet(line):
+    """
+    Parses one protocol line.
+
+    Returns:
+    - tuple: ('packet', Timestamp, list of (x, y, z) tuples, sent time or None),
+      ('hello', dict) or None for lines without acceleration data.
+    """
+    message = json.loads(line)
+    acc = message.get('acc')
+    if acc is not None:
+        samples = acc.get('ArrayAcc')
+        if not samples or acc.get('Timestamp') is None:
+            return None
+        # Converted here, so a malformed sample is counted as a bad line instead of
+        # failing inside the consumer
+        values = [(float(s['x']), float(s['y']), float(s['z'])) for s in samples]
+        sent = message.get('sent')
+        return ('packet', int(acc['Timestamp']), values, None if sent is None else float(sent))
+    if 'hello' in message:
+        return ('hello', message['hello'])
+    return None
+
+
+class IngestServer:
+    """
+    Asyncio TCP server for many concurrent sensor streams.
+
+    Example:
+        server = IngestServer(output_dir='sessions')
+        await server.start()
+        ...
+        await server.stop()
+        print(server.stats.to_dict())
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, output_dir=DEFAULT_OUTPUT_DIR,
+                 thresholds=None, queue_packets=QUEUE_PACKETS, persist=True):
+        """
+        Parameters:
+        - host (str), port (int): Listening address (port 0 picks a free port).
+        - output_dir (str): Parent folder of the per-connection session folders.
+        - thresholds (dict or str): ON/OFF detector configuration (default: thresholds.json).
+        - queue_packets (int): Bounded queue length per connection.
+        - persist (bool): Write the session files (off for pure throughput tests).
+        """
+        self.host = host
+        self.port = port
+        self.output_dir = output_dir
+        self.thresholds = load_thresholds() if thresholds is None else (
+            load_thresholds(thresholds) if isinstance(thresholds, str) else thresholds)
+        self.queue_packets = queue_packets
+        self.persist = persist
+        self.stats = IngestStats()
+        self.server = None
+        self.handlers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """
+        Stops accepting connections and closes the open sessions (buffered data is written).
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        for task in list(self.handlers):
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        self.handlers.add(asyncio.current_task())
+        self.stats.connections += 1
+        self.stats.active += 1
+        peer = writer.get_extra_info('peername')
+        queue = asyncio.Queue(maxsize=self.queue_packets)
+        session = None
+        consumer = None
+        try:
+            hello = {}
+            first = await reader.readline()
+            message = self._parse(first)
+            if message is not None and message[0] == 'hello':
+                hello = message[1]
+                message = None
+
+            fs = float(hello.get('fs') or self.thresholds['fs'])
+            sensor = str(hello.get('sensor_serial') or (f"{peer[0]}-{peer[1]}" if peer else 'sensor'))
+            session_dir = None
+            if self.persist:
+                # The client picks the name, not the path: only the sanitized name reaches the folder
+                session_dir = os.path.join(self.output_dir, f"{safe_name(sensor)}_"
+                                                            f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}"
+                                                            f"_{self.stats.connections}")
+            session = SensorSession(session_dir, sensor, fs, self.thresholds)
+            consumer = asyncio.create_task(self._consume(queue, session))
+            # A failed consumer also ends a reader that is waiting for the next line
+            consumer.add_done_callback(lambda task: self._close_on_failure(task, writer))
+
+            if message is not None and message[0] == 'packet':
+                await self._enqueue(queue, message, consumer)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = self._parse(line)
+                if message is not None and message[0] == 'packet':
+                    await self._enqueue(queue, message, consumer)
+
+            # Client closed: let the consumer finish the queued packets
+            await self._put(queue, None, consumer)
+            await consumer
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception as e:
+            # e.g. a line longer than MAX_LINE_BYTES; only this connection is dropped
+            print(f"Connection {peer} closed: {type(e).__name__}: {e}")
+        finally:
+            if consumer is not None and not consumer.done():
+                consumer.cancel()
+                await asyncio.gather(consumer, return_exceptions=True)
+            if session is not None:
+                await asyncio.to_thread(session.close)
+            writer.close()
+            self.stats.active -= 1
+            self.handlers.discard(asyncio.current_task())
+
+    def _parse(self, line):
+        if not line.strip():
+            return None
+        try:
+            return parse_packet(line)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.stats.bad_lines += 1
+            return None
+
+    async def _enqueue(self, queue, message, consumer):
+        item = (message[1], message[2], message[3], time.time())
+        if consumer.done():
+            self._consumer_failed(consumer)
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Backpressure: stop reading this socket until the consumer catches up
+            self.stats.queue_full += 1
+            await self._put(queue, item, consumer)
+
+    async def _put(self, queue, item, consumer):
+        """
+        Waits for room in the queue, or for the consumer to stop; a dead consumer
+        would never make room, so the connection is dropped instead of stalling.
+        """
+        put = asyncio.ensure_future(queue.put(item))
+        try:
+            await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if not put.done() or put.cancelled():
+            self._consumer_failed(consumer)
+
+    @staticmethod
+    def _close_on_failure(consumer, writer):
+        if not consumer.cancelled() and consumer.exception() is not None:
+            writer.close()
+
+    @staticmethod
+    def _consumer_failed(consumer):
+        error = None if consumer.cancelled() else consumer.exception()
+        raise RuntimeError(f"processing stopped ({type(error).__name__}: {error})" if error is not None
+                           else "processing stopped")
+
+    async def _consume(self, queue, session):
+        """
+        Drains the queue in blocks, processes them and writes the results in batches.
+        """
+        stats = self.stats
+        done = False
+        while not done:
+            items = [await queue.get()]
+            if queue.qsize() < MAX_BATCH_PACKETS and items[0] is not None:
+                await asyncio.sleep(max(0.0, items[0][3] + BATCH_DELAY_S - time.time()))
+            while len(items) < MAX_BATCH_PACKETS and not queue.empty() and items[-1] is not None:
+                items.append(queue.get_nowait())
+            if items[-1] is None:
+                items.pop()
+                done = True
+            # Packets still waiting after this block was taken
+            instrument.counter('ingest.queue_depth', queue.qsize(), series=session.sensor_serial)
+            if items:
+                timestamps = [item[0] for item in items]
+                blocks = [item[1] for item in items]
+                transitions = session.process(timestamps, blocks)
+
+                now = time.time()
+                # End-to-end: client send time if given, else server receive time
+                stats.add_latencies(np.array([(now - (item[2] if item[2] is not None else item[3])) * 1000.0
+                                              for item in items]))
+                stats.packets += len(items)
+                stats.samples += sum(len(b) for b in blocks)
+                stats.transitions += len(transitions)
+
+            if session.should_flush() or done:
+                pending = session.take_pending()
+                write = asyncio.ensure_future(asyncio.to_thread(session.write, pending))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # The worker thread cannot be stopped: let it finish before the
+                    # handler closes the same files in session.close
+                    await write
+                    raise
+                stats.flushes += 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-sensor Movesense ingestion server.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Listening address (default: {DEFAULT_HOST}).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT}).")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="Session folder.")
+    parser.add_argument('--thresholds', default=None, help="ON/OFF thresholds JSON (default: thresholds.json).")
+    parser.add_argument('--stats-interval', type=float, default=10.0, help="Seconds between stats lines.")
+    parser.add_argument('--trace', default=None, metavar='DIR',
+                        help="Record per-stage timings and queue depths into DIR/trace_<pid>.json at exit.")
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    server = await IngestServer(args.host, args.port, args.output_dir, args.thresholds).start()
+    print(f"Listening on {server.host}:{server.port}, sessions in {server.output_dir}")
+    serving = asyncio.create_task(server.serve_forever())
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            stats = server.stats.to_dict()
+            print(f"[{stats['uptime_s']:.0f} s] {stats['active']} sensors, {stats['packets']:,} packets, "
+                  f"p99 latency {stats['latency_p99_ms']:.1f} ms, {stats['transitions']} transitions")
+    finally:
+        serving.cancel()
+        await server.stop()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.trace:
+        instrument.enable_env_tracing(args.trace)
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
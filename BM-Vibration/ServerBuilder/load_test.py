@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# ==============================================================================
+# LOAD TEST: load_test.py
+# Purpose: Many simulated 833 Hz Movesense sensors against ingest_server.py on
+#          one machine. Reports sustained packets/s and the p50 / p99 end-to-end
+#          latency (client send -> ON/OFF + preprocessing done on the server).
+#
+# The server runs in this process; the simulated sensors run in separate client
+# processes (asyncio, many connections each). Every sensor sends 8-sample packets
+# in real time, PACKETS_PER_SEND at a time as the phone gateway batches them.
+# Usage:   python ServerBuilder/load_test.py [--sensors N] [--duration S] [--no-persist]
+# ==============================================================================
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '03_classifiers', 'on_off'))
+
+from ingest_server import IngestServer
+from onoff_model import synthetic_tool_stream
+
+# --- 1. Load Test Constants ---
+SENSOR_FS = 833.0
+SAMPLES_PER_PACKET = 8
+PACKETS_PER_SEND = 4
+# Seconds of synthetic signal per sensor, cycled for the whole test
+LOOP_S = 4.0
+# Seconds after the last sensor connected that are excluded from the sustained rate
+WARMUP_S = 2.0
+
+
+def sensor_packets(sensor_id, fs=SENSOR_FS, loop_s=LOOP_S):
+    """
+    Pre-formatted "ArrayAcc" JSON of LOOP_S seconds of synthetic signal; every
+    other sensor has a tool burst in the middle.
+    """
+    bursts = [(loop_s * 0.25, loop_s * 0.75)] if sensor_id % 2 == 0 else []
+    data = synthetic_tool_stream(loop_s, fs, bursts, seed=sensor_id)
+    n_packets = len(data) // SAMPLES_PER_PACKET
+    return [
+        '[' + ','.join('{"x":%.5f,"y":%.5f,"z":%.5f}' % tuple(row)
+                       for row in data[p * SAMPLES_PER_PACKET:(p + 1) * SAMPLES_PER_PACKET]) + ']'
+        for p in range(n_packets)
+    ]
+
+
+async def run_sensor(host, port, sensor_id, duration_s, fs, counters):
+    """
+    One simulated sensor: hello line, then real-time packets until duration_s.
+    """
+    packets = sensor_packets(sensor_id, fs)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"hello": {"sensor_serial": "sim%05d", "fs": %.1f}}\n' % (sensor_id, fs))
+
+    packet_s = SAMPLES_PER_PACKET / fs
+    dt_ms = packet_s * 1000.0
+    start = time.monotonic()
+    # Spread the sensors over one send interval
+    await asyncio.sleep((sensor_id % 97) / 97.0 * PACKETS_PER_SEND * packet_s)
+    sent = 0
+    while True:
+        # Packets that are due by now (catches up after a stall)
+        due = int((time.monotonic() - start) / packet_s)
+        if due - sent > 0:
+            now = time.time()
+            lines = []
+            for k in range(sent, due):
+                lines.append('{"sent":%.6f,"acc":{"Timestamp":%d,"ArrayAcc":%s}}\n'
+                             % (now, int(k * dt_ms), packets[k % len(packets)]))
+            writer.write(''.join(lines).encode())
+            # Blocks while the server applies backpressure
+            await writer.drain()
+            counters['sent'] += due - sent
+            sent = due
+        if time.monotonic() - start >= duration_s:
+            break
+        await asyncio.sleep(PACKETS_PER_SEND * packet_s)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _run_clients(host, port, sensor_ids, duration_s, fs):
+    counters = {'sent': 0}
+    results = await asyncio.gather(*(run_sensor(host, port, i, duration_s, fs, counters) for i in sensor_ids),
+                                   return_exceptions=True)
+    counters['failed'] = sum(isinstance(r, Exception) for r in results)
+    return counters
+
+
+def run_clients(host, port, sensor_ids, duration_s, fs, result_queue):
+    """
+    Client process entry point.
+    """
+    counters = asyncio.run(_run_clients(host, port, sensor_ids, duration_s, fs))
+    result_queue.put(counters)
+
+
+async def run_load_test(n_sensors=200, duration_s=20.0, n_client_procs=2, fs=SENSOR_FS, persist=True,
+                        output_dir=None):
+    """
+    Runs the server and n_sensors simulated sensors for duration_s seconds.
+
+    Returns:
+    - dict: Offered and sustained packets/s, latency percentiles, backpressure
+      events and server CPU time.
+    """
+    server = await IngestServer(port=0, output_dir=output_dir, persist=persist).start()
+    ctx = multiprocessing.get_context('spawn')
+    result_queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=run_clients, args=(server.host, server.port, list(range(p, n_sensors, n_client_procs)),
+                                              duration_s, fs, result_queue))
+        for p in range(n_client_procs)
+    ]
+    cpu_start = time.process_time()
+    for proc in procs:
+        proc.start()
+
+    # Sustained rate: packets processed while all sensors are connected, after a warm-up
+    steady = []
+    while any(proc.is_alive() for proc in procs):
+        await asyncio.sleep(0.2)
+        if server.stats.active == n_sensors:
+            steady.append((time.monotonic(), server.stats.packets))
+            if len(steady) == int(WARMUP_S / 0.2):
+                # Latency percentiles cover the steady state only
+                server.stats.n_latency = 0
+        elif steady and server.stats.active < n_sensors:
+            break
+    steady = steady[int(WARMUP_S / 0.2):]
+    client_counters = [result_queue.get(timeout=duration_s + 60) for _ in procs]
+    sent = sum(c['sent'] for c in client_counters)
+    for proc in procs:
+        proc.join()
+    # Wait for the last sessions to close (queued packets processed, files written)
+    while server.stats.active:
+        await asyncio.sleep(0.05)
+    cpu_s = time.process_time() - cpu_start
+    await server.stop()
+
+    stats = server.stats.to_dict()
+    return {
+        'sensors': n_sensors,
+        'duration_s': duration_s,
+        'offered_packets_per_s': n_sensors * fs / SAMPLES_PER_PACKET,
+        'sustained_packets_per_s': ((steady[-1][1] - steady[0][1]) / (steady[-1][0] - steady[0][0])
+                                    if len(steady) > 1 else float('nan')),
+        'packets_sent': sent,
+        'failed_sensors': sum(c['failed'] for c in client_counters),
+        'packets_processed': stats['packets'],
+        'latency_p50_ms': stats['latency_p50_ms'],
+        'latency_p99_ms': stats['latency_p99_ms'],
+        'queue_full_events': stats['queue_full'],
+        'bad_lines': stats['bad_lines'],
+        'transitions': stats['transitions'],
+        'server_cpu_s': cpu_s,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the ingestion server.")
+    parser.add_argument('--sensors', type=int, nargs='+', default=[100, 200, 400],
+                        help="Simulated sensor counts, one run each (default: 100 200 400).")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per run (default: 20).")
+    parser.add_argument('--client-procs', type=int, default=2, help="Client processes (default: 2).")
+    parser.add_argument('--no-persist', action='store_true', help="Do not write session files.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(f"{'sensors':>8} {'offered/s':>10} {'sustained/s':>12} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'sent':>9} {'processed':>10} {'backpr.':>8} {'srv CPU s':>10}")
+    for n_sensors in args.sensors:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = asyncio.run(run_load_test(n_sensors, args.duration, args.client_procs,
+                                               persist=not args.no_persist, output_dir=tmp))
+        print(f"{result['sensors']:>8} {result['offered_packets_per_s']:>10,.0f} "
+              f"{result['sustained_packets_per_s']:>12,.0f} {result['latency_p50_ms']:>8.1f} "
+              f"{result['latency_p99_ms']:>8.1f} {result['packets_sent']:>9,} {result['packets_processed']:>10,} "
+              f"{result['queue_full_events']:>8} {result['server_cpu_s']:>10.1f}")
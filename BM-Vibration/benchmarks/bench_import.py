@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# ==============================================================================
+# BENCHMARK: bench_import.py
+# Purpose: Import time of the headless core package (vibration/) and the pipeline
+#          worker modules, each measured in a fresh interpreter. A regression
+#          check for worker startup: with --check the script fails (exit code 1)
+#          if a headless import takes more than IMPORT_BUDGET_MS, or loads pandas /
+#          SciPy / matplotlib. NumPy is imported (untimed) before the timed import,
+#          since every worker needs it anyway; this also keeps the noise of
+#          NumPy's own import out of the check.
+# Usage:   python benchmarks/bench_import.py [--repeat N] [--check]
+# ==============================================================================
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+SEARCH_PATHS = [
+    ROOT,
+    os.path.join(ROOT, 'utils'),
+    os.path.join(ROOT, 'signal', '02_preprocessing', 'scripts'),
+]
+
+# Allowed import time of a headless module with NumPy already loaded (ms, best of --repeat)
+IMPORT_BUDGET_MS = 50.0
+# Modules a headless import must not load
+HEAVY_MODULES = ['pandas', 'scipy', 'matplotlib', 'sklearn']
+
+# (label, import statement, checked against the budget); checked imports run after
+# an untimed `import numpy`
+TARGETS = [
+    ('numpy', 'import numpy', False),
+    ('vibration', 'import vibration', True),
+    ('vibration: load_movesense_arrays', 'from vibration import load_movesense_arrays', True),
+    ('vibration.* (all submodules)',
+     'import vibration.ingest, vibration.timebase, vibration.filtering, vibration.segmentation, '
+     'vibration.spectral, vibration.exposure', True),
+    ('preprocess_pipeline (pool worker)', 'import preprocess_pipeline', True),
+    ('recording_cache', 'import recording_cache', True),
+    ('loader_vizualizer_FFT_Welch', 'import loader_vizualizer_FFT_Welch', True),
+    # For reference: what the loader script used to import at module load
+    ('pandas + scipy.signal + matplotlib.pyplot',
+     'import pandas, scipy.signal, matplotlib\nmatplotlib.use("Agg")\nimport matplotlib.pyplot', False),
+]
+
+_CHILD = '''
+import sys, time
+sys.path.extend({paths!r})
+{setup}
+start = time.perf_counter()
+{statement}
+elapsed_ms = (time.perf_counter() - start) * 1000.0
+import json
+print(json.dumps({{'ms': elapsed_ms, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(statement, repeat, setup=''):
+    """
+    Best import time (ms) of `statement` (after the untimed `setup`) over `repeat`
+    fresh interpreters, and the heavy modules it loaded.
+    """
+    code = _CHILD.format(paths=SEARCH_PATHS, setup=setup, statement=statement, heavy=HEAVY_MODULES)
+    best, heavy = float('inf'), []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        best, heavy = min(best, result['ms']), result['heavy']
+    return best, heavy
+
+
+def run_benchmark(repeat=5, budget_ms=IMPORT_BUDGET_MS):
+    """
+    Returns:
+    - list: One dict per target (label, ms, heavy, checked, ok).
+    """
+    results = []
+    for label, statement, checked in TARGETS:
+        ms, heavy = time_import(statement, repeat, 'import numpy' if checked else '')
+        ok = not checked or (ms <= budget_ms and not heavy)
+        results.append({'label': label, 'ms': ms, 'heavy': heavy, 'checked': checked, 'ok': ok})
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import time of the headless core modules.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per target (default: 5).")
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS,
+                        help=f"Allowed import time with NumPy loaded (default: {IMPORT_BUDGET_MS:.0f} ms).")
+    parser.add_argument('--check', action='store_true', help="Exit with code 1 if a budget is exceeded.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run_benchmark(args.repeat, args.budget_ms)
+    print(f"{'import':<44} {'ms':>8} {'budget':>7}  heavy modules")
+    for r in results:
+        flag = '' if r['ok'] else '  OVER BUDGET'
+        budget = f"{args.budget_ms:.0f}" if r['checked'] else '-'
+        print(f"{r['label']:<44} {r['ms']:>8.1f} {budget:>7}  {', '.join(r['heavy']) or '-'}{flag}")
+    failed = [r['label'] for r in results if not r['ok']]
+    if failed:
+        print(f"\n{len(failed)} import(s) over the budget: {', '.join(failed)}")
+    if args.check and failed:
+        sys.exit(1)
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# BENCHMARK: bench_loader.py
+# Purpose: Compare the streaming load_movesense_json against the original
+#          json.load + per-sample list implementation on the recordings in data/.
+# Usage:   python benchmarks/bench_loader.py [--repeat N] [file.json ...]
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from loader_vizualizer_FFT_Welch import load_movesense_json
+
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+
+
+def legacy_load_movesense_json(file_path):
+    """
+    Reference copy of the original loader (json.load + Python lists), without prints.
+    """
+    with open(file_path, 'r') as f:
+        data_json = json.load(f)
+
+    packet_timestamps = []
+    packet_sample_counts = []
+    raw_samples_per_packet = []
+
+    for entry in data_json['data']:
+        if 'acc' in entry:
+            acc_data = entry['acc']
+            timestamp = acc_data.get('Timestamp')
+            array_acc = acc_data.get('ArrayAcc', [])
+            if timestamp is not None and array_acc:
+                packet_timestamps.append(timestamp)
+                packet_sample_counts.append(len(array_acc))
+                raw_samples_per_packet.append(array_acc)
+
+    t_packets = np.array(packet_timestamps)
+    if len(t_packets) > 1:
+        sample_interval_ms = np.mean(np.diff(t_packets)) / np.mean(packet_sample_counts)
+    else:
+        sample_interval_ms = 1000.0 / 833.0
+
+    final_timestamps = []
+    final_acc_x = []
+    final_acc_y = []
+    final_acc_z = []
+    for i, packet_samples in enumerate(raw_samples_per_packet):
+        packet_ts = packet_timestamps[i]
+        num_samples = len(packet_samples)
+        final_timestamps.extend(
+            [packet_ts - (num_samples - 1 - k) * sample_interval_ms for k in range(num_samples)]
+        )
+        for sample in packet_samples:
+            final_acc_x.append(sample.get('x', 0.0))
+            final_acc_y.append(sample.get('y', 0.0))
+            final_acc_z.append(sample.get('z', 0.0))
+
+    return pd.DataFrame({
+        'timestamp': final_timestamps,
+        'accel_x': final_acc_x,
+        'accel_y': final_acc_y,
+        'accel_z': final_acc_z
+    })
+
+
+def measure(loader, file_path, repeat):
+    """
+    Returns (best wall time in s, peak traced memory in bytes, result DataFrame).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = loader(file_path)
+        best = min(best, time.perf_counter() - start)
+        del df
+
+    tracemalloc.start()
+    df = loader(file_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, df
+
+
+def main(argv):
+    repeat = 3
+    if '--repeat' in argv:
+        idx = argv.index('--repeat')
+        repeat = int(argv[idx + 1])
+        argv = argv[:idx] + argv[idx + 2:]
+
+    files = argv or sorted(
+        os.path.join(DATA_DIR, f) for f in os.listdir(DATA_DIR) if f.endswith('.json')
+    )
+
+    def streaming(path):
+        return load_movesense_json(path, verbose=False)
+
+    print(f"{'file':<48} {'samples':>8} {'legacy s':>9} {'stream s':>9} {'speedup':>8} "
+          f"{'legacy MB':>10} {'stream MB':>10} {'max |dx|':>9} {'max |dt| ms':>11}")
+    totals = np.zeros(4)
+    for path in files:
+        t_old, m_old, df_old = measure(legacy_load_movesense_json, path, repeat)
+        t_new, m_new, df_new = measure(streaming, path, repeat)
+
+        # Streaming loader stores acceleration as float32, so compare at that precision
+        max_err = np.max(np.abs(
+            df_old[['accel_x', 'accel_y', 'accel_z']].values
+            - df_new[['accel_x', 'accel_y', 'accel_z']].values
+        ))
+        # Timestamps differ by design: the streaming loader fits the sample clock per
+        # segment instead of anchoring every packet on its own jittery timestamp
+        max_dt = np.max(np.abs(df_old['timestamp'].values - df_new['timestamp'].values))
+
+        totals += (t_old, t_new, m_old, m_new)
+        print(f"{os.path.basename(path)[:48]:<48} {len(df_new):>8} {t_old:>9.4f} {t_new:>9.4f} "
+              f"{t_old / t_new:>7.2f}x {m_old / 1e6:>10.2f} {m_new / 1e6:>10.2f} {max_err:>9.2e} "
+              f"{max_dt:>11.3f}")
+
+    print("-" * 130)
+    print(f"{'TOTAL':<48} {'':>8} {totals[0]:>9.4f} {totals[1]:>9.4f} "
+          f"{totals[0] / totals[1]:>7.2f}x {totals[2] / 1e6:>10.2f} {totals[3] / 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
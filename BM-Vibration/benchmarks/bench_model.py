@@ -0,0 +1,123 @@
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================================================================
+# BENCHMARK: bench_model.py
+# Purpose: Startup latency (fresh process: import + load + first prediction) and
+#          batched windows/s of the compact tool model format against pickle +
+#          scikit-learn predict, for a random forest, a logistic regression and a
+#          binary ridge classifier.
+# Usage:   python benchmarks/bench_model.py [--windows N] [--trees N]
+# ==============================================================================
+
+TOOL_TYPE_DIR = os.path.join(os.path.dirname(__file__), '..', 'signal', '03_classifiers', 'tool_type')
+sys.path.append(TOOL_TYPE_DIR)
+
+from fft_feature_extract import feature_names
+from tool_model import export_sklearn_model, load_model
+
+# Child process scripts: everything a worker does before it can classify a window
+PICKLE_STARTUP = """
+import pickle, sys, numpy as np
+with open(sys.argv[1], 'rb') as f:
+    model = pickle.load(f)
+model.predict(np.zeros((1, model.n_features_in_), dtype=np.float32))
+"""
+COMPACT_STARTUP = """
+import sys, numpy as np
+sys.path.append(sys.argv[2])
+from tool_model import load_model
+model = load_model(sys.argv[1])
+model.predict(np.zeros((1, model.n_features), dtype=np.float32))
+"""
+
+
+def synthetic_features(n_windows, seed=0):
+    """
+    Random feature matrix with feature_names() columns and three separable classes.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_windows, len(feature_names()))).astype(np.float32)
+    noisy = X[:, :3] + 0.5 * rng.normal(size=(n_windows, 3))
+    y = np.array(['drill', 'grinder', 'saw'])[np.argmax(noisy, axis=1)]
+    return X, y
+
+
+def startup_ms(script, args, repeat):
+    """
+    Best wall time of a fresh Python process running script, in ms.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', script] + args, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def windows_per_s(predict, X, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(X)
+        best = min(best, time.perf_counter() - start)
+    return len(X) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact model vs. pickle + sklearn benchmark.")
+    parser.add_argument('--windows', type=int, default=100_000, help="Windows to classify (default: 100k).")
+    parser.add_argument('--trees', type=int, default=100, help="Random forest size (default: 100).")
+    parser.add_argument('--repeat', type=int, default=3, help="Startup repetitions (default: 3).")
+    args = parser.parse_args()
+
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression, RidgeClassifier
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X_train, y_train = synthetic_features(20_000)
+    X, _ = synthetic_features(args.windows, seed=1)
+    models = {
+        f'random forest ({args.trees} trees)': RandomForestClassifier(
+            n_estimators=args.trees, max_depth=16, random_state=0).fit(X_train, y_train),
+        'scaler + logistic regression': make_pipeline(
+            StandardScaler(), LogisticRegression(max_iter=1000)).fit(X_train, y_train),
+        # Binary linear models keep a 1-D coef_
+        'scaler + ridge (2 classes)': make_pipeline(
+            StandardScaler(), RidgeClassifier()).fit(X_train[y_train != 'saw'], y_train[y_train != 'saw']),
+    }
+
+    print(f"{len(X):,} windows x {X.shape[1]} features\n")
+    print(f"{'model':<32} {'format':<8} {'size kB':>9} {'startup ms':>11} {'windows/s':>12} {'same labels':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, sk_model in models.items():
+            pkl_path = os.path.join(tmp, 'model.pkl')
+            compact_path = os.path.join(tmp, 'model.npmodel')
+            with open(pkl_path, 'wb') as f:
+                pickle.dump(sk_model, f)
+            export_sklearn_model(sk_model, compact_path, feature_names=feature_names())
+            compact = load_model(compact_path)
+
+            reference = sk_model.predict(X)
+            rows = [
+                ('pickle', pkl_path, PICKLE_STARTUP, [pkl_path], sk_model.predict, reference),
+                ('compact', compact_path, COMPACT_STARTUP, [compact_path, TOOL_TYPE_DIR],
+                 compact.predict, compact.predict(X)),
+            ]
+            for fmt, path, script, script_args, predict, labels in rows:
+                print(f"{label:<32} {fmt:<8} {os.path.getsize(path) / 1024:>9.1f} "
+                      f"{startup_ms(script, script_args, args.repeat):>11.1f} "
+                      f"{windows_per_s(predict, X):>12,.0f} {str(np.array_equal(labels, reference)):>12}")
+            del compact
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================================================================
+# BENCHMARK: bench_pipeline.py
+# Purpose: Peak RSS and runtime of the chunked preprocessing pipeline
+#          (run_pipeline -> SegmentStore) against a non-chunked reference run
+#          (load whole recording, filter, window, np.save) on synthetic Movesense
+#          recordings of increasing length. Peak memory of the chunked run should
+#          stay flat; its output must match the reference (zero-phase filter: to
+#          within FILTFILT_BLOCK_TOLERANCE, see windows_match).
+#          Every run happens in its own subprocess so peak RSS is not shared.
+# Usage:   python benchmarks/bench_pipeline.py [--minutes M [M ...]] [--fs FS]
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '02_preprocessing', 'scripts'))
+
+from vibration.instrument import peak_rss_mb
+
+MODES = ['reference', 'chunked']
+SAMPLES_PER_PACKET = 8
+
+
+def write_synthetic_recording(path, n_samples, fs, seed=0):
+    """
+    Writes a Movesense-format JSON recording (8 samples per packet): gravity, a slow
+    walking component and a 70 Hz tool vibration plus noise.
+    """
+    rng = np.random.default_rng(seed)
+    n_packets = n_samples // SAMPLES_PER_PACKET
+    dt_ms = 1000.0 * SAMPLES_PER_PACKET / fs
+    with open(path, 'w') as f:
+        f.write('{"data": [\n')
+        for start in range(0, n_packets, 4096):
+            stop = min(start + 4096, n_packets)
+            t = np.arange(start * SAMPLES_PER_PACKET, stop * SAMPLES_PER_PACKET) / fs
+            acc = (np.array([0.0, -2.3, 9.7]) + 0.5 * np.sin(2 * np.pi * 0.5 * t)[:, None]
+                   + 3.0 * np.sin(2 * np.pi * 70 * t)[:, None] + rng.normal(0, 0.2, (len(t), 3)))
+            lines = []
+            for p in range(stop - start):
+                samples = ','.join('{"x":%.6g,"y":%.6g,"z":%.6g}' % tuple(row)
+                                   for row in acc[p * SAMPLES_PER_PACKET:(p + 1) * SAMPLES_PER_PACKET])
+                lines.append('{"acc":{"Timestamp":%d,"ArrayAcc":[%s]}}' % (int((start + p) * dt_ms), samples))
+            f.write(',\n'.join(lines))
+            f.write(',\n' if stop < n_packets else '\n')
+        f.write(']}\n')
+
+
+def run_mode(mode, raw_dir, out_dir):
+    """
+    Preprocesses raw_dir/tool_drill/ with one mode. Prints one result line.
+    """
+    import contextlib
+    import io
+
+    from preprocess_pipeline import find_recordings, reference_windows, run_pipeline
+    from vibration.ingest import load_movesense_arrays, probe_sampling_rate
+
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'chunked':
+        with contextlib.redirect_stdout(io.StringIO()):
+            n_windows = len(run_pipeline('tool_drill', raw_dir, out_dir))
+    else:
+        file_path = find_recordings('tool_drill', raw_dir)[0]
+        acc = load_movesense_arrays(file_path, verbose=False)['acc']
+        windows = reference_windows(acc, probe_sampling_rate(file_path))
+        np.save(os.path.join(out_dir, 'reference.npy'), windows)
+        # Scale of the match tolerance
+        np.save(os.path.join(out_dir, 'reference_max_abs.npy'), np.abs(acc).max())
+        n_windows = len(windows)
+    total_s = time.perf_counter() - start
+
+    print(f"  {mode:<10} {n_windows:>10,} {total_s:>9.2f} {peak_rss_mb() - baseline_mb:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked preprocessing pipeline memory benchmark.")
+    parser.add_argument('--minutes', type=float, nargs='+', default=[2.0, 8.0, 32.0],
+                        help="Recording lengths (default: 2 8 32 min).")
+    parser.add_argument('--fs', type=float, default=833.0, help="Sampling rate (default: 833 Hz).")
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--raw', help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.raw, args.out)
+        return
+
+    from preprocess_pipeline import windows_match
+
+    print(f"{'':<2} {'mode':<10} {'windows':>10} {'total s':>9} {'peak +MB':>10}")
+    for minutes in args.minutes:
+        n_samples = int(minutes * 60 * args.fs)
+        with tempfile.TemporaryDirectory() as tmp:
+            raw_dir = os.path.join(tmp, 'raw')
+            os.makedirs(os.path.join(raw_dir, 'tool_drill'))
+            json_path = os.path.join(raw_dir, 'tool_drill', 'synthetic.json')
+            write_synthetic_recording(json_path, n_samples, args.fs)
+            print(f"{minutes:g} min, {n_samples:,} samples, {os.path.getsize(json_path) / 1e6:.0f} MB JSON")
+
+            for mode in MODES:
+                subprocess.run([sys.executable, __file__, '--mode', mode, '--raw', raw_dir, '--out', tmp],
+                               check=True)
+
+            reference = np.load(os.path.join(tmp, 'reference.npy'), mmap_mode='r')
+            chunked = np.load(os.path.join(tmp, 'tool_drill_cleaned_segments.npy'), mmap_mode='r')
+            max_abs = np.load(os.path.join(tmp, 'reference_max_abs.npy'))
+            print(f"  matches reference: {windows_match(reference, chunked, max_abs)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,484 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# ==============================================================================
+# BENCHMARK: bench_suite.py
+# Purpose: End-to-end benchmark of the signal chain on reproducible synthetic
+#          Movesense recordings (utils/synthetic_recording.py): ingestion,
+#          high-pass filtering, windowing, FFT features, tool-type classification,
+#          ON/OFF detection and the Wh exposure (A(8)) gated by it. Every scenario
+#          runs through two pipelines:
+#            stream  chunked: iter_*_chunks -> ChunkedPreprocessor -> features ->
+#                    model, constant memory (what the orchestrator and server do)
+#            batch   whole recording: load_movesense_arrays / _binary (incl. time
+#                    base) -> filter_triaxial_data -> windows -> features -> model
+#          Each run happens in its own subprocess, so peak RSS is not shared.
+#          Stage times come from vibration.instrument; --memory adds tracemalloc
+#          peaks per stage (slower).
+#
+# Baselines: --save-baseline NAME stores the results in baselines/NAME.json (with
+# the commit, NumPy / SciPy versions and host); --compare NAME prints the change per
+# stage against it, and --check exits with code 1 on a regression, so two commits
+# can be compared on the same machine. Every run is also written to results/.
+# Usage:   python benchmarks/bench_suite.py [--scenarios NAME ...] [--full]
+#                 [--save-baseline NAME] [--compare NAME] [--check]
+# ==============================================================================
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'utils'))
+sys.path.append(os.path.join(ROOT, 'signal', '02_preprocessing', 'scripts'))
+sys.path.append(os.path.join(ROOT, 'signal', '03_classifiers', 'on_off'))
+sys.path.append(os.path.join(ROOT, 'signal', '03_classifiers', 'tool_type'))
+
+from synthetic_recording import CLASS_NAMES, FORMATS, SyntheticRecording, load_truth
+from vibration.instrument import peak_rss_mb
+
+# --- 1. Suite Constants ---
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# Generated recordings and benchmark models (regenerated when the settings change)
+DATA_DIR = os.path.join(BENCH_DIR, '.synthetic')
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# name -> recording format + SyntheticRecording settings
+SCENARIOS = {
+    'json-833hz-10min': {'format': 'json', 'minutes': 10, 'fs': 833.0},
+    'binary-833hz-10min': {'format': 'binary', 'minutes': 10, 'fs': 833.0},
+    'json-104hz-60min-dropouts': {'format': 'json', 'minutes': 60, 'fs': 104.0,
+                                  'dropout': 0.02, 'dropout_burst': 8.0},
+    'json-50hz-60min-noise': {'format': 'json', 'minutes': 60, 'fs': 50.0, 'mix': 'noise'},
+    # Full shift, only with --full (1 GB JSON, ~3 min for both formats)
+    'binary-833hz-8h': {'format': 'binary', 'minutes': 480, 'fs': 833.0, 'dropout': 0.005,
+                        'dropout_burst': 4.0},
+    'json-833hz-8h': {'format': 'json', 'minutes': 480, 'fs': 833.0, 'dropout': 0.005,
+                      'dropout_burst': 4.0},
+}
+DEFAULT_SCENARIOS = ['json-833hz-10min', 'binary-833hz-10min', 'json-104hz-60min-dropouts',
+                     'json-50hz-60min-noise']
+PIPELINES = ('stream', 'batch')
+CHUNK_SAMPLES = 1 << 16
+
+# Stages reported per run: short name -> instrument stage per pipeline
+STAGES = {
+    'ingest': {'stream': 'suite.ingest', 'batch': 'suite.ingest'},
+    'filter': {'stream': 'preprocess.highpass', 'batch': 'suite.filter'},
+    'window': {'stream': 'preprocess.window', 'batch': 'suite.window'},
+    'features': {'stream': 'suite.features', 'batch': 'suite.features'},
+    'classify': {'stream': 'suite.classify', 'batch': 'suite.classify'},
+    'onoff': {'stream': 'suite.onoff', 'batch': 'suite.onoff'},
+    'exposure': {'stream': 'suite.exposure', 'batch': 'suite.exposure'},
+}
+
+# Benchmark classifier: ridge regression on one-hot labels (exported like a
+# RidgeClassifier), trained on a short balanced recording per sampling rate
+TRAIN_MINUTES = 5.0
+TRAIN_SEED = 1234
+RIDGE_ALPHA = 1e-3
+
+# A stage is a regression if it is slower than the baseline by more than both
+REGRESSION_TOLERANCE = 0.20
+REGRESSION_MIN_S = 0.05
+
+
+# --- 2. Recordings and Model ---
+def recording_path(name):
+    return os.path.join(DATA_DIR, name + FORMATS[SCENARIOS[name]['format']])
+
+
+def ensure_recording(name):
+    """
+    Generates the recording of a scenario unless an up-to-date one exists.
+
+    Returns:
+    - (str, dict): Path and truth record (see SyntheticRecording.write).
+    """
+    settings = {key: value for key, value in SCENARIOS[name].items() if key != 'format'}
+    recording = SyntheticRecording(**settings)
+    path = recording_path(name)
+    if os.path.exists(path):
+        try:
+            truth = load_truth(path)[0]
+            if truth['settings'] == recording.settings() and truth['file_bytes'] == os.path.getsize(path):
+                return path, truth
+        except (OSError, ValueError, KeyError):
+            pass
+    os.makedirs(DATA_DIR, exist_ok=True)
+    print(f"Generating {name} ...", flush=True)
+    start = time.perf_counter()
+    truth = recording.write(path)
+    print(f"  {truth['n_samples']:,} samples, {truth['file_bytes'] / 1e6:.0f} MB "
+          f"in {time.perf_counter() - start:.1f} s", flush=True)
+    return path, truth
+
+
+def window_truth(packet_codes, packet_size, n_windows, window_size, slide_step):
+    """
+    True class code of each window: the class at its centre sample.
+    """
+    centres = np.arange(n_windows) * slide_step + window_size // 2
+    return packet_codes[centres // packet_size]
+
+
+def ensure_model(fs):
+    """
+    Trains (once per sampling rate) the benchmark classifier and writes it in the
+    compact model format.
+
+    Returns:
+    - str: Path of the .npmodel file.
+    """
+    from fft_feature_extract import extract_fft_features, feature_names
+    from preprocess_pipeline import ChunkedPreprocessor
+    from tool_model import save_model
+
+    path = os.path.join(DATA_DIR, f"model_{fs:g}hz.npmodel")
+    if os.path.exists(path):
+        return path
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    recording = SyntheticRecording(TRAIN_MINUTES, fs, mix={name: 1.0 for name in CLASS_NAMES},
+                                   mean_segment_s=10.0, seed=TRAIN_SEED)
+    blocks = list(recording.iter_blocks())
+    acc = np.concatenate([block[1] for block in blocks]).reshape(-1, 3)
+    codes = np.concatenate([block[2] for block in blocks])
+    preprocessor = ChunkedPreprocessor(fs)
+    windows = preprocessor.process(acc)
+    features = extract_fft_features(windows, fs).astype(np.float64)
+    labels = window_truth(codes, recording.packet_size, len(windows),
+                          preprocessor.window_size, preprocessor.slide_step)
+
+    classes = np.unique(labels)
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    x = np.column_stack([(features - mean) / scale, np.ones(len(features))])
+    y = (labels[:, None] == classes[None, :]).astype(np.float64)
+    weights = np.linalg.solve(x.T @ x + RIDGE_ALPHA * np.eye(x.shape[1]), x.T @ y)
+
+    header = {
+        'estimator': 'RidgeClassifier',
+        'model_type': 'linear',
+        'classes': classes.tolist(),
+        'n_features': features.shape[1],
+        'feature_names': feature_names(),
+        'probabilistic': False,
+    }
+    arrays = {
+        'scaler_mean': mean,
+        'scaler_scale': scale,
+        'coef': np.ascontiguousarray(weights[:-1].T),
+        'intercept': weights[-1].copy(),
+    }
+    save_model(path, header, arrays)
+    return path
+
+
+# --- 3. One Run (in a subprocess) ---
+def run_stream(path, fs, model, detector, meter, stage):
+    """
+    Chunked pipeline. Returns (predictions, n_transitions, n_samples).
+    """
+    from fft_feature_extract import extract_fft_features
+    from preprocess_pipeline import ChunkedPreprocessor
+    from vibration.ingest import iter_movesense_binary_chunks, iter_movesense_chunks
+
+    iter_chunks = iter_movesense_binary_chunks if path.endswith(FORMATS['binary']) else iter_movesense_chunks
+    chunks = iter_chunks(path, CHUNK_SAMPLES)
+    preprocessor = ChunkedPreprocessor(fs)
+    predictions, n_transitions, n_samples = [], 0, 0
+    while True:
+        with stage('suite.ingest') as read:
+            chunk = next(chunks, None)
+            read.samples = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        n_samples += len(chunk)
+        windows = preprocessor.process(chunk)
+        with stage('suite.features', samples=len(chunk)):
+            features = extract_fft_features(windows, fs)
+        with stage('suite.classify', samples=len(chunk)):
+            predictions.append(model.predict(features))
+        with stage('suite.onoff', samples=len(chunk)):
+            transitions = detector.process(chunk)
+            n_transitions += len(transitions)
+        with stage('suite.exposure', samples=len(chunk)):
+            meter.process(chunk, transitions=transitions)
+    return np.concatenate(predictions), n_transitions, n_samples
+
+
+def run_batch(path, fs, model, detector, meter, stage):
+    """
+    Whole-recording pipeline. Returns (predictions, n_transitions, n_samples).
+    """
+    from fft_feature_extract import extract_fft_features
+    from vibration.filtering import filter_triaxial_data
+    from vibration.ingest import load_movesense_arrays, load_movesense_binary
+    from vibration.segmentation import create_overlapping_windows
+
+    load = load_movesense_binary if path.endswith(FORMATS['binary']) else load_movesense_arrays
+    with stage('suite.ingest') as read:
+        acc = load(path, verbose=False)['acc']
+        read.samples = len(acc)
+    with stage('suite.filter', samples=len(acc)):
+        filtered = filter_triaxial_data(acc, fs=fs, return_array=True)
+    with stage('suite.window', samples=len(acc)):
+        windows = create_overlapping_windows(filtered)
+    with stage('suite.features', samples=len(acc)):
+        features = extract_fft_features(windows, fs)
+    with stage('suite.classify', samples=len(acc)):
+        predictions = model.predict(features)
+    with stage('suite.onoff', samples=len(acc)):
+        transitions = detector.process(acc)
+    with stage('suite.exposure', samples=len(acc)):
+        meter.process(acc, transitions=transitions)
+    return predictions, len(transitions), len(acc)
+
+
+def run_child(path, pipeline, model_path, memory):
+    """
+    Runs one pipeline over one recording and prints its result as a JSON line.
+    """
+    from onoff_model import OnOffDetector
+    from tool_model import load_model
+    from vibration import instrument
+    from vibration.exposure import ExposureMeter
+    from vibration.segmentation import SLIDE_STEP, WINDOW_SIZE
+
+    truth, packet_codes = load_truth(path)
+    fs = truth['settings']['fs']
+    model = load_model(model_path)
+    detector = OnOffDetector(fs=fs)
+    meter = ExposureMeter(fs)
+    # Warm-up outside the measurement: SciPy import, filter design and FFT plans
+    from fft_feature_extract import extract_fft_features
+    from vibration.filtering import design_highpass_sos
+    extract_fft_features(np.zeros((1, WINDOW_SIZE, 3)), fs)
+    design_highpass_sos(0.5, fs, 4)
+
+    rss_start_mb = peak_rss_mb()
+    tracer = instrument.enable(memory)
+    start = time.perf_counter()
+    run = run_stream if pipeline == 'stream' else run_batch
+    predictions, n_transitions, n_samples = run(path, fs, model, detector, meter, instrument.stage)
+    total_s = time.perf_counter() - start
+    instrument.disable()
+
+    summary = tracer.summary()['stages']
+    # Largest allocation of one call per stage (the summary adds them up)
+    peak_alloc = {}
+    for phase, name, _, _, _, args in tracer.events:
+        if phase == 'X' and 'alloc_bytes' in args:
+            peak_alloc[name] = max(peak_alloc.get(name, 0), args['alloc_bytes'])
+
+    stages = {}
+    for short, names in STAGES.items():
+        s = summary.get(names[pipeline])
+        if s is None:
+            continue
+        stages[short] = {
+            'wall_s': s['wall_s'],
+            'cpu_s': s['cpu_s'],
+            'msamples_per_s': n_samples / s['wall_s'] / 1e6 if s['wall_s'] > 0 else None,
+            'peak_alloc_mb': peak_alloc[names[pipeline]] / 2 ** 20 if names[pipeline] in peak_alloc else None,
+            'peak_rss_mb': s['peak_rss_mb'],
+        }
+
+    expected = window_truth(packet_codes, truth['settings']['packet_size'], len(predictions),
+                            WINDOW_SIZE, SLIDE_STEP)
+    recording_s = n_samples / fs
+    print(json.dumps({
+        'samples': n_samples,
+        'recording_s': recording_s,
+        'total_s': total_s,
+        'realtime_factor': recording_s / total_s,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - rss_start_mb,
+        'windows': len(predictions),
+        'accuracy': float(np.mean(predictions == expected)) if len(predictions) else None,
+        'transitions': n_transitions,
+        'a8': meter.summary()['a8'],
+        'stages': stages,
+    }))
+
+
+# --- 4. Suite ---
+def run_scenario(name, pipeline, model_path, memory=False, repeat=1):
+    """
+    Runs one (scenario, pipeline) pair `repeat` times in fresh interpreters.
+
+    Returns:
+    - dict: The fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', recording_path(name),
+                              '--pipeline', pipeline, '--model', model_path] + (['--memory'] if memory else []),
+                             cwd=ROOT, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"{name}/{pipeline} failed:\n{out.stderr}")
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or result['total_s'] < best['total_s']:
+            best = result
+    return best
+
+
+def environment():
+    """
+    Commit and software / host versions stored with every result file.
+    """
+    def git(*args):
+        try:
+            return subprocess.run(['git'] + list(args), cwd=ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    import scipy
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_suite(scenarios, pipelines=PIPELINES, memory=False, repeat=1):
+    """
+    Returns:
+    - dict: {'environment': ..., 'settings': ..., 'results': {scenario: {pipeline: result}}}
+    """
+    results = {}
+    for name in scenarios:
+        path, truth = ensure_recording(name)
+        model_path = ensure_model(truth['settings']['fs'])
+        results[name] = {}
+        for pipeline in pipelines:
+            result = run_scenario(name, pipeline, model_path, memory, repeat)
+            result['file_mb'] = truth['file_bytes'] / 1e6
+            results[name][pipeline] = result
+            print(format_result(name, pipeline, result), flush=True)
+    return {
+        'environment': environment(),
+        'settings': {'scenarios': {name: SCENARIOS[name] for name in scenarios}, 'memory': memory,
+                     'repeat': repeat, 'chunk_samples': CHUNK_SAMPLES},
+        'results': results,
+    }
+
+
+def format_result(name, pipeline, r):
+    stages = '  '.join(f"{short} {s['wall_s']:.2f}" for short, s in r['stages'].items())
+    accuracy = f"{r['accuracy']:.0%}" if r['accuracy'] is not None else '-'
+    return (f"{name:<28} {pipeline:<7} {r['total_s']:>8.2f} s {r['realtime_factor']:>8.0f}x "
+            f"{r['rss_growth_mb']:>8.1f} MB  acc {accuracy:>4}  | {stages}")
+
+
+def compare(current, baseline, tolerance=REGRESSION_TOLERANCE, min_s=REGRESSION_MIN_S):
+    """
+    Prints the change of every total / stage time and the peak RSS growth against a
+    baseline result file.
+
+    Returns:
+    - list: (scenario, pipeline, metric) of every regression.
+    """
+    print(f"\nAgainst baseline {baseline['environment']['commit']} ({baseline['environment']['date']}, "
+          f"NumPy {baseline['environment']['numpy']}):")
+    print(f"{'scenario / pipeline / metric':<48} {'baseline':>10} {'current':>10} {'change':>8}")
+    regressions = []
+    for name, pipelines in current['results'].items():
+        for pipeline, r in pipelines.items():
+            b = baseline['results'].get(name, {}).get(pipeline)
+            if b is None:
+                print(f"{name + ' / ' + pipeline:<48} {'-':>10}   (not in baseline)")
+                continue
+            metrics = [('total s', b['total_s'], r['total_s'], min_s)]
+            metrics += [(f"{short} s", b['stages'][short]['wall_s'], s['wall_s'], min_s)
+                        for short, s in r['stages'].items() if short in b['stages']]
+            # Memory: growth over the RSS after imports, compared with a 16 MB floor
+            metrics.append(('RSS growth MB', b['rss_growth_mb'], r['rss_growth_mb'], 16.0))
+            for metric, old, new, floor in metrics:
+                change = (new - old) / old if old > 0 else 0.0
+                regressed = change > tolerance and new - old > floor
+                if regressed:
+                    regressions.append((name, pipeline, metric))
+                flag = '  REGRESSION' if regressed else ''
+                print(f"{name + ' / ' + pipeline + ' / ' + metric:<48} {old:>10.2f} {new:>10.2f} "
+                      f"{change:>+8.0%}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark suite on synthetic recordings.")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument('--full', action='store_true', help="Add the 8 h full-shift scenarios.")
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per scenario; the fastest is kept.")
+    parser.add_argument('--memory', action='store_true', help="Trace allocations per stage (slower).")
+    parser.add_argument('--save-baseline', metavar='NAME', help="Store the results as baselines/NAME.json.")
+    parser.add_argument('--compare', metavar='NAME', help="Compare with baselines/NAME.json (or a file).")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help=f"Allowed slowdown (default: {REGRESSION_TOLERANCE * 100:.0f}%%).")
+    parser.add_argument('--check', action='store_true', help="Exit with code 1 on a regression.")
+    parser.add_argument('--list', action='store_true', help="List the scenarios and exit.")
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--pipeline', choices=PIPELINES, help=argparse.SUPPRESS)
+    parser.add_argument('--model', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, name + '.json')
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.run:
+        run_child(args.run, args.pipeline, args.model, args.memory)
+        sys.exit(0)
+    if args.list:
+        for name, settings in SCENARIOS.items():
+            print(f"{name:<28} {settings}")
+        sys.exit(0)
+
+    scenarios = args.scenarios or DEFAULT_SCENARIOS + (
+        [name for name in SCENARIOS if name not in DEFAULT_SCENARIOS] if args.full else [])
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare), 'r') as f:
+            baseline = json.load(f)
+
+    print(f"{'scenario':<28} {'mode':<7} {'total':>10} {'realtime':>9} {'RSS +':>11}  accuracy | stage wall s")
+    suite = run_suite(scenarios, args.pipelines, args.memory, args.repeat)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    results_path = os.path.join(RESULTS_DIR, f"{stamp}_{suite['environment']['commit'] or 'nocommit'}.json")
+    with open(results_path, 'w') as f:
+        json.dump(suite, f, indent=1)
+    print(f"\nResults: {os.path.relpath(results_path, ROOT)}")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save_baseline), 'w') as f:
+            json.dump(suite, f, indent=1)
+        print(f"Baseline: {os.path.relpath(baseline_path(args.save_baseline), ROOT)}")
+
+    if baseline is not None:
+        regressions = compare(suite, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}.")
+        if args.check and regressions:
+            sys.exit(1)
@@ -0,0 +1,98 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================================================================
+# BENCHMARK: bench_windowing.py
+# Purpose: Window throughput and peak RSS of create_overlapping_windows (strided
+#          view, contiguous copy, memory-mapped input) against the original
+#          list-of-slices + np.array implementation on hour-long recordings.
+#          Every mode runs in its own subprocess so peak RSS is not shared.
+# Usage:   python benchmarks/bench_windowing.py [--hours H] [--fs FS]
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '02_preprocessing', 'scripts'))
+
+from segmentation import SLIDE_STEP, WINDOW_SIZE, create_overlapping_windows, load_windows_from_npy
+
+MODES = ['legacy', 'view', 'copy', 'mmap']
+
+
+def legacy_create_overlapping_windows(data_array, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
+    """
+    Reference copy of the original implementation (Python loop + np.array).
+    """
+    windows = []
+    for start in range(0, len(data_array) - window_size + 1, slide_step):
+        windows.append(data_array[start:start + window_size, :])
+    return np.array(windows)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_mode(mode, npy_path):
+    """
+    Windows the recording in npy_path with one mode and reduces every window to its
+    RMS (so the windows are actually read). Prints one result line.
+    """
+    if mode == 'mmap':
+        baseline_mb = peak_rss_mb()
+        start = time.perf_counter()
+        windows = load_windows_from_npy(npy_path)
+    else:
+        data = np.load(npy_path)
+        baseline_mb = peak_rss_mb()
+        start = time.perf_counter()
+        if mode == 'legacy':
+            windows = legacy_create_overlapping_windows(data)
+        else:
+            windows = create_overlapping_windows(data, copy=(mode == 'copy'))
+    build_s = time.perf_counter() - start
+
+    # Consume the windows in batches, as a feature extractor would
+    rms = np.empty((len(windows), 3))
+    for i in range(0, len(windows), 8192):
+        batch = np.asarray(windows[i:i + 8192], dtype=np.float64)
+        rms[i:i + 8192] = np.sqrt(np.mean(batch ** 2, axis=1))
+    total_s = time.perf_counter() - start
+
+    print(f"{mode:<8} {len(windows):>10,} {build_s * 1000:>10.2f} {len(windows) / build_s / 1e6:>12.2f} "
+          f"{total_s:>9.3f} {peak_rss_mb() - baseline_mb:>12.1f} {float(rms.sum()):>14.6e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Windowing throughput / memory benchmark.")
+    parser.add_argument('--hours', type=float, default=1.0, help="Recording length (default: 1 h).")
+    parser.add_argument('--fs', type=float, default=833.0, help="Sampling rate (default: 833 Hz).")
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--npy', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.npy)
+        return
+
+    n_samples = int(args.hours * 3600 * args.fs)
+    with tempfile.TemporaryDirectory() as tmp:
+        npy_path = os.path.join(tmp, 'filtered.npy')
+        rng = np.random.default_rng(0)
+        np.save(npy_path, rng.normal(0, 1, (n_samples, 3)))
+
+        print(f"{n_samples:,} samples x 3 axes, window {WINDOW_SIZE}, step {SLIDE_STEP}")
+        print(f"{'mode':<8} {'windows':>10} {'build ms':>10} {'Mwindows/s':>12} "
+              f"{'total s':>9} {'peak +MB':>12} {'checksum':>14}")
+        for mode in MODES:
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--npy', npy_path], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,88 +1,22 @@
+import os
+import sys
 
 import numpy as np
-from scipy import signal
-import pandas as pd # You'll likely use pandas to load and handle your raw data
 
-# --- Project Constants (Adjust these values based on testing) ---
-# The Movesense sensor samples at 52Hz (approx), but let's assume a common rate for now.
-# NOTE: Replace '50.0' with the actual sampling rate (fs) of your Movesense sensor
-FS = 50.0  # Sampling Frequency (Hz). CHECK YOUR SENSOR'S RATE! #TODO check what Fs was in each recording (833 Hz?) and try to align in order not to get aliasing effect in processing
+# ==============================================================================
+# HIGH-PASS FILTER: highpass_filter.py
+# The filters live in the headless core package (BM-Vibration/vibration/filtering.py),
+# so pool workers import them without pandas or plotting. This script keeps the
+# old import path for the pipeline scripts and notebooks, and the filter demo.
+# ==============================================================================
 
-# Cutoff frequency (fc) determines what gets filtered out.
-# Gravity and walking are typically below 1 Hz. A cutoff of 0.5-1.5 Hz is common
-# to remove these low-frequency components.
-# Lower frequency = more noise passes. Higher frequency = tool vibration might be lost.
-CUTOFF_FREQ = 0.5  # Hz. Needs empirical testing on your 'noise_walking' data! #TODO first PSD or FFT walking dataset to understand the freq content
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-# The order (N) of the filter. Higher order = sharper cutoff, but more computation/instability.
-# Order 4-10 is a good starting point for IIR filters.
-ORDER = 4
-
-
-def butter_highpass_filter(data, cutoff, fs, order):
-    """
-    Designs and applies a Butterworth High-Pass Filter to a signal.
-    
-    This function uses signal.filtfilt for zero phase shift, which is critical
-    for preserving the timing accuracy needed for your 'On/Off Classifier'.
-    
-    Parameters:
-    - data (np.array): The input signal array (e.g., one axis of acceleration data).
-    - cutoff (float): The cutoff frequency of the filter (Hz).
-    - fs (float): The sampling frequency of the data (Hz).
-    - order (int): The order of the filter.
-
-    Returns:
-    - np.array: The filtered signal array.
-    """
-    
-    # Calculate the Nyquist frequency (half the sampling frequency)
-    nyquist = 0.5 * fs
-    # Normalize the cutoff frequency to the Nyquist frequency (0 to 1 range)
-    normalized_cutoff = cutoff / nyquist # TODO undertand what is the cut-off frequency (the specific number), 
-    # adaptive cut-off might be good, but only after working with dataset (Power Spectrum Density, FFT, Welch FFT) and understanding the limits of freq for each tool or walking
-    
-    # 1. Design the filter (Get the coefficients B and A)
-    # output='ba' returns numerator (b) and denominator (a) polynomials
-    # NOTE: You could also use output='sos' (second-order sections) with signal.sosfiltfilt
-    # to avoid numerical instability, which is generally safer for high orders.
-    b, a = signal.butter(order, normalized_cutoff, btype='highpass', analog=False)
-    
-    # 2. Apply the filter forward and backward to eliminate phase shift
-    # This is crucial for keeping your vibration events accurately timed.
-    filtered_data = signal.filtfilt(b, a, data, axis=0)
-    
-    return filtered_data
-
-
-def filter_triaxial_data(df_raw, cutoff=CUTOFF_FREQ, fs=FS, order=ORDER):
-    """
-    Applies the high-pass filter to all three acceleration axes (X, Y, Z).
-    
-    Parameters:
-    - df_raw (pd.DataFrame or np.array): Raw triaxial acceleration data (columns: X, Y, Z).
-    """
-    
-    # Ensure data is a NumPy array for Scipy compatibility
-    if isinstance(df_raw, pd.DataFrame):
-        data = df_raw[['accel_x', 'accel_y', 'accel_z']].values
-    else:
-        # Assuming the input is a NumPy array with columns X, Y, Z
-        data = df_raw
-    
-    # Apply the filter to each axis independently
-    data_x_filtered = butter_highpass_filter(data[:, 0], cutoff, fs, order)
-    data_y_filtered = butter_highpass_filter(data[:, 1], cutoff, fs, order)
-    data_z_filtered = butter_highpass_filter(data[:, 2], cutoff, fs, order)
-    
-    # Combine the filtered axes into a single array/DataFrame
-    df_filtered = pd.DataFrame({
-        'accel_x_filtered': data_x_filtered,
-        'accel_y_filtered': data_y_filtered,
-        'accel_z_filtered': data_z_filtered
-    })
-    
-    return df_filtered
+from vibration.filtering import (  # noqa: F401 (re-exported)
+    CUTOFF_FREQ, FILTFILT_BLOCK_SIZE, FILTFILT_BLOCK_TOLERANCE, FS, ORDER, StreamingFiltfilt,
+    StreamingHighpassFilter,
+    blockwise_filtfilt, butter_highpass_filter, design_highpass_sos, filter_triaxial_data, settling_samples,
+)
 
 
 if __name__ == '__main__': #TODO find or define the main orchestrating file
@@ -91,6 +25,8 @@ if __name__ == '__main__': #TODO find or define the main orchestrating file
     # Dummy data: Tool vibration (high freq) + Walking (low freq) + Gravity (DC offset)
     # Movesense sensor data will be much cleaner, but this simulates the challenge.
     
+    import pandas as pd
+
     time = np.linspace(0, 10, int(FS * 10), endpoint=False)
     # 1. Gravity/Walking (low frequency, slow variation) - The NOISE
     low_freq_noise = 9.81 + 0.5 * np.sin(2 * np.pi * 0.2 * time) 
@@ -120,7 +56,5 @@ if __name__ == '__main__': #TODO find or define the main orchestrating file
     print(f"Mean of FILTERED signal (should be near 0.0): {np.mean(df_filtered_example['accel_z_filtered']):.2f}")
 
 
-The mean of the FILTERED signal being close to zero is the key success metric, showing that the constant gravity component has been removed. You can find resources on high-pass filter implementation with Python using the link below. [Simple Lowpass and Highpass Filters with Python Implementation](https://www.youtube.com/watch?v=Aht4letBAmA)
-
-
-http://googleusercontent.com/youtube_content/0
+# Resources on high-pass filter implementation with Python:
+# [Simple Lowpass and Highpass Filters with Python Implementation](https://www.youtube.com/watch?v=Aht4letBAmA)
@@ -0,0 +1,347 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Pool workers never display plots; keep matplotlib off any GUI backend
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# ==============================================================================
+# PREPROCESSING ORCHESTRATOR: orchestrate_pipeline.py
+# Purpose: Runs the chunked preprocessing pipeline over every (class, recording)
+#          pair in 01_data_collection/raw/<class>/ on a process pool and merges
+#          the results into one labelled training tensor plus index.
+#
+# Task graph: one segment task per recording (filter + window into its own
+#             segment store, cached by recording content and parameters), and
+#             one aggregate task that depends on all of them. Unchanged inputs
+#             are never processed twice; the aggregate is rebuilt only when the
+#             set of task outputs changed.
+# Usage:      python signal/02_preprocessing/scripts/orchestrate_pipeline.py
+#             [--classes C [C ...]] [--workers N] [--force]
+# ==============================================================================
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'utils'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from vibration.filtering import CUTOFF_FREQ, ORDER
+from vibration.segmentation import SLIDE_STEP, WINDOW_SIZE
+from vibration import instrument
+from segment_store import SegmentStore
+from preprocess_pipeline import CHUNK_SAMPLES, CLEAN_DATA_OUTPUT_PATH, RAW_DATA_PATH, find_recordings, stream_recording
+from recording_cache import CACHE_DIR, cache_key, parse_recording_name
+
+# --- 1. Orchestrator Constants ---
+# Per-task segment stores: <TASK_CACHE_DIR>/<class>/<recording>-<task key>.npy
+TASK_CACHE_DIR = os.path.join(CLEAN_DATA_OUTPUT_PATH, 'tasks')
+TRAINING_SEGMENTS_FILE = 'training_segments.npy'
+TRAINING_LABELS_FILE = 'training_labels.npy'
+TRAINING_INDEX_FILE = 'training_index.json'
+# Bump when the segment output changes for the same parameters
+PIPELINE_VERSION = 1
+# Windows copied per block while aggregating (bounds memory)
+AGGREGATE_BLOCK_WINDOWS = 1 << 14
+
+
+def pipeline_params(cutoff=CUTOFF_FREQ, order=ORDER, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP,
+                    zero_phase=True):
+    """
+    Parameters that determine the segment output of a recording (part of every task key).
+    zero_phase=True filters like filter_triaxial_data (sosfiltfilt); False is causal.
+    """
+    return {'cutoff': cutoff, 'order': order, 'window_size': window_size,
+            'slide_step': slide_step, 'zero_phase': zero_phase, 'version': PIPELINE_VERSION}
+
+
+def discover_classes(raw_dir=RAW_DATA_PATH):
+    """
+    Class names = sub-folders of raw_dir, sorted (the class id is the position).
+    """
+    return sorted(name for name in os.listdir(raw_dir) if os.path.isdir(os.path.join(raw_dir, name)))
+
+
+def build_task_graph(raw_dir=RAW_DATA_PATH, classes=None, params=None, task_dir=TASK_CACHE_DIR,
+                     cache_dir=CACHE_DIR):
+    """
+    Builds one segment task per (class, recording) pair.
+
+    Parameters:
+    - raw_dir (str): Folder holding the class folders.
+    - classes (list): Class names to include (default: all class folders).
+    - params (dict): pipeline_params() of the run.
+    - task_dir (str): Folder of the per-task segment stores.
+    - cache_dir (str): Recording cache, used for the content keys of the sources.
+
+    Returns:
+    - list: Task dicts (class_name, class_id, file, key, output), in aggregation order.
+    """
+    params = params or pipeline_params()
+    class_names = classes or discover_classes(raw_dir)
+    params_json = json.dumps(params, sort_keys=True)
+
+    tasks = []
+    for class_id, class_name in enumerate(class_names):
+        for file_path in find_recordings(class_name, raw_dir):
+            # Content hash of the source (re-hashed only when mtime/size change) + parameters
+            key = hashlib.sha1(f'{cache_key(file_path, cache_dir)}|{params_json}'.encode('utf-8')).hexdigest()[:16]
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            tasks.append({
+                'class_name': class_name,
+                'class_id': class_id,
+                'file': file_path,
+                'key': key,
+                'output': os.path.join(task_dir, class_name, f'{stem}-{key}.npy'),
+            })
+    return tasks
+
+
+def is_task_done(task):
+    """
+    A task output counts only once its index was written (the index is renamed last).
+    """
+    return os.path.isfile(task['output']) and os.path.isfile(task['output'] + '.index.json')
+
+
+def _read_task_index(task):
+    with open(task['output'] + '.index.json', 'r') as f:
+        return json.load(f)
+
+
+def run_segment_task(task, params, chunk_samples=CHUNK_SAMPLES):
+    """
+    Worker: streams one recording through filter and segmentation into its task store.
+
+    The store is written under a temporary name and renamed when complete, so a crashed
+    or concurrent worker never leaves a half-written output that looks finished.
+
+    Returns:
+    - dict: Task record (n_windows, fs, timing) or an error record.
+    """
+    record = {'file': os.path.basename(task['file']), 'class_name': task['class_name'], 'key': task['key']}
+    output = task['output']
+    tmp_output = f"{output}.{os.getpid()}.partial.npy"
+    try:
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with instrument.stage('orchestrate.task', file=record['file']), \
+                SegmentStore(tmp_output, params['window_size'], mode='w') as store:
+            n_windows, fs = stream_recording(
+                task['file'], store, chunk_samples=chunk_samples, cutoff=params['cutoff'],
+                order=params['order'], window_size=params['window_size'], slide_step=params['slide_step'],
+                zero_phase=params['zero_phase'])
+        with open(tmp_output + '.index.json', 'r') as f:
+            index = json.load(f)
+        index['fs'] = fs
+        with open(tmp_output + '.index.json', 'w') as f:
+            json.dump(index, f, indent=2)
+
+        # Data first, index last: is_task_done() keys on the index
+        os.replace(tmp_output, output)
+        os.replace(tmp_output + '.index.json', output + '.index.json')
+
+        # Outputs of older versions of this recording are now stale
+        own_name = os.path.basename(output)
+        stem = own_name.rsplit('-', 1)[0]
+        for name in os.listdir(os.path.dirname(output)):
+            base = name.split('.npy')[0] + '.npy'
+            if base != own_name and base.rsplit('-', 1)[0] == stem and '.partial.' not in name:
+                os.remove(os.path.join(os.path.dirname(output), name))
+
+        record.update(status='ok', n_windows=n_windows, fs=fs, time_s=time.perf_counter() - t0)
+    except Exception as e:
+        # Report the failure instead of aborting the whole run
+        for path in (tmp_output, tmp_output + '.index.json'):
+            if os.path.exists(path):
+                os.remove(path)
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    return record
+
+
+@instrument.traced('orchestrate.aggregate')
+def aggregate_tasks(tasks, class_names, output_dir=CLEAN_DATA_OUTPUT_PATH, params=None):
+    """
+    Merges the task stores into one training tensor, label vector and index.
+
+    Outputs (in output_dir):
+    - training_segments.npy: (N_windows, WINDOW_SIZE, 3) float64 windows.
+    - training_labels.npy: (N_windows,) int16 class id per window.
+    - training_index.json: classes, parameters and one entry per recording
+      (class, file, sensor serial, first_window, n_windows, fs, task key).
+
+    Windows are copied in blocks through memory maps, so memory does not grow with
+    the data set. Returns the index dict.
+    """
+    params = params or pipeline_params()
+    segments_path = os.path.join(output_dir, TRAINING_SEGMENTS_FILE)
+    labels_path = os.path.join(output_dir, TRAINING_LABELS_FILE)
+    index_path = os.path.join(output_dir, TRAINING_INDEX_FILE)
+
+    recordings = []
+    with SegmentStore(segments_path, params['window_size'], mode='w') as store:
+        for task in tasks:
+            windows = np.load(task['output'], mmap_mode='r')
+            first_window = store.n_windows
+            for start in range(0, len(windows), AGGREGATE_BLOCK_WINDOWS):
+                store.append(windows[start:start + AGGREGATE_BLOCK_WINDOWS],
+                             source=f"{task['class_name']}/{os.path.basename(task['file'])}")
+            entry = {
+                'class_name': task['class_name'],
+                'class_id': task['class_id'],
+                'file': os.path.basename(task['file']),
+                'first_window': first_window,
+                'n_windows': len(windows),
+                'fs': _read_task_index(task).get('fs'),
+                'key': task['key'],
+            }
+            entry.update(parse_recording_name(task['file']))
+            recordings.append(entry)
+            del windows
+        n_windows = store.n_windows
+
+    labels = np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.int16, shape=(n_windows,))
+    for entry in recordings:
+        labels[entry['first_window']:entry['first_window'] + entry['n_windows']] = entry['class_id']
+    labels.flush()
+    del labels
+
+    index = {
+        'classes': list(class_names),
+        'params': params,
+        'n_windows': n_windows,
+        'segments_file': TRAINING_SEGMENTS_FILE,
+        'labels_file': TRAINING_LABELS_FILE,
+        'recordings': recordings,
+    }
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def load_training_set(output_dir=CLEAN_DATA_OUTPUT_PATH):
+    """
+    Opens the aggregated training set.
+
+    Returns:
+    - (np.array, np.array, dict): Memory-mapped windows (N, WINDOW_SIZE, 3), labels (N,)
+      and the index.
+    """
+    with open(os.path.join(output_dir, TRAINING_INDEX_FILE), 'r') as f:
+        index = json.load(f)
+    windows = np.load(os.path.join(output_dir, index['segments_file']), mmap_mode='r')
+    labels = np.load(os.path.join(output_dir, index['labels_file']), mmap_mode='r')
+    return windows, labels, index
+
+
+def _aggregate_is_current(tasks, class_names, output_dir, params):
+    try:
+        with open(os.path.join(output_dir, TRAINING_INDEX_FILE), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (index.get('classes') == list(class_names) and index.get('params') == params
+            and [r['key'] for r in index.get('recordings', [])] == [t['key'] for t in tasks]
+            and os.path.isfile(os.path.join(output_dir, TRAINING_SEGMENTS_FILE))
+            and os.path.isfile(os.path.join(output_dir, TRAINING_LABELS_FILE)))
+
+
+def run_orchestrator(raw_dir=RAW_DATA_PATH, output_dir=CLEAN_DATA_OUTPUT_PATH, classes=None, workers=None,
+                     force=False, chunk_samples=CHUNK_SAMPLES, task_dir=None, cache_dir=CACHE_DIR, **param_kwargs):
+    """
+    Runs the segment tasks of every (class, recording) pair on a process pool, then the
+    aggregate task.
+
+    Parameters:
+    - raw_dir (str): Folder holding the class folders.
+    - output_dir (str): Folder of the training tensor, labels and index.
+    - classes (list): Class names (default: all class folders in raw_dir).
+    - workers (int): Worker processes (default: all cores).
+    - force (bool): Re-run every task even if its cached output exists.
+    - chunk_samples (int): Samples per chunk in the workers.
+    - task_dir (str): Per-task cache folder (default: <output_dir>/tasks).
+    - cache_dir (str): Recording cache, used for the source content keys.
+    - param_kwargs: cutoff, order, window_size, slide_step, zero_phase (see pipeline_params).
+
+    Returns:
+    - dict: Run summary (task counts, failures, timing, the training index).
+    """
+    params = pipeline_params(**param_kwargs)
+    class_names = classes or discover_classes(raw_dir)
+    task_dir = task_dir or os.path.join(output_dir, 'tasks')
+    tasks = build_task_graph(raw_dir, class_names, params, task_dir, cache_dir)
+    todo = [task for task in tasks if force or not is_task_done(task)]
+
+    print(f"{len(class_names)} classes, {len(tasks)} recordings: {len(todo)} to process, "
+          f"{len(tasks) - len(todo)} cached.")
+    for class_name in class_names:
+        if not any(task['class_name'] == class_name for task in tasks):
+            print(f"  (no recordings for {class_name})")
+
+    start = time.perf_counter()
+    records = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_segment_task, task, params, chunk_samples) for task in todo]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                detail = (f"{record['n_windows']} windows, Fs={record['fs']:.1f} Hz, {record['time_s']:.2f} s"
+                          if record['status'] == 'ok' else record['error'])
+                print(f"  [{record['status']}] {record['class_name']}/{record['file']} ({detail})")
+    segment_s = time.perf_counter() - start
+
+    # The aggregate depends on every segment task; failed ones are left out
+    done = [task for task in tasks if is_task_done(task)]
+    os.makedirs(output_dir, exist_ok=True)
+    if todo or force or not _aggregate_is_current(done, class_names, output_dir, params):
+        index = aggregate_tasks(done, class_names, output_dir, params)
+        print(f"Aggregated {index['n_windows']} windows from {len(done)} recordings into "
+              f"{os.path.join(output_dir, TRAINING_SEGMENTS_FILE)}")
+    else:
+        with open(os.path.join(output_dir, TRAINING_INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        print(f"Training set is up to date ({index['n_windows']} windows).")
+
+    return {
+        'n_tasks': len(tasks),
+        'n_processed': sum(r['status'] == 'ok' for r in records),
+        'n_cached': len(tasks) - len(todo),
+        'n_errors': sum(r['status'] != 'ok' for r in records),
+        'errors': [r for r in records if r['status'] != 'ok'],
+        'segment_time_s': segment_s,
+        'wall_time_s': time.perf_counter() - start,
+        'index': index,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocess every raw recording into one training set.")
+    parser.add_argument('--raw-dir', default=RAW_DATA_PATH, help="Folder with one sub-folder per class.")
+    parser.add_argument('--out-dir', default=CLEAN_DATA_OUTPUT_PATH, help="Output folder.")
+    parser.add_argument('--classes', nargs='+', default=None, help="Classes to include (default: all).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument('--force', action='store_true', help="Re-process every recording.")
+    parser.add_argument('--trace', default=None, metavar='DIR',
+                        help="Record per-stage timings of all processes into DIR/trace.json (Chrome trace).")
+    parser.add_argument('--trace-memory', action='store_true', help="With --trace: also trace allocations.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.trace:
+        instrument.enable_env_tracing(args.trace, memory=args.trace_memory)
+    summary = run_orchestrator(raw_dir=args.raw_dir, output_dir=args.out_dir, classes=args.classes,
+                               workers=args.workers, force=args.force)
+    print(f"Done in {summary['wall_time_s']:.2f} s: {summary['n_processed']} processed, "
+          f"{summary['n_cached']} cached, {summary['n_errors']} errors.")
+    if args.trace:
+        merged = instrument.collect_traces(args.trace)
+        print(f"\nTrace: {os.path.join(args.trace, 'trace.json')} (open in https://ui.perfetto.dev)")
+        print(instrument.format_summary(merged['summary']))
+    sys.exit(1 if summary['n_errors'] else 0)
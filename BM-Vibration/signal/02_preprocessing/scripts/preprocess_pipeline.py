@@ -1,35 +1,49 @@
-import pandas as pd
 import numpy as np
+import glob
 import os
 import sys
 
 # --- Dynamic Import Setup ---
 # Add the parent directory to the path so we can import modules from 'scripts'
+# (02_preprocessing is not an importable package name, see vibration/__init__.py)
 sys.path.append(os.path.dirname(__file__))
+# ...and BM-Vibration itself, for the headless core package (vibration/)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-# Import the core signal processing functions
-from highpass_filter import filter_triaxial_data, FS  # FS is the Sampling Frequency constant
-from segmentation import create_overlapping_windows, WINDOW_SIZE, SLIDE_STEP 
+# Import the core signal processing functions (no pandas / plotting imports)
+from vibration.filtering import (  # FS is the Sampling Frequency constant
+    CUTOFF_FREQ, FILTFILT_BLOCK_TOLERANCE, FS, ORDER, StreamingFiltfilt, StreamingHighpassFilter,
+    butter_highpass_filter,
+)
+from vibration.segmentation import create_overlapping_windows, WINDOW_SIZE, SLIDE_STEP
+from vibration.ingest import iter_movesense_chunks, load_movesense_arrays, probe_sampling_rate
+from vibration.instrument import stage, traced
+from segment_store import SegmentStore
 
 # --- Project Path Constants ---
-# Assuming your raw data is here (replace with actual loading logic)
-RAW_DATA_PATH = '../01_data_collection/raw/' 
+# Raw Movesense recordings, one folder per class (tool_drill/, noise_walking/, ...)
+RAW_DATA_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', '01_data_collection', 'raw'))
 # Assuming your output cleaned data will go here (ready for 03_classifiers)
-CLEAN_DATA_OUTPUT_PATH = '../02_preprocessing/data_output/'
+CLEAN_DATA_OUTPUT_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data_output'))
+
+# --- Streaming Constants ---
+# Samples pulled from a recording per step; peak memory depends on this, not on the recording
+CHUNK_SAMPLES = 1 << 16
 
 
 def load_raw_data(tool_type='tool_drill'):
     """
     Loads raw triaxial acceleration data for a specified tool or noise type.
-    
-    NOTE: In a real project, this function handles reading the multiple raw files (x, y, z) 
-    and merging them into a single DataFrame.
+
+    NOTE: Simulated stream, used by run_pipeline when RAW_DATA_PATH/<tool_type>/
+    holds no Movesense recordings yet.
     """
     print(f"Loading raw data for: {tool_type}...")
-    
+    import pandas as pd
+
     # --- SIMULATION: Replace this block with your actual file loading logic ---
     # For a real project, you would read 'total_acc_x.txt', 'total_acc_y.txt', etc.
-    
+
     # Simulate loading 5000 samples of noisy, raw data for testing
     N = 5000
     time = np.linspace(0, N/FS, N, endpoint=False)
@@ -44,60 +58,224 @@ def load_raw_data(tool_type='tool_drill'):
         'accel_z': raw_z
     })
     # --- END SIMULATION BLOCK ---
-    
+
     print(f"Successfully loaded {len(df_raw)} raw samples.")
     return df_raw
 
 
-def run_pipeline(tool_type='tool_drill'):
+def find_recordings(tool_type, raw_dir=RAW_DATA_PATH):
+    """
+    Movesense recordings (*.json) of one class folder, sorted by name.
+    """
+    return sorted(glob.glob(os.path.join(raw_dir, tool_type, '*.json')))
+
+
+class ChunkedPreprocessor:
+    """
+    High-pass filter + windowing of one stream, fed chunk by chunk.
+
+    Two filter modes:
+    - zero_phase=False (default, live data: ingest server, benchmarks): causal filter.
+      Windows come out as soon as their samples arrive and are bit-identical to one
+      causal pass over the whole stream (reference_windows(..., zero_phase=False)).
+    - zero_phase=True (training data, run_pipeline / the orchestrator): sosfiltfilt as
+      in filter_triaxial_data, streamed with StreamingFiltfilt. Windows lag behind by
+      the filter's settling time, and finish() must be called at the end of the
+      stream. They match the whole-recording zero-phase filter to within
+      FILTFILT_BLOCK_TOLERANCE.
+
+    The filter state and the samples of the next, not yet complete window are carried
+    between chunks.
+    """
+
+    def __init__(self, fs, cutoff=CUTOFF_FREQ, order=ORDER, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP,
+                 zero_phase=False):
+        self.zero_phase = zero_phase
+        if zero_phase:
+            self.highpass = StreamingFiltfilt(cutoff, fs, order)
+        else:
+            self.highpass = StreamingHighpassFilter(cutoff, fs, order)
+        self.window_size = window_size
+        self.slide_step = slide_step
+        # Filtered samples from the start of the next window onwards
+        self.pending = np.empty((0, 3))
+
+    def process(self, chunk):
+        """
+        Filters the next chunk (n, 3) and returns the windows it completes,
+        shape (n_windows, window_size, 3), as a read-only view.
+        """
+        with stage('preprocess.highpass', samples=len(chunk)):
+            filtered = self.highpass.process(np.asarray(chunk, dtype=np.float64))
+        return self._window(filtered, len(chunk))
+
+    def finish(self):
+        """
+        End of the stream: returns the windows completed by the samples the zero-phase
+        filter still holds (none for the causal filter).
+        """
+        if not self.zero_phase:
+            return np.empty((0, self.window_size, 3))
+        with stage('preprocess.highpass'):
+            filtered = self.highpass.flush()
+        return self._window(filtered.reshape(-1, 3), len(filtered))
+
+    def _window(self, filtered, n_samples):
+        with stage('preprocess.window', samples=n_samples):
+            data = np.concatenate([self.pending, filtered]) if len(self.pending) else filtered
+            windows = create_overlapping_windows(data, self.window_size, self.slide_step)
+            self.pending = data[len(windows) * self.slide_step:]
+        return windows
+
+
+def stream_recording(file_path, store, fs=None, chunk_samples=CHUNK_SAMPLES, zero_phase=True, **kwargs):
+    """
+    Streams one Movesense recording through filter and segmentation into a SegmentStore.
+
+    Parameters:
+    - file_path (str): Movesense JSON file.
+    - store (SegmentStore): Destination; windows are appended as they are completed.
+    - fs (float): Sampling rate (Hz); probed from the first packets if None.
+    - chunk_samples (int): Samples per chunk.
+    - zero_phase (bool): Zero-phase filter as in filter_triaxial_data (default, the
+      training data); False for the causal filter of the live path.
+    - kwargs: cutoff, order, window_size, slide_step for ChunkedPreprocessor.
+
+    Returns:
+    - (int, float): Number of windows appended and the sampling rate used.
+    """
+    fs = fs or probe_sampling_rate(file_path) or FS
+    preprocessor = ChunkedPreprocessor(fs, zero_phase=zero_phase, **kwargs)
+    source = os.path.basename(file_path)
+    n_windows = 0
+    chunks = iter_movesense_chunks(file_path, chunk_samples)
+    while True:
+        # Parsing happens inside the generator: time each step of it separately
+        with stage('pipeline.read') as read:
+            chunk = next(chunks, None)
+            read.samples = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            windows = preprocessor.finish()
+        else:
+            windows = preprocessor.process(chunk)
+        with stage('pipeline.store', samples=len(windows)):
+            n_windows += store.append(windows, source=source)[1]
+        if chunk is None:
+            break
+    return n_windows, fs
+
+
+def reference_windows(raw, fs, cutoff=CUTOFF_FREQ, order=ORDER, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP,
+                      zero_phase=True):
+    """
+    Non-chunked reference: one filter pass over the whole (N, 3) stream, then
+    windowing. zero_phase=True is sosfiltfilt (butter_highpass_filter, as in
+    filter_triaxial_data), False one causal pass.
+    """
+    raw = np.asarray(raw, dtype=np.float64)
+    if zero_phase:
+        filtered = butter_highpass_filter(raw, cutoff, fs, order)
+    else:
+        filtered = StreamingHighpassFilter(cutoff, fs, order).process(raw)
+    return create_overlapping_windows(filtered, window_size, slide_step, copy=True)
+
+
+def windows_match(expected, stored, raw, zero_phase=True):
+    """
+    True if chunked windows equal the reference: bit-identical for the causal filter,
+    within FILTFILT_BLOCK_TOLERANCE * max(|raw|) for the zero-phase one.
+    """
+    if expected.shape != stored.shape:
+        return False
+    if not zero_phase:
+        return np.array_equal(expected, stored)
+    return bool(np.all(np.abs(expected - stored) <= FILTFILT_BLOCK_TOLERANCE * np.abs(raw).max()))
+
+
+@traced('pipeline.run_pipeline')
+def run_pipeline(tool_type='tool_drill', raw_dir=RAW_DATA_PATH, output_dir=CLEAN_DATA_OUTPUT_PATH,
+                 chunk_samples=CHUNK_SAMPLES, verify=False, zero_phase=True):
     """
     Executes the full preprocessing pipeline: Load -> Filter -> Segment.
+
+    Every Movesense recording in raw_dir/<tool_type>/ is streamed in chunks of
+    chunk_samples into <output_dir>/<tool_type>_cleaned_segments.npy (a SegmentStore),
+    so peak memory does not depend on the recording length. Without recordings the
+    simulated load_raw_data() stream is used.
+
+    Parameters:
+    - tool_type (str): Class folder name.
+    - raw_dir (str): Folder holding the class folders.
+    - output_dir (str): Folder of the segment stores.
+    - chunk_samples (int): Samples per chunk.
+    - verify (bool): Also run the non-chunked reference per recording and check the
+      stored windows against it (windows_match).
+    - zero_phase (bool): Zero-phase high-pass (sosfiltfilt) as in filter_triaxial_data,
+      the default for training data; False for the causal filter of the live path.
+
+    Returns:
+    - np.array: All windows of the class, a read-only memory map (N_windows, WINDOW_SIZE, 3).
     """
     print(f"\n--- Running Preprocessing Pipeline for {tool_type.upper()} ---")
 
-    # 1. Load Raw Data
-    df_raw = load_raw_data(tool_type)
-    
-    # 2. Apply High-Pass Filter (removes gravity/walking noise)
-    print("Applying high-pass filter...")
-    df_filtered = filter_triaxial_data(df_raw)
-    
-    # VITAL CHECK: Verify that the filter worked
-    print(f"Raw Z-axis Mean (Expected ~9.81): {df_raw['accel_z'].mean():.2f}")
-    print(f"Filtered Z-axis Mean (Expected ~0.0): {df_filtered['accel_z_filtered'].mean():.2f}")
-
-    # 3. Run Segmentation (breaks continuous stream into windows)
-    print(f"Segmenting data (Window Size: {WINDOW_SIZE}, Slide Step: {SLIDE_STEP})...")
-    segmented_array = create_overlapping_windows(df_filtered)
-    
+    output_filename = os.path.join(output_dir, f'{tool_type}_cleaned_segments.npy')
+    recordings = find_recordings(tool_type, raw_dir)
+
+    with SegmentStore(output_filename, WINDOW_SIZE, mode='w') as store:
+        if not recordings:
+            print(f"No recordings in {os.path.join(raw_dir, tool_type)}; using simulated data.")
+            df_raw = load_raw_data(tool_type)
+            # 1. + 2. Load and filter in chunks (removes gravity/walking noise)
+            preprocessor = ChunkedPreprocessor(FS, zero_phase=zero_phase)
+            raw = df_raw[['accel_x', 'accel_y', 'accel_z']].to_numpy()
+            for start in range(0, len(raw), chunk_samples):
+                store.append(preprocessor.process(raw[start:start + chunk_samples]), source='simulated')
+            store.append(preprocessor.finish(), source='simulated')
+
+        for file_path in recordings:
+            # 1. - 3. Load, filter and segment chunk by chunk
+            first_window = store.n_windows
+            n_windows, fs = stream_recording(file_path, store, chunk_samples=chunk_samples,
+                                             zero_phase=zero_phase)
+            print(f"  {os.path.basename(file_path)}: Fs={fs:.1f} Hz, {n_windows} windows")
+
+            if verify:
+                arrays = load_movesense_arrays(file_path, verbose=False)
+                expected = reference_windows(arrays['acc'], fs, zero_phase=zero_phase)
+                stored = store.windows[first_window:first_window + n_windows]
+                identical = windows_match(expected, stored, arrays['acc'], zero_phase)
+                print(f"    matches non-chunked run: {identical}")
+                if not identical:
+                    raise RuntimeError(f"Chunked output differs from the reference for {file_path}")
+
+        segmented_array = store.windows
+
     print(f"Pipeline complete. Created {segmented_array.shape[0]} windows.")
+    print(f"Cleaned data saved to: {output_filename}")
     return segmented_array
 
 
-def save_cleaned_data(segmented_array, tool_type='tool_drill'):
+def save_cleaned_data(segmented_array, tool_type='tool_drill', output_dir=CLEAN_DATA_OUTPUT_PATH):
     """
-    Saves the final 3D NumPy array to a file, ready for the 03_classifiers folder.
+    Saves an in-memory 3D NumPy array in one go, ready for the 03_classifiers folder.
+    (run_pipeline already writes its output incrementally.)
     """
     # Ensure the output directory exists
-    os.makedirs(CLEAN_DATA_OUTPUT_PATH, exist_ok=True)
-    
-    output_filename = os.path.join(CLEAN_DATA_OUTPUT_PATH, f'{tool_type}_cleaned_segments.npy')
-    
+    os.makedirs(output_dir, exist_ok=True)
+
+    output_filename = os.path.join(output_dir, f'{tool_type}_cleaned_segments.npy')
+
     # Saving the data as a compressed NumPy file (best practice)
     np.save(output_filename, segmented_array)
-    
+
     print(f"Cleaned data saved to: {output_filename}")
 
 
 if __name__ == '__main__':
     # --- Main Execution ---
-    
-    # Step 1: Run the pipeline for your 'drill' data
-    segments_drill = run_pipeline(tool_type='tool_drill')
-    
-    # Step 2: Save the result (ready for the Classifier Notebooks)
-    save_cleaned_data(segments_drill, tool_type='tool_drill')
-    
-    # Step 3: Repeat for noise data (e.g., 'noise_walking')
-    segments_walking = run_pipeline(tool_type='noise_walking')
-    save_cleaned_data(segments_walking, tool_type='noise_walking')
+
+    # Step 1: Run the pipeline for your 'drill' data (written incrementally to data_output/)
+    segments_drill = run_pipeline(tool_type='tool_drill', verify=True)
+
+    # Step 2: Repeat for noise data (e.g., 'noise_walking')
+    segments_walking = run_pipeline(tool_type='noise_walking', verify=True)
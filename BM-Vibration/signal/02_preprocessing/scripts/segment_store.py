@@ -0,0 +1,235 @@
+import json
+import os
+
+import numpy as np
+
+# ==============================================================================
+# SEGMENT STORE: segment_store.py
+# Purpose: Appendable on-disk store of (N_windows, WINDOW_SIZE, 3) windows for
+#          the chunked preprocessing pipeline. Windows are appended as they are
+#          produced, so the full tensor never has to fit in memory.
+#          AppendableArray is the generic appendable .npy underneath (also used
+#          for the feature store columns).
+#
+# The store is a regular .npy file whose header is reserved at a fixed size and
+# rewritten after every append, so at any time it can be opened with
+# np.load(path, mmap_mode='r'). A sidecar <path>.index.json records which window
+# range came from which recording.
+# ==============================================================================
+
+# Reserved .npy header size (bytes, including magic and length); a multiple of 64.
+# Larger for dtypes with long descriptions (see reserved_header_size).
+HEADER_BYTES = 128
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+def _header_text(dtype, shape):
+    return repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                 'fortran_order': False, 'shape': tuple(shape)})
+
+
+def reserved_header_size(dtype, row_shape):
+    """
+    Header size that fits any row count: HEADER_BYTES, or more (in steps of 64) for
+    long dtype descriptions such as structured dtypes.
+    """
+    longest = len(NPY_MAGIC) + 2 + len(_header_text(dtype, (np.iinfo(np.int64).max,) + tuple(row_shape))) + 1
+    return max(HEADER_BYTES, -(-longest // 64) * 64)
+
+
+def _header_bytes(dtype, shape, size=HEADER_BYTES):
+    """
+    .npy version 1.0 header for a C-order array, padded to exactly size bytes.
+    """
+    header = _header_text(dtype, shape)
+    prefix_len = len(NPY_MAGIC) + 2
+    if prefix_len + len(header) + 1 > size:
+        raise ValueError(f"Shape {shape} does not fit the reserved .npy header.")
+    header = header.ljust(size - prefix_len - 1) + '\n'
+    return NPY_MAGIC + np.uint16(len(header)).astype('<u2').tobytes() + header.encode('latin1')
+
+
+def _data_offset(path):
+    with open(path, 'rb') as f:
+        np.lib.format.read_magic(f)
+        np.lib.format.read_array_header_1_0(f)
+        return f.tell()
+
+
+class AppendableArray:
+    """
+    .npy file that grows along its first axis and stays loadable with np.load at any time.
+
+    Example:
+        with AppendableArray('rms.npy', row_shape=(3,), dtype=np.float32) as column:
+            column.append(rms_of_chunk)
+        rms = np.load('rms.npy', mmap_mode='r')
+    """
+
+    def __init__(self, path, row_shape=(), dtype=np.float64, mode='a'):
+        """
+        Parameters:
+        - path (str): .npy file.
+        - row_shape (tuple): Shape of one row (() for a 1-D column).
+        - dtype: Stored dtype (rows are cast on append).
+        - mode (str): 'a' to append to an existing file (created if missing),
+          'w' to start a new one.
+        """
+        if mode not in ('a', 'w'):
+            raise ValueError("mode must be 'a' or 'w'.")
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = int(np.prod(self.row_shape, dtype=np.int64)) * self.dtype.itemsize
+
+        if mode == 'a' and os.path.isfile(path):
+            existing = np.load(path, mmap_mode='r')
+            if existing.shape[1:] != self.row_shape or existing.dtype != self.dtype:
+                raise ValueError(f"{path} holds {existing.dtype} rows of shape {existing.shape[1:]}, "
+                                 f"expected {self.dtype} {self.row_shape}.")
+            self.n_rows = len(existing)
+            del existing
+            self.header_size = _data_offset(path)
+            self.file = open(path, 'r+b')
+            # Drop any partially written row after the last committed header update
+            self.file.truncate(self.header_size + self.n_rows * self.row_bytes)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.n_rows = 0
+            self.header_size = reserved_header_size(self.dtype, self.row_shape)
+            self.file = open(path, 'w+b')
+            self.file.write(_header_bytes(self.dtype, (0,) + self.row_shape, self.header_size))
+
+    def append(self, rows):
+        """
+        Appends rows of shape (n,) + row_shape and commits them.
+
+        Returns:
+        - (int, int): Index of the first appended row and the number appended.
+        """
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.shape[1:] != self.row_shape:
+            raise ValueError(f"Expected rows of shape (n,) + {self.row_shape}, got {rows.shape}.")
+        first = self.n_rows
+        if len(rows) == 0:
+            return first, 0
+
+        self.file.seek(self.header_size + first * self.row_bytes)
+        self.file.write(rows.tobytes())
+        self.n_rows += len(rows)
+        self._commit()
+        return first, len(rows)
+
+    def truncate(self, n_rows):
+        """
+        Drops every row from n_rows on (e.g. rows not yet recorded in an index).
+        """
+        if n_rows > self.n_rows:
+            raise ValueError(f"Cannot truncate {self.n_rows} rows to {n_rows}.")
+        self.n_rows = n_rows
+        self._commit()
+        self.file.truncate(self.header_size + n_rows * self.row_bytes)
+
+    def _commit(self):
+        # Data first, then the header that makes it visible
+        self.file.flush()
+        self.file.seek(0)
+        self.file.write(_header_bytes(self.dtype, (self.n_rows,) + self.row_shape, self.header_size))
+        self.file.flush()
+
+    @property
+    def array(self):
+        """
+        Read-only memory map of all committed rows.
+        """
+        if self.n_rows == 0:
+            return np.empty((0,) + self.row_shape, dtype=self.dtype)
+        return np.load(self.path, mmap_mode='r')
+
+    def close(self):
+        if not self.file.closed:
+            self._commit()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SegmentStore(AppendableArray):
+    """
+    Appendable memory-mappable window store.
+
+    Example:
+        with SegmentStore('drill.npy', window_size=64) as store:
+            for windows in chunks_of_windows:
+                store.append(windows, source='rec1.json')
+        windows = np.load('drill.npy', mmap_mode='r')     # or SegmentStore(...).windows
+    """
+
+    def __init__(self, path, window_size, n_axes=3, dtype=np.float64, mode='a'):
+        """
+        Parameters:
+        - path (str): .npy file of the store.
+        - window_size (int): Samples per window.
+        - n_axes (int): Channels per sample.
+        - dtype: Stored dtype (windows are cast on append).
+        - mode (str): 'a' to append to an existing store (created if missing),
+          'w' to start a new one.
+        """
+        super().__init__(path, (window_size, n_axes), dtype, mode)
+        self.index_path = path + '.index.json'
+        self.frame_shape = self.row_shape
+        self.sources = []
+        if mode == 'a' and os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.sources = json.load(f)['sources']
+        else:
+            self._write_index()
+
+    @property
+    def n_windows(self):
+        return self.n_rows
+
+    def _write_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'n_windows': self.n_windows, 'window_shape': list(self.frame_shape),
+                       'dtype': self.dtype.str, 'sources': self.sources}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, windows, source=None):
+        """
+        Appends windows of shape (n, window_size, n_axes) and commits them.
+
+        Parameters:
+        - windows (np.array): Windows to append (any dtype; views are fine).
+        - source (str): Optional recording name; consecutive appends with the same
+          source extend one index entry.
+
+        Returns:
+        - (int, int): Index of the first appended window and the number appended.
+        """
+        first, n = super().append(windows)
+        if n and source is not None:
+            if self.sources and self.sources[-1]['source'] == source and \
+                    self.sources[-1]['first_window'] + self.sources[-1]['n_windows'] == first:
+                self.sources[-1]['n_windows'] += n
+            else:
+                self.sources.append({'source': source, 'first_window': first, 'n_windows': n})
+            self._write_index()
+        return first, n
+
+    @property
+    def windows(self):
+        """
+        Read-only memory map of all committed windows, shape (n_windows, window_size, n_axes).
+        """
+        return self.array
+
+    def close(self):
+        if not self.file.closed:
+            super().close()
+            self._write_index()
@@ -1,80 +1,26 @@
-import numpy as np
-import pandas as pd
-
-# --- Project Constants (Base these on standard HAR practice) ---
-# NOTE: These values need to be finalized through testing, but 1.28s is common.
-
-# The window size defines the length of each segment analyzed by the classifier.
-WINDOW_SIZE = 64  # samples. (e.g., if FS=50Hz, 64 samples is 1.28 seconds)
-
-# The overlap defines how much the next window moves forward.
-# A 50% overlap (0.5) is common to prevent missing key events at window boundaries.
-OVERLAP_RATIO = 0.5  
-SLIDE_STEP = int(WINDOW_SIZE * OVERLAP_RATIO)  # e.g., 32 samples
-
-
-def create_overlapping_windows(df_filtered, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
-    """
-    Breaks a continuous, filtered sensor stream (DataFrame) into a 3D NumPy array
-    using fixed-size, overlapping windows.
-
-    This function prepares data for feature extraction (fft_feature_extract.py)
-    and subsequent classification (train_onoff.ipynb).
+import os
+import sys
 
-    Parameters:
-    - df_filtered (pd.DataFrame): The input DataFrame containing filtered triaxial
-      acceleration data (columns: accel_x_filtered, accel_y_filtered, accel_z_filtered).
-    - window_size (int): The number of samples in each window.
-    - slide_step (int): The number of samples to slide before creating the next window.
+import numpy as np
 
-    Returns:
-    - np.array: A 3D array of shape (N_windows, window_size, 3)
-                (where 3 represents the X, Y, Z axes).
-    """
-    
-    # 1. Prepare Data
-    # Convert DataFrame to a NumPy array for fast iteration
-    data_array = df_filtered[['accel_x_filtered', 'accel_y_filtered', 'accel_z_filtered']].values
-    
-    # Calculate the total length of the data
-    n_samples = len(data_array)
-    
-    # List to hold all the individual windows
-    windows = []
-    
-    # 2. Loop and Segment
-    # Iterate through the data, stopping when a full window cannot be created
-    for start in range(0, n_samples - window_size + 1, slide_step):
-        end = start + window_size
-        window = data_array[start:end, :]
-        windows.append(window)
-    
-    # 3. Final Output
-    # Convert the list of windows into a single 3D NumPy array
-    return np.array(windows)
+# ==============================================================================
+# SEGMENTATION: segmentation.py
+# The windowing functions live in the headless core package
+# (BM-Vibration/vibration/segmentation.py). This script keeps the old import path
+# for the pipeline scripts and notebooks, and the windowing demo.
+# ==============================================================================
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-# Optional: Function to retrieve corresponding labels if you were doing full HAR
-def create_window_labels(df_raw_labels, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
-    """
-    Retrieves the majority label (e.g., 'Vibration ON' or 'OFF') for each window.
-    """
-    n_samples = len(df_raw_labels)
-    window_labels = []
-    
-    for start in range(0, n_samples - window_size + 1, slide_step):
-        window = df_raw_labels[start:start + window_size]
-        # Assign the label that occurs most frequently in the window (majority vote)
-        # NOTE: For your 'On/Off' classifier, you might use a simpler rule: 
-        # if ANY sample is 'Vibration ON', the whole window is 'Vibration ON'.
-        majority_label = window.mode()[0]
-        window_labels.append(majority_label)
-        
-    return np.array(window_labels)
+from vibration.segmentation import (  # noqa: F401 (re-exported)
+    OVERLAP_RATIO, SLIDE_STEP, WINDOW_SIZE, create_overlapping_windows, create_window_labels, encode_labels,
+    load_windows_from_npy, summarize_window_labels, window_label_counts, window_starts,
+)
 
 
 if __name__ == '__main__':
     # --- Example Usage (Testing the function) ---
+    import pandas as pd
     
     # 1. Create dummy filtered data (100 samples total, 3 axes)
     # This simulates data that has been cleaned by highpass_filter.py
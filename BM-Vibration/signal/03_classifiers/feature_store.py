@@ -0,0 +1,364 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+# ==============================================================================
+# FEATURE STORE: feature_store.py
+# Purpose: Persistent, append-only store of per-window features for the on/off
+#          and tool-type classifiers, so training and validation read features
+#          with one memory-mapped load instead of recomputing FFTs.
+#
+# Layout (one folder per feature parameter set):
+#   <store>/<params hash>/params.json      feature names + extraction parameters
+#                        /features.npy     (N, n_features) float32
+#                        /labels.npy       (N,) int16 store class id
+#                        /recording.npy    (N,) int32 recording id
+#                        /window_start.npy (N,) int64 first sample of the window
+#                        /time_s.npy       (N,) float32 window start time
+#                        /recordings.json  the store's class names (class id =
+#                                          position, append-only) and one entry
+#                                          per recording (rows, class, sensor
+#                                          serial, Fs, source key, superseded)
+# A row is keyed by (recording, window start, params hash). Every column is an
+# appendable .npy; recordings.json is written last and defines what is committed.
+#
+# Class ids are the store's own, so they do not shift when class folders are added
+# or a run uses --classes; load(classes=[...]) maps them to a caller's class list.
+# A recording is identified by (class name, recording name), so equally named files
+# in two class folders stay apart. When it is added again with a different source key
+# (changed content or preprocessing), its older entries are marked superseded and
+# select() skips them.
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'tool_type'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '02_preprocessing', 'scripts'))
+
+from fft_feature_extract import FREQ_BANDS, extract_fft_features, feature_names
+from segment_store import AppendableArray
+from segmentation import SLIDE_STEP
+
+# --- 1. Store Constants ---
+FEATURE_STORE_PATH = os.path.join(os.path.dirname(__file__), 'feature_store')
+RECORDINGS_FILE = 'recordings.json'
+PARAMS_FILE = 'params.json'
+# Windows per feature extraction / append (bounds memory while ingesting)
+INGEST_BATCH_WINDOWS = 1 << 15
+# Bump when the stored columns change meaning (part of the parameter hash)
+STORE_VERSION = 2
+
+# Per-row columns besides the feature matrix: name -> dtype
+ROW_COLUMNS = {
+    'labels': np.int16,
+    'recording': np.int32,
+    'window_start': np.int64,
+    'time_s': np.float32,
+}
+
+
+def feature_params(window_size, bands=FREQ_BANDS, slide_step=SLIDE_STEP):
+    """
+    Parameters that determine the feature values (hashed into the store folder name).
+    """
+    return {
+        'extractor': 'fft_feature_extract',
+        'window_size': int(window_size),
+        'slide_step': int(slide_step),
+        'bands': [list(map(float, band)) for band in bands],
+        'feature_names': feature_names(bands),
+        'store_version': STORE_VERSION,
+    }
+
+
+def params_hash(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class FeatureStore:
+    """
+    Append-only feature store for one feature parameter set.
+
+    Example:
+        store = FeatureStore(feature_params(window_size=64))
+        store.add_recording('rec1.json', windows, fs=833, class_name='tool_drill')
+        rows = store.select(classes=['tool_drill'], time_range=(10, 60))
+        data = store.load(rows, classes=['noise_walking', 'tool_drill'])
+        X, y = data['features'], data['labels']       # y: positions in `classes`
+        store.close()
+    """
+
+    def __init__(self, params, root=FEATURE_STORE_PATH):
+        """
+        Parameters:
+        - params (dict): feature_params(...) of the features to store / read.
+        - root (str): Store folder; each parameter set gets its own sub-folder.
+        """
+        self.params = params
+        self.key = params_hash(params)
+        self.path = os.path.join(root, self.key)
+        self.feature_names = list(params['feature_names'])
+        os.makedirs(self.path, exist_ok=True)
+
+        params_path = os.path.join(self.path, PARAMS_FILE)
+        if not os.path.isfile(params_path):
+            with open(params_path, 'w') as f:
+                json.dump(params, f, indent=2)
+
+        self.recordings = []
+        self.class_names = []
+        recordings_path = os.path.join(self.path, RECORDINGS_FILE)
+        if os.path.isfile(recordings_path):
+            with open(recordings_path, 'r') as f:
+                committed = json.load(f)
+            self.recordings = committed['recordings']
+            self.class_names = committed['classes']
+        self.n_rows = sum(entry['n_rows'] for entry in self.recordings)
+
+        self._columns = {'features': AppendableArray(os.path.join(self.path, 'features.npy'),
+                                                     (len(self.feature_names),), np.float32)}
+        for name, dtype in ROW_COLUMNS.items():
+            self._columns[name] = AppendableArray(os.path.join(self.path, f'{name}.npy'), (), dtype)
+        # Rows appended after the last committed recordings.json (interrupted ingest)
+        for column in self._columns.values():
+            if column.n_rows != self.n_rows:
+                column.truncate(self.n_rows)
+        self._build_lookup()
+
+    def _build_lookup(self):
+        self._by_name = {(entry['class_name'], entry['recording'], entry['source_key']): entry
+                         for entry in self.recordings}
+
+    def _write_recordings(self):
+        tmp_path = os.path.join(self.path, RECORDINGS_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'params_hash': self.key, 'n_rows': self.n_rows, 'classes': self.class_names,
+                       'recordings': self.recordings}, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, RECORDINGS_FILE))
+
+    def has_recording(self, recording, class_name, source_key=None):
+        return (class_name, recording, source_key) in self._by_name
+
+    def class_id(self, class_name):
+        """
+        Store class id of a class name; new names are appended (ids never change).
+        """
+        if class_name not in self.class_names:
+            self.class_names.append(class_name)
+        return self.class_names.index(class_name)
+
+    def _set_current(self, entry):
+        """
+        Marks entry as the current version of its recording and every other entry of
+        the same recording (same class and name) as superseded. Returns True if a flag
+        changed.
+        """
+        changed = False
+        for other in self.recordings:
+            if other['recording'] == entry['recording'] and other['class_name'] == entry['class_name']:
+                superseded = other is not entry
+                changed |= other.get('superseded', False) != superseded
+                other['superseded'] = superseded
+        return changed
+
+    def add_recording(self, recording, windows, fs, class_name, sensor_serial=None,
+                      source_key=None, window_starts=None):
+        """
+        Extracts and appends the features of one recording.
+
+        Parameters:
+        - recording (str): Recording name (e.g. the Movesense file name).
+        - windows (np.array): (N_windows, W, 3) filtered windows (memory maps are fine).
+        - fs (float): Sampling rate (Hz).
+        - class_name (str): Class of the recording; its store class id is stored per window.
+        - sensor_serial (str): Sensor serial number, if known.
+        - source_key (str): Identity of the window source (e.g. the orchestrator task
+          key); a recording of this class already stored with the same key is not added
+          again. Any other entries of the same class and recording are marked superseded.
+        - window_starts (np.array): First sample of each window (default: i * slide_step).
+
+        Returns:
+        - dict: The recording entry (first_row, n_rows, ...), or the existing one.
+        """
+        if self.has_recording(recording, class_name, source_key):
+            # Already stored (e.g. a recording changed back): make it current again
+            entry = self._by_name[(class_name, recording, source_key)]
+            if self._set_current(entry):
+                self._write_recordings()
+            return entry
+        if windows.shape[1] != self.params['window_size']:
+            raise ValueError(f"Windows of {windows.shape[1]} samples do not match the store "
+                             f"({self.params['window_size']}).")
+        n_windows = len(windows)
+        if window_starts is None:
+            window_starts = np.arange(n_windows, dtype=np.int64) * self.params['slide_step']
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+        recording_id = len(self.recordings)
+        class_id = self.class_id(class_name)
+        bands = tuple(map(tuple, self.params['bands']))
+
+        for start in range(0, n_windows, INGEST_BATCH_WINDOWS):
+            stop = min(start + INGEST_BATCH_WINDOWS, n_windows)
+            n = stop - start
+            self._columns['features'].append(extract_fft_features(windows[start:stop], fs, bands))
+            self._columns['labels'].append(np.full(n, class_id))
+            self._columns['recording'].append(np.full(n, recording_id))
+            self._columns['window_start'].append(window_starts[start:stop])
+            self._columns['time_s'].append(window_starts[start:stop] / float(fs))
+
+        entry = {
+            'recording_id': recording_id,
+            'recording': recording,
+            'class_name': class_name,
+            'class_id': class_id,
+            'sensor_serial': sensor_serial,
+            'fs': float(fs),
+            'first_row': self.n_rows,
+            'n_rows': n_windows,
+            'source_key': source_key,
+            'superseded': False,
+        }
+        self.recordings.append(entry)
+        self._set_current(entry)
+        self.n_rows += n_windows
+        self._build_lookup()
+        # Commit point: the rows become part of the store once they are listed here
+        self._write_recordings()
+        return entry
+
+    # --- 2. Queries ---
+    def select(self, classes=None, recordings=None, sensor_serials=None, time_range=None,
+               include_superseded=False):
+        """
+        Row indices matching all given conditions, in store order. Rows of superseded
+        recording entries are left out unless include_superseded=True.
+
+        Parameters:
+        - classes (list): Class names.
+        - recordings (list): Recording names.
+        - sensor_serials (list): Sensor serial numbers.
+        - time_range (tuple): (start_s, end_s) of the window start within its recording.
+        - include_superseded (bool): Also return rows of superseded entries.
+
+        Returns:
+        - np.array: int64 row indices (use with load()).
+        """
+        ranges = []
+        time_s = self._columns['time_s'].array if time_range is not None else None
+        for entry in self.recordings:
+            if entry['superseded'] and not include_superseded:
+                continue
+            if classes is not None and entry['class_name'] not in classes:
+                continue
+            if recordings is not None and entry['recording'] not in recordings:
+                continue
+            if sensor_serials is not None and entry['sensor_serial'] not in sensor_serials:
+                continue
+            first, last = entry['first_row'], entry['first_row'] + entry['n_rows']
+            if time_range is not None:
+                # Window starts increase within a recording: two binary searches
+                times = time_s[first:last]
+                first, last = (first + np.searchsorted(times, time_range[0], side='left'),
+                               first + np.searchsorted(times, time_range[1], side='left'))
+            if last > first:
+                ranges.append(np.arange(first, last, dtype=np.int64))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def label_lookup(self, classes):
+        """
+        Array mapping store class ids to positions in `classes` (-1 if missing).
+        """
+        return np.array([list(classes).index(name) if name in classes else -1
+                         for name in self.class_names], dtype=np.int16)
+
+    def load(self, rows=None, columns=None, classes=None):
+        """
+        Reads the selected rows of the selected columns.
+
+        Parameters:
+        - rows (np.array): Row indices from select() (default: all rows, including
+          superseded ones, as memory maps).
+        - columns (list): Column names (default: features and labels).
+        - classes (list): Class names; labels are returned as positions in this list
+          (-1 for other classes) instead of store class ids.
+
+        Returns:
+        - dict: Column name -> array.
+        """
+        columns = columns or ['features', 'labels']
+        arrays = {name: self._columns[name].array[:self.n_rows] for name in columns}
+        if rows is not None:
+            rows = np.asarray(rows)
+            if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+                # Contiguous selection: a slice of the memory map, no gather
+                arrays = {name: array[rows[0]:rows[-1] + 1] for name, array in arrays.items()}
+            else:
+                arrays = {name: array[rows] for name, array in arrays.items()}
+        if classes is not None and 'labels' in arrays:
+            arrays['labels'] = self.label_lookup(classes)[arrays['labels']]
+        return arrays
+
+    @property
+    def features(self):
+        return self._columns['features'].array[:self.n_rows]
+
+    @property
+    def labels(self):
+        """
+        Store class id of every row (index into class_names).
+        """
+        return self._columns['labels'].array[:self.n_rows]
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ingest_training_set(training_dir=None, root=FEATURE_STORE_PATH, bands=FREQ_BANDS):
+    """
+    Adds every recording of the orchestrator's training set (training_index.json) to
+    the feature store; recordings already stored with the same task key are skipped,
+    and older versions of a changed recording are superseded. Labels are stored by
+    class name, so load(classes=index['classes']) gives the training set's class ids.
+
+    Returns:
+    - FeatureStore: The (open) store of the training set's feature parameters.
+    """
+    from orchestrate_pipeline import load_training_set
+    from preprocess_pipeline import CLEAN_DATA_OUTPUT_PATH
+
+    windows, labels, index = load_training_set(training_dir or CLEAN_DATA_OUTPUT_PATH)
+    params = feature_params(index['params']['window_size'], bands, index['params']['slide_step'])
+    store = FeatureStore(params, root)
+    n_added = 0
+    for entry in index['recordings']:
+        if store.has_recording(entry['file'], entry['class_name'], entry['key']):
+            # Make sure it is the current version of the recording
+            store.add_recording(entry['file'], None, entry['fs'], entry['class_name'], source_key=entry['key'])
+            continue
+        first = entry['first_window']
+        store.add_recording(entry['file'], windows[first:first + entry['n_windows']], entry['fs'],
+                            entry['class_name'], entry.get('sensor_serial'), entry['key'])
+        n_added += 1
+    print(f"Feature store {store.path}: {n_added} recordings added, {store.n_rows} windows total.")
+    return store
+
+
+if __name__ == '__main__':
+    # --- Example: ingest the preprocessed training set, then query it ---
+    import time
+
+    store = ingest_training_set()
+    start = time.perf_counter()
+    rows = store.select(classes=[entry['class_name'] for entry in store.recordings[:1]])
+    data = store.load(rows)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    print(f"Selected {len(rows)} windows x {store.features.shape[1]} features in {elapsed_ms:.2f} ms")
+    store.close()
@@ -1 +1,320 @@
+import json
+import os
+import sys
+import time
 
+import numpy as np
+
+# ==============================================================================
+# ON/OFF DETECTOR: onoff_model.py
+# Purpose: Low-latency incremental ON/OFF detection of tool vibration from
+#          accelerometer packets as they arrive (e.g. the 2-8 sample Movesense
+#          packets), for exposure timing over a full shift.
+#
+# Per sample:  high-pass (carried SOS state) -> squared vector magnitude ->
+#              moving RMS (window sums from one cumulative sum per block) ->
+#              hysteresis (on/off thresholds) with a minimum run length.
+# One detector object can run a bank of streams at once (packets of shape
+# (n_streams, n, 3)), so thousands of simulated sensors fit on one core.
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '02_preprocessing', 'scripts'))
+
+from highpass_filter import StreamingHighpassFilter
+
+# --- 1. Detector Constants ---
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+
+# Used for any key missing from thresholds.json. Thresholds are the RMS of the
+# high-passed vector magnitude in m/s^2.
+DEFAULT_THRESHOLDS = {
+    'fs': 833.0,
+    'highpass_cutoff_hz': 5.0,
+    'highpass_order': 4,
+    'rms_window_ms': 20.0,
+    'on_threshold': 1.0,
+    'off_threshold': 0.5,
+    'min_on_ms': 12.0,
+    'min_off_ms': 12.0,
+}
+
+STATE_OFF = 0
+STATE_ON = 1
+
+# Samples per processing block: bounds the temporaries and the cumulative sum
+MAX_BLOCK_SAMPLES = 4096
+
+# One row per emitted transition. sample_index is where the qualifying run started
+# (the state change is back-dated to it); detected_index is where it was confirmed.
+TRANSITION_DTYPE = np.dtype([
+    ('stream', np.int32),
+    ('sample_index', np.int64),
+    ('detected_index', np.int64),
+    ('time_ms', np.float64),
+    ('state', np.int8),
+    ('rms', np.float32),
+])
+
+
+def load_thresholds(path=THRESHOLDS_PATH):
+    """
+    Loads the detector configuration from thresholds.json, filling missing keys
+    from DEFAULT_THRESHOLDS.
+
+    Returns:
+    - dict: Same keys as DEFAULT_THRESHOLDS.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if path is not None and os.path.isfile(path) and os.path.getsize(path) > 1:
+        with open(path, 'r') as f:
+            thresholds.update(json.load(f))
+    return thresholds
+
+
+def _run_lengths(mask, carry):
+    """
+    Length of the run of True values ending at every sample, shape (S, n).
+    carry (S,) is the run length at the end of the previous packet.
+    """
+    n = mask.shape[1]
+    idx = np.arange(n)
+    # Index of the last False at or before each sample; before the first one the
+    # run continues from the previous packet (virtual False at -1 - carry)
+    last_false = np.where(mask, (-1 - carry)[:, None], idx)
+    np.maximum.accumulate(last_false, axis=1, out=last_false)
+    return idx - last_false
+
+
+class OnOffDetector:
+    """
+    Incremental ON/OFF detector for one or many accelerometer streams.
+
+    The moving RMS covers the last rms_window_ms of high-passed vector magnitude.
+    A stream switches ON once the RMS has stayed above on_threshold for min_on_ms
+    and OFF once it has stayed below off_threshold for min_off_ms; between the
+    thresholds it keeps its state. Worst-case detection delay is latency_ms.
+
+    Example:
+        detector = OnOffDetector()
+        for packet in packets:                # packet: shape (n, 3)
+            for event in detector.process(packet):
+                print(event['time_ms'], 'ON' if event['state'] else 'OFF')
+    """
+
+    def __init__(self, thresholds=None, fs=None, n_streams=1):
+        """
+        Parameters:
+        - thresholds (dict or str): Configuration dict, or path to a thresholds JSON
+          file. Defaults to thresholds.json next to this module.
+        - fs (float): Sampling frequency (Hz); overrides thresholds['fs'].
+        - n_streams (int): Number of streams processed together.
+        """
+        if thresholds is None or isinstance(thresholds, str):
+            thresholds = load_thresholds(thresholds or THRESHOLDS_PATH)
+        else:
+            thresholds = dict(DEFAULT_THRESHOLDS, **thresholds)
+
+        if thresholds['off_threshold'] > thresholds['on_threshold']:
+            raise ValueError("off_threshold must not be larger than on_threshold.")
+        if n_streams < 1:
+            raise ValueError("n_streams must be at least 1.")
+
+        self.thresholds = thresholds
+        self.fs = float(fs if fs is not None else thresholds['fs'])
+        self.n_streams = n_streams
+        self.on_threshold = thresholds['on_threshold']
+        self.off_threshold = thresholds['off_threshold']
+
+        samples_per_ms = self.fs / 1000.0
+        self.window = max(1, int(round(thresholds['rms_window_ms'] * samples_per_ms)))
+        self.min_on = max(1, int(round(thresholds['min_on_ms'] * samples_per_ms)))
+        self.min_off = max(1, int(round(thresholds['min_off_ms'] * samples_per_ms)))
+
+        self.highpass = StreamingHighpassFilter(
+            thresholds['highpass_cutoff_hz'], self.fs, thresholds['highpass_order'], axis=1
+        )
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all stream state (filter, RMS history, run counters, ON time).
+        """
+        self.highpass.reset()
+        self.history = np.zeros((self.n_streams, self.window))
+        self.above_run = np.zeros(self.n_streams, dtype=np.int64)
+        self.below_run = np.zeros(self.n_streams, dtype=np.int64)
+        self.state = np.zeros(self.n_streams, dtype=bool)
+        self.on_samples = np.zeros(self.n_streams, dtype=np.int64)
+        self.n_samples = 0
+
+    @property
+    def latency_ms(self):
+        """
+        Worst-case delay between a step change of the vibration and its transition
+        being emitted: a full RMS window plus the minimum run length.
+        """
+        return (self.window + max(self.min_on, self.min_off) - 1) * 1000.0 / self.fs
+
+    @property
+    def on_time_s(self):
+        """
+        Accumulated ON time per stream (s), shape (n_streams,).
+        """
+        return self.on_samples / self.fs
+
+    def _moving_rms(self, energy):
+        """
+        Moving RMS for one block of at most MAX_BLOCK_SAMPLES samples, shape (S, n).
+        """
+        n = energy.shape[1]
+        # Last `window` energies (time order) followed by the new ones
+        extended = np.concatenate([self.history, energy], axis=1)
+
+        # Window sums as differences of one cumulative sum; it restarts every block,
+        # so rounding errors cannot accumulate over a shift
+        cumulative = np.cumsum(extended, axis=1)
+        sums = cumulative[:, self.window:] - cumulative[:, :n]
+        self.history = extended[:, n:].copy()
+        return np.sqrt(np.maximum(sums, 0.0) / self.window)
+
+    def _hysteresis(self, rms):
+        """
+        Updates the state for one block; returns the per-sample state, shape (S, n).
+        """
+        above = _run_lengths(rms > self.on_threshold, self.above_run)
+        below = _run_lengths(rms < self.off_threshold, self.below_run)
+        self.above_run = np.minimum(above[:, -1], self.min_on)
+        self.below_run = np.minimum(below[:, -1], self.min_off)
+
+        turn_on = above >= self.min_on
+        turn_off = below >= self.min_off
+
+        # The state at each sample is set by the last trigger at or before it
+        n = rms.shape[1]
+        last_trigger = np.where(turn_on | turn_off, np.arange(n), -1)
+        np.maximum.accumulate(last_trigger, axis=1, out=last_trigger)
+        triggered_on = np.take_along_axis(turn_on, np.maximum(last_trigger, 0), axis=1)
+        return np.where(last_trigger >= 0, triggered_on, self.state[:, None])
+
+    def _process_block(self, block, events):
+        energy = np.einsum('snc,snc->sn', block, block)
+        rms = self._moving_rms(energy)
+        states = self._hysteresis(rms)
+
+        previous = np.concatenate([self.state[:, None], states[:, :-1]], axis=1)
+        streams, offsets = np.nonzero(states != previous)
+        if len(streams):
+            new_state = states[streams, offsets]
+            detected = self.n_samples + offsets
+            min_run = np.where(new_state, self.min_on, self.min_off)
+            onset = detected - (min_run - 1)
+
+            found = np.empty(len(streams), dtype=TRANSITION_DTYPE)
+            found['stream'] = streams
+            found['sample_index'] = onset
+            found['detected_index'] = detected
+            found['time_ms'] = onset * 1000.0 / self.fs
+            found['state'] = new_state
+            found['rms'] = rms[streams, offsets]
+            events.append(found)
+
+        self.on_samples += states.sum(axis=1)
+        self.state = states[:, -1].copy()
+        self.n_samples += block.shape[1]
+
+    def process(self, packet):
+        """
+        Feeds the next packet of every stream through the detector.
+
+        Parameters:
+        - packet (np.array): Shape (n, 3) for a single stream, or (n_streams, n, 3).
+          Long packets are processed in blocks of MAX_BLOCK_SAMPLES.
+
+        Returns:
+        - np.array: Transitions found in this packet (TRANSITION_DTYPE), in time order
+          per stream. Empty if the state did not change.
+        """
+        packet = np.asarray(packet, dtype=np.float64)
+        if packet.ndim == 2 and self.n_streams == 1:
+            packet = packet[None]
+        if packet.ndim != 3 or packet.shape[0] != self.n_streams:
+            raise ValueError(f"Expected a packet of shape ({self.n_streams}, n, 3), got {packet.shape}.")
+
+        return self.process_filtered(self.highpass.process(packet))
+
+    def process_filtered(self, filtered):
+        """
+        Like process(), for packets that are already high-pass filtered with
+        highpass_cutoff_hz / highpass_order (e.g. one filtered signal shared by several
+        detector configurations). Shape (n_streams, n, 3).
+        """
+        filtered = np.asarray(filtered, dtype=np.float64)
+        events = []
+        for start in range(0, filtered.shape[1], MAX_BLOCK_SAMPLES):
+            self._process_block(filtered[:, start:start + MAX_BLOCK_SAMPLES], events)
+
+        if not events:
+            return np.empty(0, dtype=TRANSITION_DTYPE)
+        return np.concatenate(events)
+
+
+def synthetic_tool_stream(duration_s, fs, bursts, amplitude=5.0, tool_freq=70.0, seed=0):
+    """
+    Gravity + wrist sway + sensor noise, with tool vibration during each (start_s, stop_s)
+    burst. Returns an array of shape (n_samples, 3).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * fs)) / fs
+    data = np.column_stack([
+        np.full(len(t), 9.81),
+        0.5 * np.sin(2 * np.pi * 0.7 * t),
+        0.3 * np.sin(2 * np.pi * 1.3 * t),
+    ]) + rng.normal(0, 0.05, (len(t), 3))
+    for start_s, stop_s in bursts:
+        on = (t >= start_s) & (t < stop_s)
+        data[on] += amplitude * np.sin(2 * np.pi * tool_freq * t[on])[:, None] * [1.0, 0.8, 0.6]
+    return data
+
+
+if __name__ == '__main__':
+    # --- Example 1: one stream fed in 8-sample packets ---
+    detector = OnOffDetector()
+    fs = detector.fs
+    bursts = [(2.0, 5.0), (6.5, 6.9), (8.0, 12.0)]
+    stream = synthetic_tool_stream(15.0, fs, bursts)
+
+    transitions = []
+    for start in range(0, len(stream), 8):
+        transitions.append(detector.process(stream[start:start + 8]))
+    transitions = np.concatenate(transitions)
+
+    print("--- ON/OFF Detector ---")
+    print(f"Fs={fs} Hz, RMS window {detector.window} samples, "
+          f"worst-case latency {detector.latency_ms:.1f} ms")
+    for event in transitions:
+        delay_ms = (event['detected_index'] - event['sample_index']) * 1000.0 / fs
+        print(f"  {'ON ' if event['state'] else 'OFF'} at {event['time_ms'] / 1000.0:7.3f} s "
+              f"(confirmed {delay_ms:.1f} ms later, RMS {event['rms']:.2f} m/s^2)")
+    expected_s = sum(stop - start for start, stop in bursts)
+    print(f"ON time: {detector.on_time_s[0]:.3f} s (true: {expected_s:.3f} s)")
+
+    # --- Example 2: load test, many simulated sensors on one core ---
+    n_streams = 2000
+    packet_size = 8
+    n_packets = 500
+    bank = OnOffDetector(n_streams=n_streams)
+    rng = np.random.default_rng(1)
+    packets = rng.normal(0, 0.05, (n_packets, n_streams, packet_size, 3)) + [0.0, 0.0, 9.81]
+    packets[:, ::2] += rng.normal(0, 3.0, (n_packets, n_streams // 2, packet_size, 3))
+
+    start = time.perf_counter()
+    for packet in packets:
+        bank.process(packet)
+    elapsed = time.perf_counter() - start
+
+    total_packets = n_packets * n_streams
+    realtime_s = n_packets * packet_size / fs
+    print(f"\nLoad test: {n_streams} streams x {n_packets} packets of {packet_size} samples")
+    print(f"  {total_packets / elapsed:,.0f} packets/s, {elapsed / total_packets * 1e6:.2f} us/packet")
+    print(f"  {realtime_s / elapsed * n_streams:,.0f} real-time streams per core")
+    print(f"  streams ON at the end: {int(bank.state.sum())} (expected {n_streams // 2})")
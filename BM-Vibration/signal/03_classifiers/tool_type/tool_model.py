@@ -0,0 +1,346 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# ==============================================================================
+# TOOL MODEL: tool_model.py
+# Purpose: Compact on-disk format and pure-NumPy batched predictor for the
+#          tool-type classifier, so inference needs neither scikit-learn nor
+#          pickle at runtime.
+#
+# File layout (MODEL_PATH):
+#   MAGIC (8 bytes) | header length (uint64, little endian) | JSON header |
+#   raw arrays, each starting at a multiple of ARRAY_ALIGNMENT bytes
+# The header holds the model type, class names, feature names and the dtype,
+# shape and offset of every array. Arrays are memory-mapped read-only, so a pool
+# of worker processes shares one copy through the OS page cache.
+#
+# Supported models: linear classifiers (LogisticRegression, LinearSVC,
+# RidgeClassifier, SGDClassifier) and tree ensembles (DecisionTreeClassifier,
+# RandomForestClassifier, ExtraTreesClassifier), optionally behind a
+# StandardScaler in a Pipeline.
+# ==============================================================================
+
+# --- 1. Format Constants ---
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'tool_model.npmodel')
+MAGIC = b'BMVMODL1'
+FORMAT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+# Rows classified per vectorized tree walk; bounds the (rows x trees) index arrays
+PREDICT_BATCH_SIZE = 4096
+
+LINEAR_MODELS = ('LogisticRegression', 'LinearSVC', 'RidgeClassifier', 'SGDClassifier')
+TREE_MODELS = ('DecisionTreeClassifier', 'RandomForestClassifier', 'ExtraTreesClassifier')
+
+
+def save_model(path, header, arrays):
+    """
+    Writes a model file: JSON header followed by the aligned raw arrays.
+
+    Parameters:
+    - path (str): Output file.
+    - header (dict): JSON-serializable model description ('model_type', 'classes', ...).
+    - arrays (dict): name -> np.array. Stored little endian, C order.
+    """
+    header = dict(header, format_version=FORMAT_VERSION, arrays={})
+    blobs = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        offset = -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        blobs.append((offset, array))
+        offset += array.nbytes
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Pad the header so the data section starts aligned as well
+    prefix = len(MAGIC) + 8
+    data_start = -(-(prefix + len(header_bytes)) // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+    header_bytes += b' ' * (data_start - prefix - len(header_bytes))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).astype('<u8').tobytes())
+        f.write(header_bytes)
+        for array_offset, array in blobs:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_model_file(path, mmap=True):
+    """
+    Reads a model file written by save_model().
+
+    Parameters:
+    - path (str): Model file.
+    - mmap (bool): Memory-map the arrays read-only instead of reading them into memory.
+
+    Returns:
+    - (dict, dict): The JSON header and name -> array.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compact model file.")
+        header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_len))
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version: {header.get('format_version')}")
+
+    data_start = len(MAGIC) + 8 + header_len
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + spec['offset'],
+                                     shape=shape)
+        else:
+            count = int(np.prod(shape))
+            with open(path, 'rb') as f:
+                f.seek(data_start + spec['offset'])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+    return header, arrays
+
+
+# --- 2. Export From scikit-learn ---
+def _export_trees(estimators, n_classes):
+    """
+    Concatenates fitted sklearn trees into flat node arrays. 'children' holds the
+    global (left, right) node index pair of every node; leaves point to themselves,
+    so a walk can run a fixed number of steps.
+    """
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        own = np.arange(tree.node_count) + offset
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([
+            np.where(is_leaf, own, tree.children_left + offset),
+            np.where(is_leaf, own, tree.children_right + offset),
+        ]).astype(np.int32))
+
+        value = tree.value[:, 0, :n_classes]
+        totals = value.sum(axis=1, keepdims=True)
+        values.append(value / np.where(totals > 0, totals, 1.0))
+
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children': np.concatenate(children),
+        'value': np.concatenate(values),
+        'roots': np.array(roots, dtype=np.int32),
+    }
+    return arrays, max_depth
+
+
+def export_sklearn_model(model, path=MODEL_PATH, feature_names=None):
+    """
+    Exports a fitted scikit-learn classifier to the compact format.
+
+    Parameters:
+    - model: Fitted classifier of a supported type, or a Pipeline of an optional
+      StandardScaler followed by one.
+    - path (str): Output file.
+    - feature_names (list): Column names of the feature matrix
+      (e.g. fft_feature_extract.feature_names()).
+
+    Returns:
+    - dict: The written header.
+    """
+    steps = [step for _, step in model.steps] if hasattr(model, 'steps') else [model]
+    scaler, estimator = (steps[0], steps[-1]) if len(steps) == 2 else (None, steps[-1])
+    if len(steps) > 2 or (scaler is not None and type(scaler).__name__ != 'StandardScaler'):
+        raise ValueError("Only a classifier, optionally preceded by a StandardScaler, can be exported.")
+
+    kind = type(estimator).__name__
+    classes = estimator.classes_
+    arrays = {}
+    header = {
+        'estimator': kind,
+        'classes': [c.item() if hasattr(c, 'item') else c for c in classes],
+        'n_features': int(estimator.n_features_in_),
+        'feature_names': list(feature_names) if feature_names is not None else None,
+    }
+
+    if scaler is not None:
+        arrays['scaler_mean'] = np.asarray(scaler.mean_ if scaler.with_mean else
+                                           np.zeros(scaler.n_features_in_), dtype=np.float64)
+        arrays['scaler_scale'] = np.asarray(scaler.scale_ if scaler.with_std else
+                                            np.ones(scaler.n_features_in_), dtype=np.float64)
+
+    if kind in LINEAR_MODELS:
+        header['model_type'] = 'linear'
+        # Binary models may store coef_ as (n_features,); keep it (1, n_features)
+        arrays['coef'] = np.atleast_2d(np.asarray(estimator.coef_, dtype=np.float64))
+        arrays['intercept'] = np.atleast_1d(np.asarray(estimator.intercept_, dtype=np.float64))
+        header['probabilistic'] = kind == 'LogisticRegression'
+    elif kind in TREE_MODELS:
+        header['model_type'] = 'trees'
+        estimators = getattr(estimator, 'estimators_', [estimator])
+        tree_arrays, max_depth = _export_trees(estimators, len(classes))
+        arrays.update(tree_arrays)
+        header['max_depth'] = max_depth
+    else:
+        raise ValueError(f"Unsupported estimator for export: {kind}")
+
+    save_model(path, header, arrays)
+    return header
+
+
+# --- 3. Batched Predictor ---
+class CompactModel:
+    """
+    Pure-NumPy classifier loaded from a compact model file.
+
+    Example:
+        model = load_model()
+        labels = model.predict(features)         # features: (N_windows, n_features)
+    """
+
+    def __init__(self, header, arrays):
+        self.header = header
+        self.arrays = arrays
+        self.model_type = header['model_type']
+        self.classes = np.array(header['classes'])
+        self.n_features = header['n_features']
+        self.feature_names = header.get('feature_names')
+
+        if self.model_type == 'linear' and 'scaler_mean' in arrays:
+            # Fold the scaler into the weights: ((X - mean) / scale) @ coef.T == X @ w.T + b
+            coef = arrays['coef'] / arrays['scaler_scale']
+            self._coef_t = np.ascontiguousarray(coef.T)
+            self._intercept = arrays['intercept'] - coef @ arrays['scaler_mean']
+        elif self.model_type == 'linear':
+            self._coef_t = np.asarray(arrays['coef']).T
+            self._intercept = np.asarray(arrays['intercept'])
+
+    def _prepare(self, features):
+        features = np.asarray(features)
+        if features.ndim != 2 or features.shape[1] != self.n_features:
+            raise ValueError(f"Expected features of shape (N, {self.n_features}), got {features.shape}.")
+        if self.model_type == 'trees' and 'scaler_mean' in self.arrays:
+            features = (features - self.arrays['scaler_mean']) / self.arrays['scaler_scale']
+        return features
+
+    def _scores(self, features):
+        return self._prepare(features) @ self._coef_t + self._intercept
+
+    def decision_function(self, features):
+        """
+        Linear models only: class scores X @ coef.T + intercept, shape (N, n_classes)
+        (or (N,) for binary models).
+        """
+        if self.model_type != 'linear':
+            raise ValueError("decision_function is only available for linear models.")
+        scores = self._scores(features)
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+    def _tree_proba(self, features):
+        # sklearn trees compare float32 features against float64 thresholds
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        a = self.arrays
+        feature, threshold, value = a['feature'], a['threshold'], a['value']
+        children = a['children'].reshape(-1)
+        roots = np.asarray(a['roots'], dtype=np.intp)
+        n_trees = len(roots)
+        proba = np.empty((len(features), value.shape[1]), dtype=np.float64)
+
+        for start in range(0, len(features), PREDICT_BATCH_SIZE):
+            batch = features[start:start + PREDICT_BATCH_SIZE]
+            n = len(batch)
+            flat = batch.reshape(-1)
+            # Walk every (row, tree) pair down one level per step; the comparison
+            # result (0 = left, 1 = right) indexes into the children pairs
+            row_offset = np.repeat(np.arange(n, dtype=np.intp) * self.n_features, n_trees)
+            node = np.tile(roots, n)
+            for _ in range(self.header['max_depth']):
+                x = np.take(flat, row_offset + np.take(feature, node))
+                node = np.take(children, 2 * node + (x > np.take(threshold, node)))
+            proba[start:start + n] = np.take(value, node, axis=0).reshape(n, n_trees, -1).mean(axis=1)
+        return proba
+
+    def predict_proba(self, features):
+        """
+        Class probabilities, shape (N, n_classes) in the order of self.classes.
+        Available for tree ensembles and logistic regression.
+        """
+        features = self._prepare(features)
+        if self.model_type == 'trees':
+            return self._tree_proba(features)
+        if not self.header.get('probabilistic'):
+            raise ValueError(f"{self.header['estimator']} does not provide probabilities.")
+
+        scores = features @ self._coef_t + self._intercept
+        if scores.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        """
+        Class labels for every row of an (N_windows, n_features) matrix, in one call.
+        """
+        if self.model_type == 'trees':
+            return self.classes[np.argmax(self.predict_proba(features), axis=1)]
+
+        scores = self.decision_function(features)
+        if scores.ndim == 1:
+            return self.classes[(scores > 0).astype(np.intp)]
+        return self.classes[np.argmax(scores, axis=1)]
+
+
+def load_model(path=MODEL_PATH, mmap=True):
+    """
+    Loads a compact model file.
+
+    Parameters:
+    - path (str): Model file written by export_sklearn_model().
+    - mmap (bool): Memory-map the weights (shared between processes).
+
+    Returns:
+    - CompactModel
+    """
+    header, arrays = read_model_file(path, mmap=mmap)
+    return CompactModel(header, arrays)
+
+
+if __name__ == '__main__':
+    # --- Example: export a forest trained on random features and compare with sklearn ---
+    import tempfile
+
+    from sklearn.ensemble import RandomForestClassifier
+
+    sys.path.append(os.path.dirname(__file__))
+    from fft_feature_extract import feature_names
+
+    names = feature_names()
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, len(names))).astype(np.float32)
+    y = np.array(['drill', 'grinder', 'saw'])[np.argmax(X[:, :3] + 0.5 * rng.normal(size=(5000, 3)), axis=1)]
+
+    forest = RandomForestClassifier(n_estimators=50, max_depth=12, random_state=0).fit(X, y)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tool_model.npmodel')
+        export_sklearn_model(forest, path, feature_names=names)
+        model = load_model(path)
+        print("--- Compact Tool Model ---")
+        print(f"File size: {os.path.getsize(path) / 1024:.1f} kB, classes: {model.classes.tolist()}")
+        print(f"Predictions identical to sklearn: {np.array_equal(model.predict(X), forest.predict(X))}")
+        print(f"Max |proba diff|: {np.abs(model.predict_proba(X) - forest.predict_proba(X)).max():.2e}")
+        del model
@@ -1 +1,514 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import numpy as np
+import pandas as pd
+
+# Pool workers never display plots; keep matplotlib off any GUI backend
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# ==============================================================================
+# VALIDATION ENGINE: validation_script.py
+# Purpose: Sweeps the preprocessing and ON/OFF parameters over all recordings
+#          and scores every configuration with leave-one-recording-out (LORO)
+#          cross-validation on a process pool.
+#
+# Sweep structure (upstream results are shared, never recomputed):
+#   (recording, CUTOFF_FREQ, ORDER)      -> one high-pass filtered signal
+#       x ON/OFF thresholds              -> exposure time + latency per config
+#       x (WINDOW_SIZE, OVERLAP_RATIO)   -> FFT feature matrix (cached on disk)
+#   (CUTOFF_FREQ, ORDER, WINDOW, OVERLAP) -> LORO tool-type classification
+#
+# Ground truth: noise_* recordings are OFF throughout; other recordings need a
+# sidecar <recording>.onoff.json {"on_intervals_s": [[start, stop], ...]}.
+# Without raw recordings, synthetic streams with known tool bursts are used.
+# Results go to 04_validation/results/<run name>/.
+# Usage:   python signal/04_validation/validation_script.py [--grid grid.json] [--workers N]
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '02_preprocessing', 'scripts'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '03_classifiers', 'on_off'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '03_classifiers', 'tool_type'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+
+from highpass_filter import StreamingHighpassFilter
+from segmentation import create_overlapping_windows
+from onoff_model import DEFAULT_THRESHOLDS, OnOffDetector, synthetic_tool_stream
+from fft_feature_extract import extract_fft_features
+from preprocess_pipeline import RAW_DATA_PATH, find_recordings
+from recording_cache import CACHE_DIR, cache_key, load_recording_arrays
+
+# --- 1. Validation Constants ---
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results')
+FEATURE_CACHE_DIR = os.path.join(RESULTS_PATH, '.cache')
+LABELS_SUFFIX = '.onoff.json'
+NOISE_PREFIX = 'noise_'
+
+# Default sweep; any key can be overridden with --grid <json file>
+SWEEP_GRID = {
+    'cutoff': [1.0, 5.0, 10.0],
+    'order': [2, 4],
+    'window_size': [64, 128],
+    'overlap_ratio': [0.5, 0.75],
+    'on_threshold': [0.5, 1.0, 2.0],
+    'off_threshold': [0.25, 0.5, 1.0],
+    'rms_window_ms': [20.0, 50.0],
+    'min_on_ms': [12.0],
+    'min_off_ms': [12.0],
+}
+UPSTREAM_KEYS = ['cutoff', 'order']
+WINDOW_KEYS = ['window_size', 'overlap_ratio']
+DETECTOR_KEYS = ['on_threshold', 'off_threshold', 'rms_window_ms', 'min_on_ms', 'min_off_ms']
+
+# A detected transition counts for a true edge if it is confirmed within this delay
+MAX_MATCH_DELAY_S = 2.0
+# Trees of the LORO tool-type classifier
+CV_N_ESTIMATORS = 20
+
+
+def expand_grid(grid, keys):
+    """
+    All combinations of grid[key] for the given keys, as a list of dicts.
+    """
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def detector_configs(grid):
+    """
+    ON/OFF threshold combinations; pairs with off_threshold > on_threshold are skipped.
+    """
+    return [c for c in expand_grid(grid, DETECTOR_KEYS) if c['off_threshold'] <= c['on_threshold']]
+
+
+def config_id(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+
+
+# --- 2. Recordings and Ground Truth ---
+def load_on_intervals(file_path, class_name):
+    """
+    True ON intervals (s) of a recording: [] for noise classes, the sidecar labels
+    otherwise, or None if a tool recording has no labels.
+    """
+    if class_name.startswith(NOISE_PREFIX):
+        return []
+    labels_path = os.path.splitext(file_path)[0] + LABELS_SUFFIX
+    if not os.path.isfile(labels_path):
+        return None
+    with open(labels_path, 'r') as f:
+        return [list(map(float, interval)) for interval in json.load(f)['on_intervals_s']]
+
+
+def discover_validation_recordings(raw_dir=RAW_DATA_PATH, cache_dir=CACHE_DIR):
+    """
+    Recordings of every class folder, with ground truth where available.
+
+    Returns:
+    - list: Dicts (name, class_name, file, key, on_intervals).
+    """
+    recordings = []
+    for class_name in sorted(os.listdir(raw_dir)):
+        if not os.path.isdir(os.path.join(raw_dir, class_name)):
+            continue
+        for file_path in find_recordings(class_name, raw_dir):
+            recordings.append({
+                'name': f"{class_name}/{os.path.basename(file_path)}",
+                'class_name': class_name,
+                'file': file_path,
+                'key': cache_key(file_path, cache_dir),
+                'on_intervals': load_on_intervals(file_path, class_name),
+            })
+    return recordings
+
+
+def synthetic_recordings(n_per_class=4, fs=833.0, duration_s=30.0):
+    """
+    Synthetic stand-ins with known ON intervals: tool recordings with random bursts
+    (drill 70 Hz, grinder 140 Hz) and noise recordings without tool vibration.
+    """
+    recordings = []
+    rng = np.random.default_rng(0)
+    classes = [('noise_walking', None), ('tool_drill', 70.0), ('tool_grinder', 140.0)]
+    for c, (class_name, tool_freq) in enumerate(classes):
+        for i in range(n_per_class):
+            bursts = []
+            if tool_freq is not None:
+                starts = np.sort(rng.uniform(1.0, duration_s - 4.0, 3))
+                bursts = [[float(s), float(min(s + rng.uniform(0.5, 3.0), duration_s))] for s in starts]
+                # Merge overlapping bursts so the truth is a clean interval list
+                merged = [bursts[0]]
+                for start, stop in bursts[1:]:
+                    if start <= merged[-1][1]:
+                        merged[-1][1] = max(merged[-1][1], stop)
+                    else:
+                        merged.append([start, stop])
+                bursts = merged
+            recordings.append({
+                'name': f"{class_name}/synthetic_{i}",
+                'class_name': class_name,
+                'file': None,
+                'key': f"synthetic-{class_name}-{i}-{fs:g}-{duration_s:g}",
+                'on_intervals': bursts,
+                'synthetic': {'duration_s': duration_s, 'fs': fs, 'tool_freq': tool_freq or 70.0,
+                              'amplitude': 5.0 if tool_freq else 0.0, 'seed': c * n_per_class + i},
+            })
+    return recordings
+
+
+def load_signal(recording, cache_dir=CACHE_DIR):
+    """
+    Returns (acc (N, 3) float64, fs) of a recording.
+    """
+    if recording['file'] is None:
+        spec = recording['synthetic']
+        bursts = recording['on_intervals'] if spec['amplitude'] else []
+        acc = synthetic_tool_stream(spec['duration_s'], spec['fs'], bursts, spec['amplitude'] or 5.0,
+                                    spec['tool_freq'], spec['seed'])
+        return acc, spec['fs']
+    arrays = load_recording_arrays(recording['file'], cache_dir=cache_dir, verbose=False)
+    return np.asarray(arrays['acc'], dtype=np.float64), float(arrays['meta']['estimated_fs'])
+
+
+# --- 3. Metrics ---
+def truth_edges(on_intervals):
+    """
+    (time_s, state) of every true transition, in time order.
+    """
+    edges = []
+    for start, stop in on_intervals:
+        edges.append((start, True))
+        edges.append((stop, False))
+    return edges
+
+
+def onoff_metrics(detector, events, on_intervals, duration_s):
+    """
+    Exposure-time error and measured latency of one detector run on one recording.
+    """
+    detected_on_s = float(detector.on_time_s[0])
+    row = {
+        'detected_on_s': detected_on_s,
+        'n_transitions': len(events),
+        'theoretical_latency_ms': detector.latency_ms,
+    }
+    if on_intervals is None:
+        return row
+
+    true_on_s = float(sum(stop - start for start, stop in on_intervals))
+    detected_s = events['detected_index'] / detector.fs
+    latencies = []
+    missed = 0
+    for edge_s, state in truth_edges(on_intervals):
+        if edge_s >= duration_s:
+            continue
+        match = np.flatnonzero((events['state'] == state) & (detected_s >= edge_s)
+                               & (detected_s <= edge_s + MAX_MATCH_DELAY_S))
+        if len(match):
+            latencies.append((detected_s[match[0]] - edge_s) * 1000.0)
+        else:
+            missed += 1
+    n_edges = len(latencies) + missed
+    row.update(
+        true_on_s=true_on_s,
+        exposure_error_s=detected_on_s - true_on_s,
+        abs_exposure_error_s=abs(detected_on_s - true_on_s),
+        exposure_error_pct=100.0 * (detected_on_s - true_on_s) / true_on_s if true_on_s > 0 else np.nan,
+        latency_median_ms=float(np.median(latencies)) if latencies else np.nan,
+        latency_max_ms=float(np.max(latencies)) if latencies else np.nan,
+        missed_edges=missed,
+        # Transitions that matched no true edge (chatter or false ON)
+        spurious_transitions=max(0, len(events) - (n_edges - missed)),
+    )
+    return row
+
+
+# --- 4. Workers ---
+def classifier_window_mask(n_windows, window_size, step, fs, on_intervals, class_name):
+    """
+    Windows the tool-type classifier is scored on: all windows of noise recordings
+    and of unlabelled tool recordings, only fully-ON windows of labelled ones (the
+    classifier runs while the ON/OFF detector reports ON).
+    """
+    if class_name.startswith(NOISE_PREFIX) or on_intervals is None:
+        return np.ones(n_windows, dtype=bool)
+    starts = np.arange(n_windows) * step / fs
+    stops = starts + window_size / fs
+    mask = np.zeros(n_windows, dtype=bool)
+    for start, stop in on_intervals:
+        mask |= (starts >= start) & (stops <= stop)
+    return mask
+
+
+def feature_cache_path(recording, upstream, window, cache_dir):
+    # The truth decides which windows are kept (classifier_window_mask)
+    config = dict(upstream, **window, recording=recording['key'], on_intervals=recording['on_intervals'])
+    return os.path.join(cache_dir, f"features-{config_id(config)}.npy")
+
+
+def run_upstream_task(recording, upstream, detectors, windows, feature_cache_dir, cache_dir=CACHE_DIR):
+    """
+    Worker for one (recording, cutoff, order) pair: filters the recording once, then
+    evaluates every ON/OFF configuration and writes the feature matrix of every
+    window configuration (classifier windows only; skipped if already cached).
+
+    Returns:
+    - dict: 'onoff' metric rows and 'features' {window config id: (path, n_windows)}.
+    """
+    acc, fs = load_signal(recording, cache_dir)
+    duration_s = len(acc) / fs
+    filtered = StreamingHighpassFilter(upstream['cutoff'], fs, upstream['order']).process(acc)
+
+    rows = []
+    for config in detectors:
+        thresholds = dict(DEFAULT_THRESHOLDS, fs=fs, highpass_cutoff_hz=upstream['cutoff'],
+                          highpass_order=upstream['order'], **config)
+        detector = OnOffDetector(thresholds)
+        events = detector.process_filtered(filtered[None])
+        row = {'recording': recording['name'], 'class_name': recording['class_name'],
+               'config_id': config_id(dict(upstream, **config))}
+        row.update(upstream)
+        row.update(config)
+        row.update(onoff_metrics(detector, events, recording['on_intervals'], duration_s))
+        rows.append(row)
+
+    features = {}
+    for window in windows:
+        path = feature_cache_path(recording, upstream, window, feature_cache_dir)
+        if not os.path.isfile(path):
+            step = max(1, int(window['window_size'] * (1.0 - window['overlap_ratio'])))
+            windowed = create_overlapping_windows(filtered, window['window_size'], step)
+            mask = classifier_window_mask(len(windowed), window['window_size'], step, fs,
+                                          recording['on_intervals'], recording['class_name'])
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, extract_fft_features(windowed[mask], fs))
+            os.replace(tmp_path, path)
+        features[config_id(window)] = path
+    return {'onoff': rows, 'features': features}
+
+
+def run_tooltype_cv_task(config, recordings, paths, n_estimators=CV_N_ESTIMATORS):
+    """
+    Worker: leave-one-recording-out tool-type classification for one
+    (cutoff, order, window_size, overlap_ratio) configuration.
+
+    Returns:
+    - dict: Configuration plus window accuracy and per-recording majority-vote accuracy.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+
+    class_names = sorted({r['class_name'] for r in recordings})
+    features = [np.load(path) for path in paths]
+    labels = [np.full(len(f), class_names.index(r['class_name'])) for f, r in zip(features, recordings)]
+
+    n_correct = 0
+    n_total = 0
+    n_recordings_correct = 0
+    for held_out in range(len(recordings)):
+        train = [i for i in range(len(recordings)) if i != held_out and len(features[i])]
+        if not len(features[held_out]) or len({recordings[i]['class_name'] for i in train}) < 2:
+            continue
+        model = RandomForestClassifier(n_estimators=n_estimators, min_samples_leaf=5, random_state=0, n_jobs=1)
+        model.fit(np.concatenate([features[i] for i in train]), np.concatenate([labels[i] for i in train]))
+        predicted = model.predict(features[held_out])
+        n_correct += int(np.sum(predicted == labels[held_out]))
+        n_total += len(predicted)
+        n_recordings_correct += int(np.bincount(predicted).argmax() == labels[held_out][0])
+
+    n_folds = sum(1 for f in features if len(f))
+    return dict(config, config_id=config_id(config), n_windows=n_total,
+                window_accuracy=n_correct / n_total if n_total else np.nan,
+                recording_accuracy=n_recordings_correct / n_folds if n_folds else np.nan)
+
+
+# --- 5. Cross-Validation of the ON/OFF Configuration ---
+def loro_threshold_cv(onoff_table):
+    """
+    Leave-one-recording-out selection of the ON/OFF configuration: for every labelled
+    recording, the configuration with the lowest mean absolute exposure error on the
+    other recordings is chosen and scored on the held-out one.
+
+    Returns:
+    - pd.DataFrame: One row per fold (held-out recording, chosen config, its errors).
+    """
+    labelled = onoff_table.dropna(subset=['abs_exposure_error_s'])
+    errors = labelled.pivot_table(index='config_id', columns='recording', values='abs_exposure_error_s')
+    folds = []
+    for held_out in errors.columns:
+        others = errors.drop(columns=held_out)
+        if others.shape[1] == 0:
+            continue
+        chosen = others.mean(axis=1).idxmin()
+        row = labelled[(labelled['config_id'] == chosen) & (labelled['recording'] == held_out)].iloc[0]
+        folds.append({
+            'held_out': held_out,
+            'chosen_config_id': chosen,
+            'train_mean_abs_error_s': float(others.loc[chosen].mean()),
+            'test_abs_error_s': float(row['abs_exposure_error_s']),
+            'test_error_pct': float(row['exposure_error_pct']),
+            'test_latency_median_ms': float(row['latency_median_ms']),
+        })
+    return pd.DataFrame(folds)
+
+
+def summarize_onoff(onoff_table):
+    """
+    Per-configuration aggregate over recordings.
+    """
+    keys = ['config_id'] + UPSTREAM_KEYS + DETECTOR_KEYS
+    noise = onoff_table['class_name'].str.startswith(NOISE_PREFIX)
+    table = onoff_table.assign(false_on_s=np.where(noise, onoff_table['detected_on_s'], np.nan))
+    summary = table.groupby(keys, as_index=False).agg(
+        mean_abs_exposure_error_s=('abs_exposure_error_s', 'mean'),
+        max_abs_exposure_error_s=('abs_exposure_error_s', 'max'),
+        mean_exposure_error_pct=('exposure_error_pct', 'mean'),
+        false_on_s=('false_on_s', 'sum'),
+        latency_median_ms=('latency_median_ms', 'median'),
+        latency_max_ms=('latency_max_ms', 'max'),
+        theoretical_latency_ms=('theoretical_latency_ms', 'first'),
+        missed_edges=('missed_edges', 'sum'),
+        spurious_transitions=('spurious_transitions', 'sum'),
+    )
+    return summary.sort_values('mean_abs_exposure_error_s').reset_index(drop=True)
+
+
+# --- 6. Engine ---
+def run_validation(recordings=None, grid=None, workers=None, results_dir=RESULTS_PATH, run_name=None,
+                   feature_cache_dir=FEATURE_CACHE_DIR, cache_dir=CACHE_DIR, tool_type_cv=True):
+    """
+    Runs the full sweep and writes the results.
+
+    Parameters:
+    - recordings (list): From discover_validation_recordings() / synthetic_recordings()
+      (default: raw recordings, or synthetic ones if there are none).
+    - grid (dict): Sweep values per parameter (default: SWEEP_GRID).
+    - workers (int): Worker processes (default: all cores).
+    - results_dir (str): Parent folder of the run folder.
+    - run_name (str): Run folder name (default: sweep_<timestamp>).
+    - feature_cache_dir (str): Feature matrices shared between runs.
+    - cache_dir (str): Recording cache.
+    - tool_type_cv (bool): Also run the LORO tool-type classification (needs scikit-learn).
+
+    Returns:
+    - dict: DataFrames 'onoff' (per config and recording), 'onoff_summary',
+      'onoff_cv' and 'tooltype_cv', plus 'run_dir'.
+    """
+    grid = dict(SWEEP_GRID, **(grid or {}))
+    if recordings is None:
+        recordings = discover_validation_recordings(cache_dir=cache_dir)
+        if not recordings:
+            print(f"No recordings in {RAW_DATA_PATH}; using synthetic recordings.")
+            recordings = synthetic_recordings()
+    run_dir = os.path.join(results_dir, run_name or time.strftime('sweep_%Y%m%dT%H%M%S'))
+    os.makedirs(run_dir, exist_ok=True)
+    os.makedirs(feature_cache_dir, exist_ok=True)
+
+    upstreams = expand_grid(grid, UPSTREAM_KEYS)
+    windows = expand_grid(grid, WINDOW_KEYS)
+    detectors = detector_configs(grid)
+    n_labelled = sum(r['on_intervals'] is not None for r in recordings)
+    print(f"{len(recordings)} recordings ({n_labelled} with ON/OFF truth), {len(upstreams)} filter x "
+          f"{len(detectors)} threshold x {len(windows)} window configurations")
+
+    start = time.perf_counter()
+    onoff_rows = []
+    feature_paths = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Stage 1: one task per (recording, filter); thresholds and windows reuse its output
+        futures = {
+            pool.submit(run_upstream_task, recording, upstream, detectors, windows, feature_cache_dir, cache_dir):
+                (r, u)
+            for r, recording in enumerate(recordings) for u, upstream in enumerate(upstreams)
+        }
+        for future in as_completed(futures):
+            r, u = futures[future]
+            result = future.result()
+            onoff_rows.extend(result['onoff'])
+            for window_id, path in result['features'].items():
+                feature_paths[(u, window_id, r)] = path
+        stage1_s = time.perf_counter() - start
+
+        # Stage 2: one LORO classification task per (filter, window) configuration
+        tooltype_rows = []
+        if tool_type_cv and len({r['class_name'] for r in recordings}) >= 2:
+            try:
+                import sklearn  # noqa: F401 (only checked here; imported in the workers)
+            except ImportError:
+                print("scikit-learn is not installed; skipping the tool-type cross-validation.")
+            else:
+                futures = []
+                for u, upstream in enumerate(upstreams):
+                    for window in windows:
+                        paths = [feature_paths[(u, config_id(window), r)] for r in range(len(recordings))]
+                        futures.append(pool.submit(run_tooltype_cv_task, dict(upstream, **window), recordings, paths))
+                tooltype_rows = [future.result() for future in as_completed(futures)]
+
+    onoff = pd.DataFrame(onoff_rows).sort_values(['config_id', 'recording']).reset_index(drop=True)
+    results = {
+        'onoff': onoff,
+        'onoff_summary': summarize_onoff(onoff) if n_labelled else pd.DataFrame(),
+        'onoff_cv': loro_threshold_cv(onoff) if n_labelled >= 2 else pd.DataFrame(),
+        'tooltype_cv': (pd.DataFrame(tooltype_rows).sort_values('window_accuracy', ascending=False)
+                        .reset_index(drop=True) if tooltype_rows else pd.DataFrame()),
+        'run_dir': run_dir,
+    }
+    wall_s = time.perf_counter() - start
+
+    # --- 7. Write Results ---
+    for name in ['onoff', 'onoff_summary', 'onoff_cv', 'tooltype_cv']:
+        if len(results[name]):
+            results[name].to_csv(os.path.join(run_dir, f'{name}.csv'), index=False)
+    with open(os.path.join(run_dir, 'run.json'), 'w') as f:
+        json.dump({
+            'grid': grid,
+            'recordings': [{k: r[k] for k in ('name', 'class_name', 'key', 'on_intervals')} for r in recordings],
+            'n_onoff_configs': len(upstreams) * len(detectors),
+            'n_tooltype_configs': len(upstreams) * len(windows),
+            'stage1_time_s': stage1_s,
+            'wall_time_s': wall_s,
+        }, f, indent=2)
+
+    print(f"Sweep finished in {wall_s:.1f} s; results in {run_dir}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep with leave-one-recording-out CV.")
+    parser.add_argument('--grid', default=None, help="JSON file overriding SWEEP_GRID entries.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument('--run-name', default=None, help="Results sub-folder (default: sweep_<timestamp>).")
+    parser.add_argument('--synthetic', action='store_true', help="Use synthetic recordings only.")
+    parser.add_argument('--no-tooltype', action='store_true', help="Skip the tool-type cross-validation.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    grid = None
+    if args.grid:
+        with open(args.grid, 'r') as f:
+            grid = json.load(f)
+    results = run_validation(
+        recordings=synthetic_recordings() if args.synthetic else None,
+        grid=grid,
+        workers=args.workers,
+        run_name=args.run_name,
+        tool_type_cv=not args.no_tooltype,
+    )
+
+    pd.set_option('display.width', 160)
+    if len(results['onoff_summary']):
+        print("\n--- Best ON/OFF configurations (mean |exposure error|) ---")
+        print(results['onoff_summary'].head(5)[['cutoff', 'order'] + DETECTOR_KEYS + [
+            'mean_abs_exposure_error_s', 'false_on_s', 'latency_median_ms']].to_string(index=False))
+    if len(results['onoff_cv']):
+        print(f"\nLORO CV: held-out |exposure error| {results['onoff_cv']['test_abs_error_s'].mean():.3f} s "
+              f"over {len(results['onoff_cv'])} folds")
+    if len(results['tooltype_cv']):
+        print("\n--- Tool-type LORO accuracy ---")
+        print(results['tooltype_cv'].head(5).to_string(index=False))
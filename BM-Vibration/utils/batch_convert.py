@@ -0,0 +1,243 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Batch workers never display plots; keep matplotlib off any GUI backend
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# ==============================================================================
+# BATCH CONVERSION: batch_convert.py
+# Purpose: Non-interactive counterpart of the loader_vizualizer_FFT_Welch.py menu.
+#          Converts every Movesense stream in a folder over a process pool
+#          (load -> check_signal_quality -> export) and writes a JSON summary.
+# Usage:   python utils/batch_convert.py [data_dir] [--workers N] [--csv] [--force]
+# ==============================================================================
+
+sys.path.append(os.path.dirname(__file__))
+
+from loader_vizualizer_FFT_Welch import check_signal_quality, save_to_csv
+from recording_cache import CACHE_DIR, META_FILE, load_recording, load_recording_arrays, parse_recording_name
+
+# --- 1. Batch Constants ---
+DEFAULT_DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+DEFAULT_PATTERN = '*_acc_stream.json'
+DEFAULT_NOMINAL_FS = 833.0
+SUMMARY_FILE = 'batch_summary.json'
+
+
+def discover_recordings(data_dir, pattern=DEFAULT_PATTERN):
+    """
+    Returns the recordings in data_dir matching pattern, largest first so the
+    longest jobs start early and the pool stays balanced.
+    """
+    files = [
+        os.path.join(data_dir, name)
+        for name in os.listdir(data_dir)
+        if fnmatch.fnmatch(name, pattern)
+    ]
+    return sorted(files, key=os.path.getsize, reverse=True)
+
+
+def _csv_path(file_path, out_dir):
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(out_dir, f"processed_{base_name}.csv")
+
+
+def is_up_to_date(record, file_path, nominal_fs, export_csv, out_dir, cache_dir):
+    """
+    True if a previous summary record still describes the current source file, was
+    made with the same nominal Fs, and all requested outputs (cache entry included)
+    exist.
+    """
+    if record is None or record.get('status') != 'ok':
+        return False
+    stat = os.stat(file_path)
+    if record.get('mtime_ns') != stat.st_mtime_ns or record.get('size') != stat.st_size:
+        return False
+    if record.get('nominal_fs') != nominal_fs:
+        return False
+    # The cache entry may have been evicted since
+    key = record.get('cache_key')
+    if key is None or not os.path.isfile(os.path.join(cache_dir, key, META_FILE)):
+        return False
+    if export_csv and not os.path.isfile(_csv_path(file_path, out_dir)):
+        return False
+    return True
+
+
+def convert_recording(file_path, nominal_fs, export_csv, out_dir, cache_dir):
+    """
+    Worker: loads one recording through the cache, runs the quality check and exports it.
+
+    Returns:
+    - dict: Summary record (Fs, duration, DC offsets, quality report, per-step timing)
+      for the file.
+    """
+    stat = os.stat(file_path)
+    record = {
+        'file': os.path.basename(file_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'nominal_fs': nominal_fs,
+    }
+    record.update(parse_recording_name(file_path))
+
+    try:
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        arrays = load_recording_arrays(file_path, cache_dir=cache_dir, verbose=False)
+        t1 = time.perf_counter()
+        if arrays is None or len(arrays['timestamp']) == 0:
+            record.update(status='error', error='no valid acc data')
+            return record
+
+        # Quality pass straight over the memory-mapped arrays (no DataFrame needed)
+        report = check_signal_quality(arrays, nominal_fs, verbose=False)
+        t2 = time.perf_counter()
+
+        if export_csv:
+            save_to_csv(load_recording(file_path, cache_dir=cache_dir, verbose=False), file_path, out_dir)
+        t3 = time.perf_counter()
+
+        record.update(
+            status='ok',
+            cache_key=arrays['meta']['key'],
+            n_samples=report.n_samples,
+            effective_fs=report.effective_fs,
+            fs_deviation_pct=report.fs_deviation_pct,
+            duration_s=report.duration_s,
+            dc_offset=report.dc_offset,
+            magnitude_mean=report.magnitude['mean'],
+            quality=report.to_dict(),
+            timing_s={
+                'load': t1 - t0,
+                'quality': t2 - t1,
+                'export': t3 - t2,
+                'total': t3 - t0,
+                # CPU time of this worker process (time spent waiting on disk is not in it)
+                'cpu': time.process_time() - cpu0,
+            },
+        )
+    except Exception as e:
+        # Report the failure in the summary instead of aborting the whole batch
+        record.update(status='error', error=f"{type(e).__name__}: {e}")
+    return record
+
+
+def run_batch(data_dir=DEFAULT_DATA_DIR, pattern=DEFAULT_PATTERN, workers=None,
+              nominal_fs=DEFAULT_NOMINAL_FS, export_csv=False, out_dir=None,
+              summary_path=None, cache_dir=CACHE_DIR, force=False):
+    """
+    Converts every matching recording in data_dir over a process pool.
+
+    Files whose record in the previous summary still matches (same mtime, size and
+    nominal Fs, cache entry and outputs present) are skipped unless force=True.
+
+    Returns:
+    - dict: The summary written to summary_path.
+    """
+    out_dir = out_dir or data_dir
+    summary_path = summary_path or os.path.join(out_dir, SUMMARY_FILE)
+    os.makedirs(out_dir, exist_ok=True)
+
+    previous = {}
+    if not force and os.path.isfile(summary_path):
+        with open(summary_path, 'r') as f:
+            previous = {rec['file']: rec for rec in json.load(f).get('files', [])}
+
+    files = discover_recordings(data_dir, pattern)
+    records = {}
+    todo = []
+    for path in files:
+        name = os.path.basename(path)
+        if is_up_to_date(previous.get(name), path, nominal_fs, export_csv, out_dir, cache_dir):
+            records[name] = dict(previous[name], skipped=True)
+        else:
+            todo.append(path)
+
+    print(f"Found {len(files)} recordings: {len(todo)} to convert, "
+          f"{len(files) - len(todo)} up to date.")
+
+    start = time.perf_counter()
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(convert_recording, path, nominal_fs, export_csv, out_dir, cache_dir)
+                for path in todo
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                records[record['file']] = dict(record, skipped=False)
+                status = record['status']
+                detail = (f"Fs={record['effective_fs']:.1f} Hz, {record['timing_s']['total']:.3f} s"
+                          if status == 'ok' else record['error'])
+                print(f"  [{status}] {record['file']} ({detail})")
+    wall_s = time.perf_counter() - start
+
+    converted = [r for r in records.values() if not r['skipped'] and r['status'] == 'ok']
+    summary = {
+        'data_dir': os.path.abspath(data_dir),
+        'pattern': pattern,
+        'nominal_fs': nominal_fs,
+        'workers': workers or os.cpu_count(),
+        'n_files': len(files),
+        'n_converted': len(converted),
+        'n_skipped': sum(r['skipped'] for r in records.values()),
+        'n_errors': sum(r['status'] != 'ok' for r in records.values()),
+        'wall_time_s': wall_s,
+        # Summed per-file wall time of the workers vs. their measured CPU time
+        'worker_time_s': sum(r['timing_s']['total'] for r in converted),
+        'cpu_time_s': sum(r['timing_s']['cpu'] for r in converted),
+        'files': sorted(records.values(), key=lambda r: r['file']),
+    }
+
+    if summary_path == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to: {summary_path} (wall time {wall_s:.2f} s)")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-convert Movesense recordings.")
+    parser.add_argument('data_dir', nargs='?', default=DEFAULT_DATA_DIR,
+                        help="Folder with Movesense JSON files (default: BM-Vibration/data).")
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN,
+                        help=f"File name pattern (default: {DEFAULT_PATTERN}).")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (default: all cores).")
+    parser.add_argument('--nominal-fs', type=float, default=DEFAULT_NOMINAL_FS,
+                        help=f"Nominal sampling frequency in Hz (default: {DEFAULT_NOMINAL_FS}).")
+    parser.add_argument('--csv', action='store_true',
+                        help="Also export processed_<name>.csv for each recording.")
+    parser.add_argument('--out-dir', default=None,
+                        help="Folder for CSV exports and the summary (default: data_dir).")
+    parser.add_argument('--summary', default=None,
+                        help=f"Summary path, or '-' for stdout (default: <out-dir>/{SUMMARY_FILE}).")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Binary cache folder.")
+    parser.add_argument('--force', action='store_true',
+                        help="Convert every file, even if it is up to date.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = run_batch(
+        data_dir=args.data_dir,
+        pattern=args.pattern,
+        workers=args.workers,
+        nominal_fs=args.nominal_fs,
+        export_csv=args.csv,
+        out_dir=args.out_dir,
+        summary_path=args.summary,
+        cache_dir=args.cache_dir,
+        force=args.force,
+    )
+    sys.exit(1 if summary['n_errors'] else 0)
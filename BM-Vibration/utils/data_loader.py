@@ -3,137 +3,209 @@ import numpy as np
 import os
 
 #TODO rewite the data loader so it can:
-# 1. read .json files 
+# 1. read .json files
 # 2. parse the specific JSON format returned by Movesense Flash sensor (dictionary-like thingy with timestamp and x,y,z keys)
 # 3. Convert it to the DataFrame format (accel_x, accel_y, accel_z) used by other files in processing pipeline
 # ==============================================================================
 # DATA LOADER UTILITY: data_loader.py
 # Purpose: Load, merge, and organize raw triaxial sensor data and activity labels
 #          from the UCI HAR Dataset (or similar structure).
+#
+# The whitespace text files are parsed once with NumPy and cached as .npy beside
+# them (total_acc_<set>.npy, y_<set>.npy); later loads are memory maps.
 # ==============================================================================
 
 # --- 1. Project Constants (Based on UCI HAR Dataset Structure) ---
 
-# Base path structure where the UCI HAR Dataset folder is located 
+# Base path structure where the UCI HAR Dataset folder is located
 # NOTE: Adjust this BASE_PATH to point to your main project directory.
 BASE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'UCI HAR Dataset')
 
 # Standard column names for the output DataFrame
 COLUMN_NAMES = ['accel_x', 'accel_y', 'accel_z', 'label_id', 'activity_name']
 
+AXES = ['x', 'y', 'z']
 
-def load_activity_labels():
+
+def load_activity_labels(base_path=BASE_PATH):
     """
     Loads the activity name to ID mapping from activity_labels.txt.
-    
+
     Returns:
     - pd.Series: Maps activity ID (int) to name (string).
     """
     # File path for the labels key
-    labels_path = os.path.join(BASE_PATH, 'activity_labels.txt')
-    
+    labels_path = os.path.join(base_path, 'activity_labels.txt')
+
     # Read the file: format is 'ID ACTIVITY_NAME' (e.g., '1 WALKING')
     df_labels = pd.read_csv(labels_path, header=None, sep=' ', names=['id', 'name'])
-    
+
     # Map from ID (index 0) to Name (index 1)
     return df_labels.set_index('id')['name']
 
 
-def load_raw_data_set(set_name='train'):
+def _read_whitespace_matrix(path, dtype=np.float64):
     """
-    Loads raw triaxial acceleration data (total_acc) and links it to activity labels.
-    
+    Parses a whitespace-separated numeric text file into a 2-D array (one row per line).
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    n_rows = sum(1 for line in text.splitlines() if line.strip())
+    values = np.fromstring(text, dtype=dtype, sep=' ')
+    return values.reshape(n_rows, -1)
+
+
+def _is_fresh(cache_path, source_paths):
+    if not os.path.isfile(cache_path):
+        return False
+    cache_mtime = os.path.getmtime(cache_path)
+    return all(os.path.getmtime(path) <= cache_mtime for path in source_paths)
+
+
+def _save_npy_atomic(path, array):
+    """
+    Writes the .npy cache through a temporary file; a read-only dataset folder just
+    means no cache.
+    """
+    tmp_path = path + '.tmp.npy'
+    try:
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_raw_arrays(set_name='train', base_path=BASE_PATH, use_cache=True):
+    """
+    Loads the raw triaxial acceleration windows (total_acc) and their labels as arrays.
+
     Parameters:
     - set_name (str): Either 'train' or 'test'.
-    
+    - base_path (str): UCI HAR Dataset folder.
+    - use_cache (bool): Read / write the .npy cache beside the text files.
+
     Returns:
-    - pd.DataFrame: DataFrame containing merged sensor data and activity names.
+    - dict: 'acc' (n_windows, 128, 3) and 'label_id' (n_windows,) arrays
+      (read-only memory maps when loaded from the cache).
     """
     if set_name not in ['train', 'test']:
         raise ValueError("set_name must be 'train' or 'test'.")
-        
+
     # --- 2. Define File Paths ---
-    set_dir = os.path.join(BASE_PATH, set_name)
+    set_dir = os.path.join(base_path, set_name)
     inertial_dir = os.path.join(set_dir, 'Inertial Signals')
 
     # File names for raw total acceleration signals
-    signal_files = {
-        'accel_x': os.path.join(inertial_dir, f'total_acc_x_{set_name}.txt'),
-        'accel_y': os.path.join(inertial_dir, f'total_acc_y_{set_name}.txt'),
-        'accel_z': os.path.join(inertial_dir, f'total_acc_z_{set_name}.txt'),
-    }
-    
+    signal_files = [os.path.join(inertial_dir, f'total_acc_{axis}_{set_name}.txt') for axis in AXES]
+
     # File names for labels
     label_path = os.path.join(set_dir, f'y_{set_name}.txt')
-    
+
+    acc_cache = os.path.join(inertial_dir, f'total_acc_{set_name}.npy')
+    label_cache = os.path.join(set_dir, f'y_{set_name}.npy')
+
+    if use_cache and _is_fresh(acc_cache, signal_files) and _is_fresh(label_cache, [label_path]):
+        return {
+            'acc': np.load(acc_cache, mmap_mode='r'),
+            'label_id': np.load(label_cache, mmap_mode='r'),
+        }
+
     # --- 3. Load Signals (X, Y, Z) and Labels ---
-    
-    # Read raw signal files. Each file contains columns of time series data.
-    # The data is already formatted such that rows correspond to time-steps/instances.
-    df_x = pd.read_csv(signal_files['accel_x'], header=None, delim_whitespace=True)
-    df_y = pd.read_csv(signal_files['accel_y'], header=None, delim_whitespace=True)
-    df_z = pd.read_csv(signal_files['accel_z'], header=None, delim_whitespace=True)
-    
-    # Read labels (Activity IDs)
-    df_y = pd.read_csv(label_path, header=None, names=['label_id'])
-    
-    # --- 4. Merge Data (Flatten 7352 rows x 128 features to 941056 rows x 3 features) ---
-    
-    # Flatten the time series data for each axis into a single column
-    # For UCI HAR, 7352 rows x 128 features is flattened to 941,056 rows x 1 feature
-    df_x_flat = df_x.stack().reset_index(level=[0, 1], drop=True).rename('accel_x')
-    df_y_flat = df_y.stack().reset_index(level=[0, 1], drop=True).rename('accel_y')
-    df_z_flat = df_z.stack().reset_index(level=[0, 1], drop=True).rename('accel_z')
-    
-    # The label must also be expanded to match the new, flattened length
-    # Repeat each label 128 times (the window size of the UCI HAR features)
-    WINDOW_SIZE_HAR = df_x.shape[1] # 128 features/window in this dataset
-    df_y_flat = df_y.reindex(df_y.index.repeat(WINDOW_SIZE_HAR)).reset_index(drop=True)
-    
-    # Combine all flattened data
-    df_combined = pd.concat([df_x_flat, df_y_flat, df_z_flat, df_y_flat], axis=1)
-    df_combined.columns = ['accel_x', 'accel_y', 'accel_z', 'label_id']
-    
+    # Each signal file holds one window (128 time steps) per row
+    acc = np.stack([_read_whitespace_matrix(path) for path in signal_files], axis=-1)
+    label_id = _read_whitespace_matrix(label_path, dtype=np.int64)[:, 0]
+    if len(label_id) != len(acc):
+        raise ValueError(f"{label_path} has {len(label_id)} labels for {len(acc)} windows.")
+
+    if use_cache:
+        _save_npy_atomic(acc_cache, acc)
+        _save_npy_atomic(label_cache, label_id)
+    return {'acc': acc, 'label_id': label_id}
+
+
+def load_raw_data_set(set_name='train', base_path=BASE_PATH, use_cache=True):
+    """
+    Loads raw triaxial acceleration data (total_acc) and links it to activity labels.
+
+    Parameters:
+    - set_name (str): Either 'train' or 'test'.
+    - base_path (str): UCI HAR Dataset folder.
+    - use_cache (bool): Read / write the .npy cache beside the text files.
+
+    Returns:
+    - pd.DataFrame: DataFrame containing merged sensor data and activity names
+      ('activity_name' is categorical).
+    """
+    arrays = load_raw_arrays(set_name, base_path, use_cache)
+    acc = arrays['acc']
+
+    # --- 4. Merge Data (Flatten 7352 windows x 128 steps to 941056 rows x 3 axes) ---
+    # C-order ravel keeps the time steps of each window together; labels repeat per step
+    window_size_har = acc.shape[1]  # 128 time steps/window in this dataset
+    samples = acc.reshape(-1, 3)
+    label_id = np.repeat(np.asarray(arrays['label_id']), window_size_har)
+
     # --- 5. Link Labels and Activity Names ---
-    activity_map = load_activity_labels()
-    df_combined['activity_name'] = df_combined['label_id'].map(activity_map)
-    
-    return df_combined
+    # One small category table instead of a Python string per row
+    activity_map = load_activity_labels(base_path)
+    lookup = np.full(max(activity_map.index.max(), label_id.max()) + 1, -1, dtype=np.int64)
+    lookup[activity_map.index.values] = np.arange(len(activity_map))
+    activity_name = pd.Categorical.from_codes(lookup[label_id], categories=activity_map.values)
+
+    return pd.DataFrame({
+        'accel_x': samples[:, 0],
+        'accel_y': samples[:, 1],
+        'accel_z': samples[:, 2],
+        'label_id': label_id,
+        'activity_name': activity_name,
+    })
+
+
+def activity_mask(df_combined, activity_names):
+    """
+    Boolean row mask of the given activities, computed on the category codes.
+    """
+    names = df_combined['activity_name']
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        wanted = np.flatnonzero(names.cat.categories.isin(activity_names))
+        return np.isin(names.cat.codes.values, wanted)
+    return names.isin(activity_names).values
 
 
 def filter_activities(df_combined, activity_names):
     """
     Filters the combined DataFrame to include only the specified list of activities.
-    
+
     Parameters:
     - df_combined (pd.DataFrame): Output from load_raw_data_set.
     - activity_names (list): List of activity names (strings) to keep.
-    
+
     Returns:
-    - pd.DataFrame: Filtered DataFrame.
+    - pd.DataFrame: Filtered DataFrame (boolean-mask selection, no extra copy).
     """
-    return df_combined[df_combined['activity_name'].isin(activity_names)].copy()
+    return df_combined[activity_mask(df_combined, activity_names)]
 
 
 if __name__ == '__main__':
     # --- Demonstration: Load and Filter ONLY Walking Data (Your Noise) ---
-    
+
     print("--- Running Data Loader Demonstration ---")
-    
+
     # 1. Load the full raw training set
     df_raw_full = load_raw_data_set(set_name='train')
-    
+
     print(f"Total rows loaded: {len(df_raw_full):,}")
     print(f"Unique activities found: {df_raw_full['activity_name'].unique()}")
     print("-" * 40)
-    
+
     # 2. Filter the data to include ONLY the Noise Data required for filtering experiments
     NOISE_ACTIVITIES = ['WALKING', 'WALKING_UPSTAIRS', 'WALKING_DOWNSTAIRS', 'SITTING', 'STANDING']
-    
+
     df_noise_data = filter_activities(df_raw_full, NOISE_ACTIVITIES)
-    
+
     print(f"Total rows filtered for Noise Data: {len(df_noise_data):,}")
     print(f"Filtered activities: {df_noise_data['activity_name'].unique()}")
-    
+
     # This 'df_noise_data' is now ready to be used by the 'filtering_experiments.ipynb'
     # and the 'highpass_filter.py' for validation.
@@ -0,0 +1,310 @@
+import os
+import time
+
+import numpy as np
+
+# ==============================================================================
+# ENVELOPE PYRAMID: envelope.py
+# Purpose: Min/max level-of-detail pyramid of a recording (x, y, z, magnitude),
+#          so time series of any length plot with at most a few thousand points
+#          per trace at every zoom level while keeping peaks visible. The pyramid
+#          is small, can be saved next to the cached recording, and also drives
+#          the automatic stable-segment selection for the spectral plots.
+#
+# Level k holds one (min, max) pair per BASE_BUCKET * LEVEL_FACTOR**k samples.
+# ==============================================================================
+
+# --- 1. Pyramid Constants ---
+BASE_BUCKET = 64
+LEVEL_FACTOR = 4
+# Levels are added until the coarsest one has at most this many buckets
+TOP_LEVEL_BUCKETS = 1024
+# Maximum points drawn per trace (each visible bucket draws its min and its max)
+MAX_POINTS = 4000
+# Samples read per chunk while building level 0
+BUILD_CHUNK_SAMPLES = 1 << 20
+
+CHANNELS = ['accel_x', 'accel_y', 'accel_z', 'magnitude']
+
+# Stable segment selection: default segment length, and the bucket duration the
+# amplitude steadiness is judged on
+STABLE_SEGMENT_S = 10.0
+STABLE_BUCKET_S = 0.25
+
+
+class EnvelopePyramid:
+    """
+    Min/max envelopes of the channels in CHANNELS at several resolutions.
+
+    Attributes:
+    - n_samples (int): Samples in the recording.
+    - levels (list of dict): Per level 'bucket' (samples per bucket), 't_ms' (time of
+      the first sample of each bucket), 'min' and 'max' (n_buckets, n_channels) float32.
+    """
+
+    def __init__(self, n_samples, levels):
+        self.n_samples = n_samples
+        self.levels = levels
+
+    def level_for(self, n_visible_samples, max_points=MAX_POINTS):
+        """
+        Index of the finest level drawing n_visible_samples with at most max_points
+        points per trace, or -1 if the raw samples themselves fit.
+        """
+        if n_visible_samples <= max_points:
+            return -1
+        for k, level in enumerate(self.levels):
+            if 2 * n_visible_samples / level['bucket'] <= max_points:
+                return k
+        return len(self.levels) - 1
+
+    def to_arrays(self):
+        arrays = {'n_samples': np.array(self.n_samples)}
+        for k, level in enumerate(self.levels):
+            for name in ['t_ms', 'min', 'max']:
+                arrays[f'level{k}_{name}'] = level[name]
+            arrays[f'level{k}_bucket'] = np.array(level['bucket'])
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        levels = []
+        k = 0
+        while f'level{k}_bucket' in arrays:
+            levels.append({
+                'bucket': int(arrays[f'level{k}_bucket']),
+                't_ms': arrays[f'level{k}_t_ms'],
+                'min': arrays[f'level{k}_min'],
+                'max': arrays[f'level{k}_max'],
+            })
+            k += 1
+        return cls(int(arrays['n_samples']), levels)
+
+    @property
+    def nbytes(self):
+        return sum(level[name].nbytes for level in self.levels for name in ['t_ms', 'min', 'max'])
+
+
+def _bucket_extrema(acc):
+    """
+    Min/max per bucket of BASE_BUCKET samples for x, y, z and magnitude. The last
+    bucket may be partial. Returns two arrays of shape (n_buckets, 4).
+    """
+    acc = np.asarray(acc, dtype=np.float32)
+    channels = np.empty((len(acc), len(CHANNELS)), dtype=np.float32)
+    channels[:, :3] = acc
+    channels[:, 3] = np.sqrt(np.einsum('ij,ij->i', acc, acc))
+
+    n_full = len(channels) // BASE_BUCKET
+    full = channels[:n_full * BASE_BUCKET].reshape(n_full, BASE_BUCKET, -1)
+    mins, maxs = [full.min(axis=1)], [full.max(axis=1)]
+    if len(channels) > n_full * BASE_BUCKET:
+        tail = channels[n_full * BASE_BUCKET:]
+        mins.append(tail.min(axis=0, keepdims=True))
+        maxs.append(tail.max(axis=0, keepdims=True))
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def _coarsen(values, reduce):
+    """
+    Reduces groups of LEVEL_FACTOR consecutive buckets (the last group may be partial).
+    """
+    starts = np.arange(0, len(values), LEVEL_FACTOR)
+    return reduce.reduceat(values, starts, axis=0)
+
+
+def build_envelope(timestamps, acc, chunk_samples=BUILD_CHUNK_SAMPLES):
+    """
+    Builds the min/max pyramid in one chunked pass over the recording.
+
+    Parameters:
+    - timestamps (np.array): Sample timestamps (ms), shape (N,).
+    - acc: Acceleration (m/s^2), shape (N, 3); any row-sliceable array or memory map.
+    - chunk_samples (int): Samples per chunk (rounded to whole buckets).
+
+    Returns:
+    - EnvelopePyramid
+    """
+    n_samples = len(timestamps)
+    chunk_samples = max(BASE_BUCKET, chunk_samples // BASE_BUCKET * BASE_BUCKET)
+    mins, maxs = [], []
+    for start in range(0, n_samples, chunk_samples):
+        chunk_min, chunk_max = _bucket_extrema(acc[start:start + chunk_samples])
+        mins.append(chunk_min)
+        maxs.append(chunk_max)
+
+    level = {
+        'bucket': BASE_BUCKET,
+        't_ms': np.asarray(timestamps[::BASE_BUCKET], dtype=np.float64),
+        'min': np.concatenate(mins) if mins else np.zeros((0, len(CHANNELS)), np.float32),
+        'max': np.concatenate(maxs) if maxs else np.zeros((0, len(CHANNELS)), np.float32),
+    }
+    levels = [level]
+    while len(level['t_ms']) > TOP_LEVEL_BUCKETS:
+        level = {
+            'bucket': level['bucket'] * LEVEL_FACTOR,
+            't_ms': level['t_ms'][::LEVEL_FACTOR].copy(),
+            'min': _coarsen(level['min'], np.minimum),
+            'max': _coarsen(level['max'], np.maximum),
+        }
+        levels.append(level)
+    return EnvelopePyramid(n_samples, levels)
+
+
+def save_envelope(pyramid, path):
+    """
+    Writes the pyramid as an uncompressed .npz (through a temporary file).
+    """
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **pyramid.to_arrays())
+    os.replace(tmp_path, path)
+
+
+def load_envelope(path):
+    """
+    Reads a pyramid written by save_envelope().
+    """
+    with np.load(path) as arrays:
+        return EnvelopePyramid.from_arrays({name: arrays[name] for name in arrays.files})
+
+
+def envelope_trace(level, channel, first_bucket=0, last_bucket=None):
+    """
+    Interleaved (t, min), (t, max) points of one channel for plotting as a line,
+    so every bucket draws as a vertical stroke covering its full range.
+
+    Returns:
+    - (np.array, np.array): t_ms and values, 2 points per bucket.
+    """
+    t = level['t_ms'][first_bucket:last_bucket]
+    values = np.empty(2 * len(t), dtype=np.float32)
+    values[0::2] = level['min'][first_bucket:last_bucket, channel]
+    values[1::2] = level['max'][first_bucket:last_bucket, channel]
+    return np.repeat(t, 2), values
+
+
+def select_stable_segment(pyramid, fs, duration_s=STABLE_SEGMENT_S, bucket_s=STABLE_BUCKET_S):
+    """
+    Picks the segment with the steadiest vibration amplitude from the envelope.
+
+    The per-bucket peak-to-peak range of the magnitude is the amplitude proxy. Among
+    the windows of duration_s whose mean range is at least half of the largest window
+    mean (i.e. the tool is running, not idle), the one with the lowest coefficient of
+    variation of the range is returned.
+
+    Parameters:
+    - pyramid (EnvelopePyramid): Envelope of the recording.
+    - fs (float): Sampling frequency (Hz).
+    - duration_s (float): Segment length (s).
+    - bucket_s (float): Target bucket duration for the steadiness measure (s).
+
+    Returns:
+    - (int, int) or None: Sample indices (start, end) of the segment, or None if the
+      recording is shorter than duration_s.
+    """
+    n_window = int(duration_s * fs)
+    if pyramid.n_samples < n_window or not pyramid.levels:
+        return None
+
+    # Coarsest level whose buckets are still no longer than bucket_s
+    k = 0
+    while k + 1 < len(pyramid.levels) and pyramid.levels[k + 1]['bucket'] <= bucket_s * fs:
+        k += 1
+    level = pyramid.levels[k]
+    bucket = level['bucket']
+    amplitude = (level['max'][:, 3] - level['min'][:, 3]).astype(np.float64)
+    # Drop a partial last bucket, it would bias the range low
+    amplitude = amplitude[:pyramid.n_samples // bucket]
+
+    width = max(2, n_window // bucket)
+    if len(amplitude) < width:
+        return None
+
+    # Rolling mean and std of the amplitude over every window of `width` buckets
+    csum = np.concatenate([[0.0], np.cumsum(amplitude)])
+    csq = np.concatenate([[0.0], np.cumsum(amplitude ** 2)])
+    mean = (csum[width:] - csum[:-width]) / width
+    std = np.sqrt(np.maximum((csq[width:] - csq[:-width]) / width - mean ** 2, 0.0))
+    cv = std / np.where(mean > 0, mean, np.inf)
+
+    active = mean >= 0.5 * mean.max()
+    cv = np.where(active, cv, np.inf)
+    best = int(np.argmin(cv))
+    start = best * bucket
+    return start, min(start + width * bucket, pyramid.n_samples)
+
+
+class EnvelopeView:
+    """
+    Keeps one line per channel in sync with the visible x range: on every zoom or pan
+    the finest pyramid level that fits MAX_POINTS is drawn, or the raw samples once
+    few enough are visible.
+    """
+
+    def __init__(self, axes, pyramid, timestamps, raw_channels, max_points=MAX_POINTS):
+        """
+        Parameters:
+        - axes (list): One matplotlib Axes per channel (shared x axis, seconds).
+        - pyramid (EnvelopePyramid): Envelope of the recording.
+        - timestamps (np.array): Sample timestamps (ms).
+        - raw_channels (list of callables): raw_channels[c](start, stop) returns the
+          samples of channel c, used when zoomed in far enough.
+        """
+        self.axes = axes
+        self.pyramid = pyramid
+        self.timestamps = timestamps
+        self.t0 = float(timestamps[0])
+        self.raw_channels = raw_channels
+        self.max_points = max_points
+        self.lines = [ax.plot([], [], lw=0.8)[0] for ax in axes]
+        self.refresh(0, len(timestamps))
+        # matplotlib keeps only weak references to bound methods; the closure keeps
+        # this view alive as long as the figure
+        axes[0].callbacks.connect('xlim_changed', lambda ax: self._on_xlim(ax))
+
+    def refresh(self, start, stop):
+        """
+        Redraws all channels for the samples [start, stop).
+        """
+        start = max(0, start)
+        stop = min(self.pyramid.n_samples, max(stop, start + 1))
+        k = self.pyramid.level_for(stop - start, self.max_points)
+        for c, line in enumerate(self.lines):
+            if k < 0:
+                t = self.timestamps[start:stop]
+                values = self.raw_channels[c](start, stop)
+            else:
+                bucket = self.pyramid.levels[k]['bucket']
+                t, values = envelope_trace(self.pyramid.levels[k], c, start // bucket, -(-stop // bucket))
+            line.set_data((np.asarray(t) - self.t0) / 1000.0, values)
+
+    def _on_xlim(self, ax):
+        lo, hi = ax.get_xlim()
+        t_ms = self.t0 + np.array([lo, hi]) * 1000.0
+        start, stop = np.searchsorted(self.timestamps, t_ms)
+        self.refresh(int(start) - 1, int(stop) + 1)
+        ax.figure.canvas.draw_idle()
+
+
+if __name__ == '__main__':
+    # --- Example: 8 h synthetic recording at 833 Hz ---
+    fs = 833.0
+    n = int(8 * 3600 * fs)
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(n) * (1000.0 / fs)
+    acc = rng.normal(0, 0.3, (n, 3)).astype(np.float32)
+    acc[:, 2] += 9.81
+    on = slice(int(2 * 3600 * fs), int(2.5 * 3600 * fs))
+    acc[on] += (6.0 * np.sin(2 * np.pi * 70 * timestamps[on] / 1000.0))[:, None].astype(np.float32)
+
+    start = time.perf_counter()
+    pyramid = build_envelope(timestamps, acc)
+    elapsed = time.perf_counter() - start
+    print("--- Envelope Pyramid ---")
+    print(f"{n:,} samples -> {len(pyramid.levels)} levels, {pyramid.nbytes / 1e6:.1f} MB, {elapsed:.2f} s")
+    for k, level in enumerate(pyramid.levels):
+        print(f"  level {k}: {level['bucket']:>8} samples/bucket, {len(level['t_ms']):>9,} buckets")
+    print(f"Full view draws level {pyramid.level_for(n)} "
+          f"({2 * len(pyramid.levels[pyramid.level_for(n)]['t_ms'])} points per trace)")
+    segment = select_stable_segment(pyramid, fs)
+    print(f"Stable segment: {segment[0] / fs:.1f} s - {segment[1] / fs:.1f} s (tool on 7200-9000 s)")
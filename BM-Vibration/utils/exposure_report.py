@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# ==============================================================================
+# EXPOSURE REPORT: exposure_report.py
+# Purpose: Hand-arm vibration exposure after ISO 5349-1 for one or more Movesense
+#          recordings (JSON or binary packet files): Wh-weighted a_hv over the
+#          tool-ON time, the daily exposure A(8) and the time left until the EU
+#          action (2.5 m/s^2) and limit (5.0 m/s^2) values. The recordings are
+#          streamed in chunks, so a full shift needs constant memory; with
+#          several files the day's A(8) is combined from all of them.
+# Usage:   python utils/exposure_report.py FILE [FILE ...] [--gate onoff|none] [--json OUT]
+# ==============================================================================
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'signal', '03_classifiers', 'on_off'))
+
+from vibration.exposure import EXPOSURE_ACTION_VALUE, EXPOSURE_LIMIT_VALUE, ExposureMeter, daily_exposure
+from vibration.ingest import BINARY_SUFFIX, iter_movesense_binary_chunks, iter_movesense_chunks, probe_sampling_rate
+from onoff_model import OnOffDetector
+
+# --- 1. Report Constants ---
+DEFAULT_FS = 833.0
+CHUNK_SAMPLES = 1 << 16
+GATES = ('onoff', 'none')
+# Below this Fs the band above Fs/2 that Wh still weights noticeably (>= 0.08 up to
+# 200 Hz) is not sampled, and the report marks A(8) as a lower bound
+LOWER_BOUND_FS = 400.0
+
+
+def _format_duration(seconds):
+    """
+    h:mm:ss, or '-' for None (never reached).
+    """
+    if seconds is None:
+        return '-'
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def recording_exposure(file_path, fs=None, gate='onoff', thresholds=None, chunk_samples=CHUNK_SAMPLES):
+    """
+    Streams one recording through the Wh exposure meter.
+
+    Parameters:
+    - file_path (str): Movesense JSON file or binary packet file (.npy).
+    - fs (float): Sampling frequency (Hz); estimated from the first packets if None.
+    - gate (str): 'onoff' counts only the time the ON/OFF detector reports the tool
+      ON; 'none' counts the whole recording.
+    - thresholds (dict or str): ON/OFF detector configuration (default: thresholds.json).
+    - chunk_samples (int): Samples per processed chunk.
+
+    Returns:
+    - dict: ExposureMeter.summary() plus 'file', 'fs' and 'elapsed_s'.
+
+    Raises:
+    - ValueError: Unknown gate, or fs too low for the Wh weighting.
+    """
+    if gate not in GATES:
+        raise ValueError(f"Unknown gate '{gate}'. Use one of {GATES}.")
+    if fs is None:
+        fs = probe_sampling_rate(file_path) or DEFAULT_FS
+
+    start = time.perf_counter()
+    meter = ExposureMeter(fs)
+    detector = OnOffDetector(thresholds, fs=fs) if gate == 'onoff' else None
+    if file_path.endswith(BINARY_SUFFIX):
+        chunks = iter_movesense_binary_chunks(file_path, chunk_samples)
+    else:
+        chunks = iter_movesense_chunks(file_path, chunk_samples)
+    for chunk in chunks:
+        if detector is None:
+            meter.process(chunk, on=True)
+        else:
+            meter.process(chunk, transitions=detector.process(chunk))
+
+    result = meter.summary()
+    result.update(file=file_path, fs=fs, elapsed_s=time.perf_counter() - start)
+    return result
+
+
+def format_report(results, day):
+    """
+    Text table of the per-recording results and the combined daily exposure.
+    """
+    lines = [f"{'recording':<36} {'duration':>9} {'exposure':>9} {'a_hv':>6} {'A(8)':>6} "
+             f"{'to EAV':>9} {'to ELV':>9}"]
+    for r in results:
+        lines.append(
+            f"{os.path.basename(r['file'])[:36]:<36} {_format_duration(r['duration_s']):>9} "
+            f"{_format_duration(r['exposure_s']):>9} {r['a_hv']:>6.2f} {r['a8']:>6.2f} "
+            f"{_format_duration(r['time_to_eav_s']):>9} {_format_duration(r['time_to_elv_s']):>9}"
+        )
+    if len(results) > 1:
+        lines.append(f"{'day':<36} {'':>9} {_format_duration(day['exposure_s']):>9} "
+                     f"{day['a_hv']:>6.2f} {day['a8']:>6.2f}")
+
+    if day['a8'] >= EXPOSURE_LIMIT_VALUE:
+        lines.append(f"A(8) {day['a8']:.2f} m/s^2 exceeds the exposure limit value ({EXPOSURE_LIMIT_VALUE} m/s^2).")
+    elif day['a8'] >= EXPOSURE_ACTION_VALUE:
+        lines.append(f"A(8) {day['a8']:.2f} m/s^2 exceeds the exposure action value ({EXPOSURE_ACTION_VALUE} m/s^2).")
+    if any(r['fs'] < LOWER_BOUND_FS for r in results):
+        lines.append(f"Note: below {LOWER_BOUND_FS:.0f} Hz the weighted band above Fs/2 is not sampled, "
+                     "so A(8) is a lower bound.")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ISO 5349-1 hand-arm vibration exposure of Movesense recordings.")
+    parser.add_argument('files', nargs='+', help="Movesense JSON files or binary packet files (.npy) of one day.")
+    parser.add_argument('--gate', choices=GATES, default='onoff',
+                        help="Count only the tool-ON time ('onoff', default) or the whole recording ('none').")
+    parser.add_argument('--thresholds', default=None,
+                        help="ON/OFF detector configuration (default: on_off/thresholds.json).")
+    parser.add_argument('--fs', type=float, default=None,
+                        help="Sampling frequency in Hz (default: estimated from the first packets).")
+    parser.add_argument('--chunk-samples', type=int, default=CHUNK_SAMPLES,
+                        help=f"Samples per processed chunk (default: {CHUNK_SAMPLES}).")
+    parser.add_argument('--json', default=None, help="Also write the results to this JSON file.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = []
+    skipped = []
+    for path in args.files:
+        try:
+            results.append(recording_exposure(path, fs=args.fs, gate=args.gate, thresholds=args.thresholds,
+                                              chunk_samples=args.chunk_samples))
+        except ValueError as e:
+            # e.g. Fs below the lowest rate of the Wh weighting; not part of the day's A(8)
+            print(f"Skipped {os.path.basename(path)}: {e}")
+            skipped.append({'file': path, 'reason': str(e)})
+    if not results:
+        sys.exit("No recording could be evaluated.")
+    day = daily_exposure(results)
+    print(format_report(results, day))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'recordings': results, 'skipped': skipped, 'day': day}, f, indent=2)
@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# ==============================================================================
+# RECORDING CACHE: recording_cache.py
+# Purpose: Content-addressed binary cache for converted Movesense recordings, so
+#          unchanged JSON files are loaded as memory-mapped .npy arrays instead of
+#          being parsed again (replaces the processed_*.csv round trip).
+#
+# Layout (inside CACHE_DIR):
+#   <key>/timestamp.npy, acc.npy, packet_*.npy, gap_map.npy, meta.json
+#       One entry per distinct JSON content. <key> is the SHA-256 of the file
+#       content plus the cache format version.
+#   <key>/envelope.npz
+#       Min/max plotting pyramid (envelope.py), added on first request.
+#   sources/<sha1 of source path>.json
+#       Last seen (mtime, size, key) of each source file. When mtime or size change
+#       the file is re-hashed, so edited recordings are invalidated automatically.
+# ==============================================================================
+
+# utils/ is a script folder, not a package: its own folder (envelope) and BM-Vibration
+# (vibration/) go on the path, see vibration/__init__.py
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from envelope import build_envelope, load_envelope, save_envelope
+from vibration.ingest import load_movesense_arrays
+
+# --- 1. Cache Constants ---
+CACHE_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data', '.cache'))
+# Size bound of the cache; least recently used entries are evicted above this
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Bump when the stored arrays or the loader output change, to invalidate old entries
+CACHE_FORMAT_VERSION = 2
+
+ARRAY_NAMES = [
+    'timestamp', 'acc', 'packet_timestamps', 'packet_sizes', 'packet_flags', 'gap_map'
+]
+META_FILE = 'meta.json'
+ENVELOPE_FILE = 'envelope.npz'
+SOURCES_DIR = 'sources'
+HASH_BLOCK_BYTES = 1 << 20
+
+# Movesense stream names look like 20251120T141702Z_244730001974_acc_stream.json
+_STREAM_NAME = re.compile(r'(?P<start>\d{8}T\d{6}Z)_(?P<serial>\d+)_acc_stream')
+
+
+def parse_recording_name(file_path):
+    """
+    Extracts the recording start time and sensor serial from a Movesense file name.
+
+    Returns:
+    - dict: {'start_time': str or None, 'sensor_serial': str or None}
+    """
+    match = _STREAM_NAME.search(os.path.basename(file_path))
+    if not match:
+        return {'start_time': None, 'sensor_serial': None}
+    return {'start_time': match.group('start'), 'sensor_serial': match.group('serial')}
+
+
+def file_digest(file_path):
+    """
+    Returns the SHA-256 hex digest of a file, read in fixed-size blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path, obj):
+    """
+    Writes JSON through a temporary file and os.replace, so readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _source_record_path(file_path, cache_dir):
+    path_id = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, SOURCES_DIR, f'{path_id}.json')
+
+
+def cache_key(file_path, cache_dir=CACHE_DIR):
+    """
+    Returns the content key of a source file, re-hashing only when its mtime or size changed.
+    """
+    stat = os.stat(file_path)
+    record_path = _source_record_path(file_path, cache_dir)
+
+    try:
+        with open(record_path, 'r') as f:
+            record = json.load(f)
+        if record['mtime_ns'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+            return record['key']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    key = f'{file_digest(file_path)[:32]}-v{CACHE_FORMAT_VERSION}'
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    _write_json_atomic(record_path, {
+        'source': os.path.abspath(file_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'key': key,
+    })
+    return key
+
+
+def _entry_size(entry_dir):
+    return sum(
+        os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir)
+    )
+
+
+def _referenced_keys(cache_dir):
+    """
+    Returns the set of entry keys still referenced by a source record.
+    """
+    sources_dir = os.path.join(cache_dir, SOURCES_DIR)
+    keys = set()
+    if not os.path.isdir(sources_dir):
+        return keys
+    for name in os.listdir(sources_dir):
+        try:
+            with open(os.path.join(sources_dir, name), 'r') as f:
+                keys.add(json.load(f)['key'])
+        except (OSError, ValueError, KeyError):
+            continue
+    return keys
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=()):
+    """
+    Enforces the cache size bound.
+
+    Entries of an older format version or no longer referenced by any source file are
+    removed first; then least recently used entries until the total is below max_bytes.
+
+    Parameters:
+    - cache_dir (str): Cache directory.
+    - max_bytes (int): Maximum total size of all entries.
+    - keep (iterable): Keys that must not be evicted (e.g. the entry just written).
+
+    Returns:
+    - int: Number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    referenced = _referenced_keys(cache_dir)
+    suffix = f'-v{CACHE_FORMAT_VERSION}'
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        meta_path = os.path.join(entry_dir, META_FILE)
+        if key == SOURCES_DIR or not os.path.isfile(meta_path):
+            continue
+        stale = not key.endswith(suffix) or key not in referenced
+        # meta.json is touched on every load, so its mtime is the last access time
+        entries.append((not stale, os.path.getmtime(meta_path), key, _entry_size(entry_dir)))
+
+    # Stale entries first, then oldest access first
+    entries.sort()
+    total = sum(entry[3] for entry in entries)
+    removed = 0
+    for is_live, _, key, size in entries:
+        if key in keep:
+            continue
+        if is_live and total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _store_entry(arrays, file_path, key, cache_dir):
+    """
+    Writes one cache entry into a temporary directory and renames it into place.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), arrays[name])
+
+        sample_interval_ms = arrays['sample_interval_ms']
+        timestamps = arrays['timestamp']
+        meta = {
+            'key': key,
+            'format_version': CACHE_FORMAT_VERSION,
+            'source_name': os.path.basename(file_path),
+            'n_samples': int(len(timestamps)),
+            'packet_count': int(len(arrays['packet_sizes'])),
+            'sample_interval_ms': sample_interval_ms,
+            'estimated_fs': 1000.0 / sample_interval_ms if sample_interval_ms > 0 else 0.0,
+            'duration_s': float(timestamps[-1] - timestamps[0]) / 1000.0,
+            'timebase': arrays['timebase'],
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        meta.update(parse_recording_name(file_path))
+        with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # Another process stored the same content first; its entry is identical
+        if not os.path.isdir(os.path.join(cache_dir, key)):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _open_entry(entry_dir):
+    meta_path = os.path.join(entry_dir, META_FILE)
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+
+    arrays = {
+        name: np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r')
+        for name in ARRAY_NAMES
+    }
+    arrays['sample_interval_ms'] = meta['sample_interval_ms']
+    arrays['timebase'] = meta['timebase']
+    arrays['meta'] = meta
+
+    # Mark as recently used for the LRU eviction
+    os.utime(meta_path)
+    return arrays
+
+
+def load_recording_arrays(file_path, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, verbose=True):
+    """
+    Loads a Movesense recording through the binary cache.
+
+    On a hit the arrays are memory-mapped straight from disk with zero parsing. On a miss
+    (new file, or its content changed) the JSON is parsed with load_movesense_arrays(),
+    stored, and the cache is trimmed to max_bytes.
+
+    Parameters:
+    - file_path (str): Path to the Movesense JSON file.
+    - cache_dir (str): Cache directory.
+    - max_bytes (int): Size bound of the cache.
+    - verbose (bool): Print progress messages.
+
+    Returns:
+    - dict or None: Same keys as load_movesense_arrays() (arrays are read-only memory maps)
+      plus 'meta' (estimated_fs, packet_count, sensor_serial, ...). None if parsing fails.
+    """
+    key = cache_key(file_path, cache_dir)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.isfile(os.path.join(entry_dir, META_FILE)):
+        if verbose:
+            print(f"Loading cached recording: {file_path} ({key})")
+        return _open_entry(entry_dir)
+
+    arrays = load_movesense_arrays(file_path, verbose=verbose)
+    if arrays is None:
+        return None
+
+    _store_entry(arrays, file_path, key, cache_dir)
+    del arrays
+    evict(cache_dir, max_bytes, keep=(key,))
+    if verbose:
+        print(f"Cached recording as: {entry_dir}")
+    return _open_entry(entry_dir)
+
+
+def load_recording_envelope(file_path, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, verbose=True):
+    """
+    Returns the min/max envelope pyramid of a recording, built once from the cached
+    arrays and stored in the same cache entry (so it is invalidated and evicted with it).
+
+    Returns:
+    - EnvelopePyramid or None: None if the recording cannot be parsed.
+    """
+    arrays = load_recording_arrays(file_path, cache_dir, max_bytes, verbose)
+    if arrays is None:
+        return None
+
+    envelope_path = os.path.join(cache_dir, arrays['meta']['key'], ENVELOPE_FILE)
+    if os.path.isfile(envelope_path):
+        return load_envelope(envelope_path)
+
+    pyramid = build_envelope(arrays['timestamp'], arrays['acc'])
+    save_envelope(pyramid, envelope_path)
+    if verbose:
+        print(f"Cached envelope as: {envelope_path}")
+    return pyramid
+
+
+def load_recording(file_path, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, verbose=True):
+    """
+    Cached equivalent of load_movesense_json(): returns the recording as a DataFrame
+    (timestamp, accel_x, accel_y, accel_z), or None if it cannot be parsed.
+    """
+    import pandas as pd
+
+    arrays = load_recording_arrays(file_path, cache_dir, max_bytes, verbose)
+    if arrays is None:
+        return None
+
+    acc = arrays['acc']
+    return pd.DataFrame({
+        'timestamp': arrays['timestamp'],
+        'accel_x': acc[:, 0],
+        'accel_y': acc[:, 1],
+        'accel_z': acc[:, 2]
+    })
+
+
+if __name__ == '__main__':
+    # --- Warm the cache for every recording in data/ and report load times ---
+    data_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith('.json'))
+
+    for name in files:
+        path = os.path.join(data_dir, name)
+        start = time.perf_counter()
+        arrays = load_recording_arrays(path, verbose=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        meta = arrays['meta']
+        print(f"{name[:48]:<48} {meta['n_samples']:>8} samples  "
+              f"Fs={meta['estimated_fs']:7.1f} Hz  {elapsed_ms:8.2f} ms")
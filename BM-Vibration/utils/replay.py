@@ -0,0 +1,518 @@
+import argparse
+import asyncio
+import glob
+import heapq
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# ==============================================================================
+# PACKET REPLAY: replay.py
+# Purpose: Replays Movesense recordings from data/ packet by packet, with the
+#          original Timestamp spacing, at 1x, Nx or maximum speed, so streaming
+#          code (ON/OFF detector, chunked preprocessing, ingestion server) can be
+#          exercised and timed without hardware.
+#
+# Many recordings (or many copies of one) are multiplexed into concurrent virtual
+# sensors. Each virtual sensor can start with an offset, loop its recording, and
+# lose packets (independently or in bursts) or deliver them late (jitter).
+#
+# Packet times come from the reconstructed time base of the recording (timebase.py:
+# dropouts, rollover and missing Timestamps handled), read through the binary
+# recording cache, so each file is parsed once.
+# Usage:   python utils/replay.py [files...] [--sensors N] [--speed 1|10|max]
+#                                 [--loss P] [--jitter-ms MS] [--consumer ...]
+# ==============================================================================
+
+sys.path.append(os.path.dirname(__file__))
+
+from recording_cache import load_recording_arrays
+
+# --- 1. Replay Constants ---
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+# Sleeping for less than this is skipped; the packet is delivered slightly early instead
+MIN_SLEEP_S = 0.0005
+# Default start offset between consecutive virtual sensors (s)
+STAGGER_S = 0.013
+# Delivery times kept for the latency percentiles (most recent ones)
+LATENCY_HISTORY = 1 << 18
+
+
+def load_packet_table(file_path, verbose=False):
+    """
+    Loads a recording as a table of packets.
+
+    Parameters:
+    - file_path (str): Movesense JSON recording.
+    - verbose (bool): Print loader messages.
+
+    Returns:
+    - dict: 'name', 'sensor_serial', 'fs',
+      'timestamps' (float64, original packet Timestamp, NaN where missing),
+      'time_s' (float64, reconstructed time of each packet's last sample, from 0),
+      'offsets' / 'sizes' (int64, first sample and sample count of each packet),
+      'acc' (float32 (N, 3) samples), 'duration_s' (float).
+
+    Raises:
+    - ValueError: If the file holds no acceleration data.
+    """
+    arrays = load_recording_arrays(file_path, verbose=verbose)
+    if arrays is None:
+        raise ValueError(f"No acceleration data in {file_path}.")
+    sizes = np.asarray(arrays['packet_sizes'], dtype=np.int64)
+    ends = np.cumsum(sizes)
+    # Reconstructed timestamp of the last sample of every packet (ms)
+    packet_ms = np.asarray(arrays['timestamp'])[ends - 1]
+    meta = arrays['meta']
+    interval_s = arrays['sample_interval_ms'] / 1000.0
+    return {
+        'name': os.path.basename(file_path),
+        'sensor_serial': meta.get('sensor_serial'),
+        'fs': float(meta['estimated_fs']),
+        'timestamps': np.asarray(arrays['packet_timestamps'], dtype=np.float64),
+        'time_s': (packet_ms - packet_ms[0]) / 1000.0,
+        'offsets': ends - sizes,
+        'sizes': sizes,
+        'acc': arrays['acc'],
+        # One packet duration after the last packet, so loops keep the packet spacing
+        'duration_s': float((packet_ms[-1] - packet_ms[0]) / 1000.0 + sizes[-1] * interval_s),
+    }
+
+
+class Impairments:
+    """
+    Packet loss and delivery jitter of one link (BLE + phone gateway).
+
+    Loss follows a two-state (Gilbert) model: runs of delivered packets alternate with
+    runs of lost packets of mean length burst_packets, for an overall loss rate of
+    `loss`. burst_packets=1 gives independent losses. Delivered runs hold at least
+    one packet, so loss can be at most burst_packets / (1 + burst_packets) (0.5 for
+    independent losses); higher rates need longer bursts and raise a ValueError.
+    Jitter delays each packet by an exponential random time with mean jitter_ms;
+    packets of one link stay in order unless reorder=True.
+    """
+
+    def __init__(self, loss=0.0, burst_packets=1.0, jitter_ms=0.0, reorder=False, seed=0):
+        if not 0.0 <= loss < 1.0:
+            raise ValueError(f"loss must be in [0, 1), got {loss}.")
+        if burst_packets < 1.0:
+            raise ValueError(f"burst_packets must be >= 1, got {burst_packets}.")
+        if loss > burst_packets / (1.0 + burst_packets):
+            raise ValueError(f"loss={loss} needs bursts longer than {burst_packets} packets "
+                             f"(at most {burst_packets / (1.0 + burst_packets):.3f} for this burst length).")
+        if jitter_ms < 0.0:
+            raise ValueError(f"jitter_ms must be >= 0, got {jitter_ms}.")
+        self.loss = loss
+        self.burst_packets = burst_packets
+        self.jitter_ms = jitter_ms
+        self.reorder = reorder
+        self.seed = seed
+
+    def keep_mask(self, n_packets, rng):
+        """
+        Bool mask of the delivered packets (vectorized run-length simulation).
+        """
+        keep = np.ones(n_packets, dtype=bool)
+        if self.loss == 0.0 or n_packets == 0:
+            return keep
+        mean_good = self.burst_packets * (1.0 - self.loss) / self.loss
+        # Enough alternating (good, lost) runs to cover n_packets with high probability
+        n_runs = int(n_packets / (mean_good + self.burst_packets) * 2) + 16
+        while True:
+            good = rng.geometric(min(1.0, 1.0 / mean_good), n_runs)
+            lost = rng.geometric(1.0 / self.burst_packets, n_runs)
+            # Start inside a good run at a random position
+            good[0] = rng.integers(1, good[0] + 1)
+            if good.sum() + lost.sum() >= n_packets:
+                break
+            n_runs *= 2
+        bounds = np.cumsum(np.column_stack([good, lost]).ravel())
+        # Packets in [bounds[2k], bounds[2k + 1]) are lost
+        starts, stops = bounds[0::2], bounds[1::2]
+        inside = starts < n_packets
+        delta = np.zeros(n_packets + 1, dtype=np.int64)
+        np.add.at(delta, starts[inside], 1)
+        np.add.at(delta, np.minimum(stops[inside], n_packets), -1)
+        keep[np.cumsum(delta[:-1]) > 0] = False
+        return keep
+
+    def delays_s(self, n_packets, rng):
+        if self.jitter_ms == 0.0:
+            return np.zeros(n_packets)
+        return rng.exponential(self.jitter_ms / 1000.0, n_packets)
+
+
+class VirtualSensor:
+    """
+    One replayed sensor: a recording, a start offset, a number of loops and the
+    impairments of its link.
+    """
+
+    def __init__(self, table, sensor_id, start_s=0.0, loops=1, impairments=None):
+        """
+        Parameters:
+        - table (dict): load_packet_table(...) of the recording (may be shared).
+        - sensor_id (int): Index of the virtual sensor (also seeds its impairments).
+        - start_s (float): Recording time at which this sensor starts sending.
+        - loops (int): Times the recording is played back to back.
+        - impairments (Impairments): Loss / jitter of the link (default: none).
+        """
+        if loops < 1:
+            raise ValueError(f"loops must be >= 1, got {loops}.")
+        self.table = table
+        self.sensor_id = sensor_id
+        self.start_s = start_s
+        self.loops = loops
+        self.impairments = impairments or Impairments()
+        base = table['sensor_serial'] or os.path.splitext(table['name'])[0]
+        self.sensor_serial = f"{base}#{sensor_id}"
+        self.fs = table['fs']
+        self.n_packets = len(table['sizes']) * loops
+        self.n_dropped = 0
+
+    def schedule(self, speed=None):
+        """
+        Delivery plan of the sensor.
+
+        Parameters:
+        - speed (float): Replay speed (1 = real time); None for maximum speed (jitter is
+          then only used for the delivery order).
+
+        Returns:
+        - tuple: (seq, due_s) arrays of the delivered packets, sorted by due_s; seq is the
+          packet number across loops, due_s the delivery time after the replay start.
+        """
+        table = self.table
+        n = len(table['sizes'])
+        loop = np.repeat(np.arange(self.loops), n)
+        recording_s = self.start_s + np.tile(table['time_s'], self.loops) + loop * table['duration_s']
+        rng = np.random.default_rng([self.impairments.seed, self.sensor_id])
+        keep = self.impairments.keep_mask(self.n_packets, rng)
+        seq = np.flatnonzero(keep)
+        due_s = recording_s[seq] / (speed or 1.0) + self.impairments.delays_s(len(seq), rng)
+        self.n_dropped = self.n_packets - len(seq)
+        if self.impairments.reorder:
+            order = np.argsort(due_s, kind='stable')
+            seq, due_s = seq[order], due_s[order]
+        else:
+            due_s = np.maximum.accumulate(due_s)
+        return seq, due_s
+
+    def packet(self, seq, due_s):
+        table = self.table
+        n = len(table['sizes'])
+        loop, k = divmod(int(seq), n)
+        timestamp = table['timestamps'][k]
+        if timestamp == timestamp:
+            # Later loops continue the sensor clock
+            timestamp = int(timestamp + round(loop * table['duration_s'] * 1000.0))
+        else:
+            timestamp = None
+        offset = table['offsets'][k]
+        return ReplayPacket(self, int(seq), timestamp, table['acc'][offset:offset + table['sizes'][k]], due_s)
+
+
+class ReplayPacket:
+    """
+    One delivered packet. samples is a float32 (n, 3) view into the recording.
+    """
+    __slots__ = ('sensor', 'seq', 'timestamp', 'samples', 'due_s', 'delivered_s')
+
+    def __init__(self, sensor, seq, timestamp, samples, due_s):
+        self.sensor = sensor
+        self.seq = seq
+        self.timestamp = timestamp
+        self.samples = samples
+        self.due_s = due_s
+        self.delivered_s = None
+
+    def to_entry(self):
+        """
+        The packet as an entry of a Movesense "data" list.
+        """
+        acc = {'ArrayAcc': [{'x': float(x), 'y': float(y), 'z': float(z)} for x, y, z in self.samples]}
+        if self.timestamp is not None:
+            acc['Timestamp'] = self.timestamp
+        return {'acc': acc}
+
+    def to_line(self, sent=None):
+        """
+        The packet as one ingest_server.py protocol line (bytes), with the sending time.
+        """
+        entry = self.to_entry()
+        if sent is not None:
+            entry['sent'] = sent
+        return (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+
+
+class ReplayStats:
+    """
+    Delivery and consumer timings of one replay.
+    """
+
+    def __init__(self, history=LATENCY_HISTORY):
+        self.packets = 0
+        self.samples = 0
+        self.dropped = 0
+        self.wall_s = 0.0
+        self.recording_s = 0.0
+        # Ring of (delivery lateness, consumer latency) in ms
+        self._latency = np.zeros((history, 2))
+        self._n_latency = 0
+
+    def add(self, lateness_ms, latency_ms):
+        self._latency[self._n_latency % len(self._latency)] = (lateness_ms, latency_ms)
+        self._n_latency += 1
+
+    def to_dict(self):
+        latency = self._latency[:min(self._n_latency, len(self._latency))]
+        if len(latency):
+            p_late = np.percentile(latency[:, 0], [50, 99])
+            p_done = np.percentile(latency[:, 1], [50, 99])
+        else:
+            p_late = p_done = [float('nan')] * 2
+        wall_s = max(self.wall_s, 1e-9)
+        return {
+            'packets': self.packets,
+            'samples': self.samples,
+            'dropped': self.dropped,
+            'wall_s': self.wall_s,
+            'packets_per_s': self.packets / wall_s,
+            'samples_per_s': self.samples / wall_s,
+            # Seconds of recording replayed per second of wall time
+            'speed': self.recording_s / wall_s,
+            'lateness_p50_ms': float(p_late[0]),
+            'lateness_p99_ms': float(p_late[1]),
+            'latency_p50_ms': float(p_done[0]),
+            'latency_p99_ms': float(p_done[1]),
+        }
+
+
+class Replayer:
+    """
+    Multiplexes virtual sensors into one packet stream in delivery order, paced at
+    the requested speed.
+
+    Example:
+        tables = [load_packet_table(path) for path in recordings]
+        replayer = Replayer(make_sensors(tables, n_sensors=50), speed=10.0)
+        stats = replayer.run(lambda packet: detectors[packet.sensor.sensor_id].process(packet.samples))
+    """
+
+    def __init__(self, sensors, speed=1.0):
+        """
+        Parameters:
+        - sensors (list): VirtualSensor objects.
+        - speed (float): 1 = real time, N = N times faster, None = as fast as possible.
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError(f"speed must be > 0 or None, got {speed}.")
+        self.sensors = sensors
+        self.speed = speed
+
+    def _merged(self):
+        """
+        (due_s, sensor index, seq) of all delivered packets, in delivery order.
+        """
+        streams = []
+        for i, sensor in enumerate(self.sensors):
+            seq, due_s = sensor.schedule(self.speed)
+            streams.append(zip(due_s.tolist(), [i] * len(seq), seq.tolist()))
+        return heapq.merge(*streams)
+
+    def _recording_s(self):
+        return max(sensor.start_s + sensor.loops * sensor.table['duration_s'] for sensor in self.sensors)
+
+    def __iter__(self):
+        """
+        Yields ReplayPacket objects at their delivery time (blocking sleeps).
+        """
+        start = time.perf_counter()
+        for due_s, i, seq in self._merged():
+            if self.speed is not None:
+                wait = start + due_s - time.perf_counter()
+                if wait > MIN_SLEEP_S:
+                    time.sleep(wait)
+            packet = self.sensors[i].packet(seq, due_s)
+            packet.delivered_s = time.perf_counter() - start
+            yield packet
+
+    async def __aiter__(self):
+        """
+        Same as __iter__ for asyncio consumers (non-blocking sleeps).
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for due_s, i, seq in self._merged():
+            if self.speed is not None:
+                wait = start + due_s - loop.time()
+                if wait > MIN_SLEEP_S:
+                    await asyncio.sleep(wait)
+            packet = self.sensors[i].packet(seq, due_s)
+            packet.delivered_s = loop.time() - start
+            yield packet
+
+    def run(self, consumer=None):
+        """
+        Replays every packet into consumer(packet) and times it.
+
+        Lateness is the delivery time minus the scheduled time (the replayer or the
+        consumer falling behind); latency is the time from the scheduled delivery until
+        the consumer returned. At maximum speed both count from the replay start and
+        only the throughput is meaningful.
+
+        Returns:
+        - ReplayStats
+        """
+        stats = ReplayStats()
+        start = time.perf_counter()
+        for packet in self:
+            if consumer is not None:
+                consumer(packet)
+            if self.speed is not None:
+                done_s = time.perf_counter() - start
+                stats.add((packet.delivered_s - packet.due_s) * 1000.0, (done_s - packet.due_s) * 1000.0)
+            stats.packets += 1
+            stats.samples += len(packet.samples)
+        stats.wall_s = time.perf_counter() - start
+        stats.dropped = sum(sensor.n_dropped for sensor in self.sensors)
+        stats.recording_s = self._recording_s() if self.sensors else 0.0
+        return stats
+
+
+def make_sensors(tables, n_sensors=None, stagger_s=STAGGER_S, loops=1, impairments=None):
+    """
+    Virtual sensors cycling through the given recordings.
+
+    Parameters:
+    - tables (list): load_packet_table(...) results.
+    - n_sensors (int): Number of virtual sensors (default: one per recording).
+    - stagger_s (float): Start offset between consecutive sensors (s).
+    - loops (int): Times each sensor plays its recording.
+    - impairments (Impairments): Link impairments shared by all sensors (each sensor
+      draws its own random losses / delays).
+
+    Returns:
+    - list: VirtualSensor objects.
+    """
+    if not tables:
+        raise ValueError("No recordings to replay.")
+    n_sensors = len(tables) if n_sensors is None else n_sensors
+    return [VirtualSensor(tables[i % len(tables)], i, i * stagger_s, loops, impairments)
+            for i in range(n_sensors)]
+
+
+async def replay_to_server(replayer, host, port):
+    """
+    Sends the replay to an ingest_server.py instance, one connection per virtual
+    sensor (hello line, then one line per packet with its sending time).
+
+    Returns:
+    - ReplayStats: Client-side delivery timings (the server reports end-to-end latency).
+    """
+    connections = {}
+    for sensor in replayer.sensors:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(json.dumps({'hello': {'sensor_serial': sensor.sensor_serial, 'fs': sensor.fs}}).encode()
+                     + b'\n')
+        connections[sensor.sensor_id] = writer
+
+    stats = ReplayStats()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    async for packet in replayer:
+        writer = connections[packet.sensor.sensor_id]
+        writer.write(packet.to_line(sent=time.time()))
+        if writer.transport.get_write_buffer_size() > writer.transport.get_write_buffer_limits()[1]:
+            # Server backpressure: wait for this connection only when its buffer is full
+            await writer.drain()
+        if replayer.speed is not None:
+            late_ms = (packet.delivered_s - packet.due_s) * 1000.0
+            stats.add(late_ms, (loop.time() - start - packet.due_s) * 1000.0)
+        stats.packets += 1
+        stats.samples += len(packet.samples)
+    for writer in connections.values():
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+    stats.wall_s = loop.time() - start
+    stats.dropped = sum(sensor.n_dropped for sensor in replayer.sensors)
+    stats.recording_s = replayer._recording_s()
+    return stats
+
+
+def make_consumer(kind, sensors):
+    """
+    Built-in streaming consumers for the command line.
+
+    - 'none':    only the replay itself (pacing overhead).
+    - 'onoff':   one OnOffDetector per virtual sensor.
+    - 'session': one ingest_server.SensorSession per sensor (detector + chunked
+                 preprocessing, no files written).
+    """
+    if kind == 'none':
+        return None
+    root = os.path.join(os.path.dirname(__file__), '..')
+    sys.path.append(os.path.join(root, 'signal', '03_classifiers', 'on_off'))
+    from onoff_model import OnOffDetector, load_thresholds
+    thresholds = load_thresholds()
+
+    if kind == 'onoff':
+        detectors = {sensor.sensor_id: OnOffDetector(thresholds, fs=sensor.fs) for sensor in sensors}
+        return lambda packet: detectors[packet.sensor.sensor_id].process(packet.samples)
+    if kind == 'session':
+        sys.path.append(os.path.join(root, 'ServerBuilder'))
+        from ingest_server import SensorSession
+        sessions = {sensor.sensor_id: SensorSession(None, sensor.sensor_serial, sensor.fs, thresholds)
+                    for sensor in sensors}
+        return lambda packet: sessions[packet.sensor.sensor_id].process([packet.timestamp or 0],
+                                                                        [packet.samples])
+    raise ValueError(f"Unknown consumer: {kind}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Movesense recordings as live packet streams.")
+    parser.add_argument('files', nargs='*',
+                        help="Recordings to replay (default: every .json in data/).")
+    parser.add_argument('--sensors', type=int, default=None,
+                        help="Virtual sensors, cycling through the files (default: one per file).")
+    parser.add_argument('--speed', default='1',
+                        help="Replay speed: 1 = real time, N = N times faster, 'max' = no pacing.")
+    parser.add_argument('--loops', type=int, default=1, help="Times each sensor plays its recording.")
+    parser.add_argument('--loss', type=float, default=0.0, help="Packet loss rate (at most burst / (1 + burst)).")
+    parser.add_argument('--burst', type=float, default=1.0, help="Mean lost packets per loss burst.")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Mean extra delivery delay (ms).")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the loss / jitter draws.")
+    parser.add_argument('--consumer', choices=['none', 'onoff', 'session', 'server'], default='session',
+                        help="Streaming code that receives the packets (default: session).")
+    parser.add_argument('--host', default='127.0.0.1', help="ingest_server.py host (--consumer server).")
+    parser.add_argument('--port', type=int, default=8833, help="ingest_server.py port (--consumer server).")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(DATA_DIR, '*.json')))
+    tables = [load_packet_table(path) for path in files]
+    impairments = Impairments(args.loss, args.burst, args.jitter_ms, seed=args.seed)
+    sensors = make_sensors(tables, args.sensors, loops=args.loops, impairments=impairments)
+    speed = None if args.speed == 'max' else float(args.speed)
+    replayer = Replayer(sensors, speed)
+    print(f"Replaying {len(files)} recording(s) as {len(sensors)} virtual sensor(s), "
+          f"{replayer._recording_s():.1f} s of recording at speed {args.speed}.")
+
+    if args.consumer == 'server':
+        stats = asyncio.run(replay_to_server(replayer, args.host, args.port))
+    else:
+        stats = replayer.run(make_consumer(args.consumer, sensors))
+
+    result = stats.to_dict()
+    print(f"{result['packets']:,} packets ({result['dropped']:,} dropped), {result['samples']:,} samples "
+          f"in {result['wall_s']:.2f} s: {result['packets_per_s']:,.0f} packets/s, "
+          f"{result['samples_per_s']:,.0f} samples/s, {result['speed']:.1f}x real time")
+    if speed is not None:
+        print(f"Delivery lateness p50 / p99: {result['lateness_p50_ms']:.2f} / {result['lateness_p99_ms']:.2f} ms; "
+              f"consumer latency p50 / p99: {result['latency_p50_ms']:.2f} / {result['latency_p99_ms']:.2f} ms")
@@ -0,0 +1,411 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+# ==============================================================================
+# SIGNAL QUALITY: signal_quality.py
+# Purpose: Single-pass quality assessment of a Movesense recording over the
+#          (N, 3) acceleration array. One chunked traversal collects effective
+#          Fs, DC offsets, magnitude statistics, clipping, NaN and flatline runs
+#          and dropout gaps; per-packet Fs jitter comes from the packet arrays.
+#          Works on memory-mapped (recording_cache) or streamed input and never
+#          modifies the data.
+# ==============================================================================
+
+# --- 1. Quality Constants ---
+# Samples per chunk of the traversal; bounds the temporary memory
+CHUNK_SAMPLES = 1 << 20
+# Sensor full-scale range; samples at or beyond CLIP_FRACTION of it count as clipped
+FULL_SCALE_G = 16.0
+CLIP_FRACTION = 0.99
+STANDARD_GRAVITY = 9.80665
+# Identical consecutive values on one axis for at least this many samples = flatline
+FLATLINE_MIN_SAMPLES = 50
+# Sample spacing longer than this many typical (median) intervals = dropout gap
+GAP_FACTOR = 1.5
+# Effective vs. nominal Fs deviation that triggers a warning
+FS_DEVIATION_WARN_PCT = 5.0
+
+AXES = ['x', 'y', 'z']
+
+
+def _run_lengths(mask, carry):
+    """
+    Length of the run of True values ending at every row, shape (n, 3), where
+    carry (3,) is the run length at the end of the previous chunk.
+    """
+    idx = np.arange(len(mask))[:, None]
+    last_false = np.where(mask, -1 - carry, idx)
+    np.maximum.accumulate(last_false, axis=0, out=last_false)
+    return idx - last_false
+
+
+class QualityReport:
+    """
+    Result of a quality assessment. All values are plain Python numbers / lists, so
+    to_dict() is JSON-serializable; format() gives the human-readable summary.
+    """
+
+    FIELDS = [
+        'n_samples', 'duration_s', 'effective_fs', 'nominal_fs', 'fs_deviation_pct',
+        'packet_fs', 'dc_offset', 'axis_std', 'magnitude', 'n_nan', 'longest_nan_run',
+        'n_clipped', 'clip_level', 'flatline', 'gaps', 'timebase', 'warnings',
+    ]
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def format(self):
+        """
+        Multi-line text summary (same information the old check printed).
+        """
+        lines = ["--- Signal Quality Check ---"]
+        if self.effective_fs:
+            lines.append(f"Effective Sampling Frequency: {self.effective_fs:.2f} Hz")
+        else:
+            lines.append("Not enough data to calculate Fs.")
+        if self.nominal_fs:
+            lines.append(f"Nominal Sampling Frequency: {self.nominal_fs} Hz")
+            if self.fs_deviation_pct is not None:
+                lines.append(f"Deviation: {self.fs_deviation_pct:.2f}%")
+        if self.packet_fs:
+            lines.append(f"Per-packet Fs: median {self.packet_fs['median']:.1f} Hz, "
+                         f"p5-p95 {self.packet_fs['p5']:.1f}-{self.packet_fs['p95']:.1f} Hz, "
+                         f"jitter {self.packet_fs['jitter_ms']:.3f} ms")
+        lines.append("DC Offsets (Mean values):")
+        for axis in AXES:
+            lines.append(f"  {axis.upper()}: {self.dc_offset[axis]:.4f} m/s^2")
+        lines.append(f"  Magnitude Mean: {self.magnitude['mean']:.4f} m/s^2 (Expected ~9.81 for static)")
+        lines.append(f"Magnitude: std {self.magnitude['std']:.4f}, "
+                     f"min {self.magnitude['min']:.4f}, max {self.magnitude['max']:.4f} m/s^2")
+        lines.append(f"NaN samples: {sum(self.n_nan.values())}, clipped samples: "
+                     f"{sum(self.n_clipped.values())} (|a| >= {self.clip_level:.1f} m/s^2)")
+        lines.append(f"Flatline runs (>= {FLATLINE_MIN_SAMPLES} samples): {self.flatline['n_runs']}, "
+                     f"longest {self.flatline['longest']} samples")
+        lines.append(f"Dropout gaps: {self.gaps['n_gaps']}, {self.gaps['missing_samples']} missing samples, "
+                     f"{self.gaps['total_ms']:.1f} ms total")
+        for warning in self.warnings:
+            lines.append(f"WARNING: {warning}")
+        return "\n".join(lines)
+
+
+class QualityAccumulator:
+    """
+    Running quality statistics, fed chunk by chunk with update(timestamps, acc).
+    Runs (NaN, flatline) and gaps spanning chunk boundaries are carried over.
+    """
+
+    def __init__(self, nominal_fs=None, full_scale_g=FULL_SCALE_G,
+                 flatline_min_samples=FLATLINE_MIN_SAMPLES, gap_factor=GAP_FACTOR):
+        self.nominal_fs = nominal_fs
+        self.clip_level = CLIP_FRACTION * full_scale_g * STANDARD_GRAVITY
+        self.flatline_min = flatline_min_samples
+        self.gap_factor = gap_factor
+
+        self.n_samples = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        # Set from the measured spacing of the first samples, not from nominal_fs: a
+        # sensor running slower than nominal would otherwise show a gap at every sample
+        self.gap_threshold_ms = None
+
+        self.n_finite = np.zeros(3, dtype=np.int64)
+        self.axis_sum = np.zeros(3)
+        self.axis_sumsq = np.zeros(3)
+        self.n_nan = np.zeros(3, dtype=np.int64)
+        self.n_clipped = np.zeros(3, dtype=np.int64)
+        self.mag_count = 0
+        self.mag_sum = 0.0
+        self.mag_sumsq = 0.0
+        self.mag_min = np.inf
+        self.mag_max = -np.inf
+
+        self.last_values = None
+        self.nan_run = np.zeros(3, dtype=np.int64)
+        self.longest_nan = np.zeros(3, dtype=np.int64)
+        self.flat_run = np.zeros(3, dtype=np.int64)   # Equal consecutive pairs so far
+        self.flat_runs = np.zeros(3, dtype=np.int64)
+        self.flat_samples = np.zeros(3, dtype=np.int64)
+        self.longest_flat = np.zeros(3, dtype=np.int64)
+
+        self.n_gaps = 0
+        self.gap_ms = 0.0
+        self.longest_gap_ms = 0.0
+        self.n_non_monotonic = 0
+
+    def _update_time(self, timestamps):
+        if self.first_timestamp is None:
+            self.first_timestamp = float(timestamps[0])
+            dt = np.diff(timestamps)
+        else:
+            dt = np.diff(timestamps, prepend=self.last_timestamp)
+        self.last_timestamp = float(timestamps[-1])
+        if self.gap_threshold_ms is None and len(dt):
+            # Typical spacing of the first chunk with more than one sample
+            self.gap_threshold_ms = self.gap_factor * float(np.median(dt))
+
+        self.n_non_monotonic += int(np.count_nonzero(dt <= 0))
+        if self.gap_threshold_ms:
+            gaps = dt[dt > self.gap_threshold_ms]
+            if len(gaps):
+                # Time not covered by samples: the spacing minus one nominal interval
+                uncovered = gaps - self.gap_threshold_ms / self.gap_factor
+                self.n_gaps += len(gaps)
+                self.gap_ms += float(uncovered.sum())
+                self.longest_gap_ms = max(self.longest_gap_ms, float(uncovered.max()))
+
+    def _update_runs(self, acc):
+        # NaN runs per axis
+        nan = np.isnan(acc)
+        self.n_nan += nan.sum(axis=0)
+        if nan.any():
+            runs = _run_lengths(nan, self.nan_run)
+            self.longest_nan = np.maximum(self.longest_nan, runs.max(axis=0))
+            self.nan_run = runs[-1]
+        else:
+            self.nan_run[:] = 0
+
+        # Flatline: r equal consecutive pairs ending here = a run of r + 1 identical samples
+        previous = acc[:-1] if self.last_values is None else np.vstack([self.last_values, acc[:-1]])
+        equal = acc[-len(previous):] == previous
+        runs = _run_lengths(equal, self.flat_run)
+        threshold = self.flatline_min - 1
+        self.flat_runs += (runs == threshold).sum(axis=0)
+        self.flat_samples += (runs >= threshold).sum(axis=0) + threshold * (runs == threshold).sum(axis=0)
+        self.longest_flat = np.maximum(self.longest_flat, runs.max(axis=0, initial=0) + 1)
+        self.flat_run = runs[-1] if len(runs) else self.flat_run
+        self.last_values = acc[-1:].copy()
+
+    def update(self, timestamps, acc):
+        """
+        Feeds the next chunk.
+
+        Parameters:
+        - timestamps (np.array): Sample timestamps in ms, shape (n,).
+        - acc (np.array): Acceleration in m/s^2, shape (n, 3). Any float dtype;
+          memory maps are read but never copied as a whole.
+        """
+        n = len(acc)
+        if n == 0:
+            return
+        acc = np.asarray(acc, dtype=np.float64)
+        self.n_samples += n
+        self._update_time(np.asarray(timestamps, dtype=np.float64))
+
+        finite = np.isfinite(acc)
+        clean = np.where(finite, acc, 0.0)
+        self.n_finite += finite.sum(axis=0)
+        self.axis_sum += clean.sum(axis=0)
+        self.axis_sumsq += np.einsum('ij,ij->j', clean, clean)
+        self.n_clipped += (np.abs(clean) >= self.clip_level).sum(axis=0)
+
+        rows = finite.all(axis=1)
+        magnitude_sq = np.einsum('ij,ij->i', clean, clean)[rows]
+        if len(magnitude_sq):
+            magnitude = np.sqrt(magnitude_sq)
+            self.mag_count += len(magnitude)
+            self.mag_sum += float(magnitude.sum())
+            self.mag_sumsq += float(magnitude_sq.sum())
+            self.mag_min = min(self.mag_min, float(magnitude.min()))
+            self.mag_max = max(self.mag_max, float(magnitude.max()))
+
+        self._update_runs(acc)
+
+    def report(self, packet_timestamps=None, packet_sizes=None, gap_map=None, timebase=None):
+        """
+        Builds the QualityReport.
+
+        Parameters:
+        - packet_timestamps, packet_sizes (np.array): Optional packet arrays, for the
+          per-packet Fs and jitter.
+        - gap_map (np.array): Optional timebase gap map; replaces the gaps detected
+          from sample spacing (it also knows the number of missing samples).
+        - timebase (dict): Optional timebase info (drift, rollovers, ...), copied in.
+        """
+        duration_s = 0.0
+        if self.n_samples > 1:
+            duration_s = (self.last_timestamp - self.first_timestamp) / 1000.0
+        effective_fs = self.n_samples / duration_s if duration_s > 0 else 0.0
+        deviation = None
+        if self.nominal_fs and effective_fs > 0:
+            deviation = abs(effective_fs - self.nominal_fs) / self.nominal_fs * 100.0
+
+        count = np.maximum(self.n_finite, 1)
+        mean = self.axis_sum / count
+        std = np.sqrt(np.maximum(self.axis_sumsq / count - mean ** 2, 0.0))
+        mag_n = max(self.mag_count, 1)
+        mag_mean = self.mag_sum / mag_n
+        magnitude = {
+            'mean': mag_mean,
+            'std': float(np.sqrt(max(self.mag_sumsq / mag_n - mag_mean ** 2, 0.0))),
+            'min': self.mag_min if self.mag_count else float('nan'),
+            'max': self.mag_max if self.mag_count else float('nan'),
+        }
+
+        if gap_map is not None:
+            gaps = {
+                'n_gaps': int(len(gap_map)),
+                'missing_samples': int(np.sum(gap_map['missing_samples'])),
+                'total_ms': float(np.sum(gap_map['duration_ms'])),
+                'longest_ms': float(np.max(gap_map['duration_ms'])) if len(gap_map) else 0.0,
+            }
+        else:
+            interval_ms = self.gap_threshold_ms / self.gap_factor if self.gap_threshold_ms else 0.0
+            gaps = {
+                'n_gaps': self.n_gaps,
+                'missing_samples': int(round(self.gap_ms / interval_ms)) if interval_ms else 0,
+                'total_ms': self.gap_ms,
+                'longest_ms': self.longest_gap_ms,
+            }
+        gaps['n_non_monotonic'] = self.n_non_monotonic
+
+        packet_fs = None
+        if packet_timestamps is not None and packet_sizes is not None:
+            packet_fs = packet_fs_stats(packet_timestamps, packet_sizes, self.gap_factor)
+
+        report = QualityReport(
+            n_samples=self.n_samples,
+            duration_s=duration_s,
+            effective_fs=effective_fs,
+            nominal_fs=self.nominal_fs,
+            fs_deviation_pct=deviation,
+            packet_fs=packet_fs,
+            dc_offset=dict(zip(AXES, mean.tolist())),
+            axis_std=dict(zip(AXES, std.tolist())),
+            magnitude=magnitude,
+            n_nan=dict(zip(AXES, self.n_nan.tolist())),
+            longest_nan_run=int(self.longest_nan.max()),
+            n_clipped=dict(zip(AXES, self.n_clipped.tolist())),
+            clip_level=self.clip_level,
+            flatline={
+                'n_runs': int(self.flat_runs.sum()),
+                'samples': int(self.flat_samples.sum()),
+                'longest': int(self.longest_flat.max()) if self.n_samples else 0,
+            },
+            gaps=gaps,
+            timebase={key: value for key, value in (timebase or {}).items()
+                      if not isinstance(value, np.ndarray)},
+            warnings=[],
+        )
+        report.warnings = quality_warnings(report)
+        return report
+
+
+def packet_fs_stats(packet_timestamps, packet_sizes, gap_factor=GAP_FACTOR):
+    """
+    Instantaneous sampling rate of every packet (its sample count over the spacing to
+    the previous packet), excluding missing timestamps and dropouts.
+
+    Returns:
+    - dict or None: median / p5 / p95 Fs (Hz) and jitter_ms (std of the packet
+      spacing around its expected value). None with fewer than two usable packets.
+    """
+    t = np.asarray(packet_timestamps, dtype=np.float64)
+    sizes = np.asarray(packet_sizes, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(t))
+    if len(valid) < 2:
+        return None
+
+    consecutive = np.diff(valid) == 1
+    dt = np.diff(t[valid])[consecutive]
+    n = sizes[valid[1:]][consecutive]
+    usable = dt > 0
+    dt, n = dt[usable], n[usable]
+    if len(dt) == 0:
+        return None
+
+    interval = float(np.median(dt / n))
+    expected = n * interval
+    usable = dt - expected <= gap_factor * expected
+    dt, n, expected = dt[usable], n[usable], expected[usable]
+    fs = n / dt * 1000.0
+    p5, median, p95 = np.percentile(fs, [5, 50, 95])
+    return {
+        'median': float(median),
+        'p5': float(p5),
+        'p95': float(p95),
+        'jitter_ms': float(np.std(dt - n * float(dt.sum() / n.sum()))),
+        'n_packets': int(len(dt)),
+    }
+
+
+def quality_warnings(report):
+    """
+    Human-readable warnings for the problems found in a QualityReport.
+    """
+    warnings = []
+    if report.fs_deviation_pct is not None and report.fs_deviation_pct > FS_DEVIATION_WARN_PCT:
+        warnings.append(f"Significant deviation (>{FS_DEVIATION_WARN_PCT:g}%) from nominal Fs!")
+    if report.effective_fs == 0:
+        warnings.append("Cannot compute effective Fs.")
+    if sum(report.n_nan.values()):
+        warnings.append(f"{sum(report.n_nan.values())} NaN samples "
+                        f"(longest run {report.longest_nan_run}).")
+    if sum(report.n_clipped.values()):
+        warnings.append(f"{sum(report.n_clipped.values())} clipped samples.")
+    if report.flatline['n_runs']:
+        warnings.append(f"{report.flatline['n_runs']} flatline runs "
+                        f"(longest {report.flatline['longest']} samples).")
+    if report.gaps['n_gaps']:
+        warnings.append(f"{report.gaps['n_gaps']} dropout gaps "
+                        f"({report.gaps['missing_samples']} missing samples).")
+    return warnings
+
+
+def assess_quality(timestamps, acc, nominal_fs=None, packet_timestamps=None, packet_sizes=None,
+                   gap_map=None, timebase=None, chunk_samples=CHUNK_SAMPLES):
+    """
+    Runs the quality checks over whole arrays (or memory maps) in chunks.
+
+    Parameters:
+    - timestamps (np.array): Sample timestamps (ms), shape (N,).
+    - acc (np.array): Acceleration (m/s^2), shape (N, 3).
+    - nominal_fs (float): Declared sampling rate (Hz), optional.
+    - packet_timestamps, packet_sizes, gap_map, timebase: Optional loader outputs,
+      see QualityAccumulator.report().
+    - chunk_samples (int): Samples per chunk.
+
+    Returns:
+    - QualityReport
+    """
+    accumulator = QualityAccumulator(nominal_fs)
+    for start in range(0, len(acc), chunk_samples):
+        stop = start + chunk_samples
+        accumulator.update(timestamps[start:stop], acc[start:stop])
+    return accumulator.report(packet_timestamps, packet_sizes, gap_map, timebase)
+
+
+def assess_recording(arrays, nominal_fs=None, chunk_samples=CHUNK_SAMPLES):
+    """
+    Quality report for the dict returned by load_movesense_arrays() or
+    recording_cache.load_recording_arrays(), including packet Fs and the gap map.
+    """
+    return assess_quality(
+        arrays['timestamp'], arrays['acc'], nominal_fs,
+        packet_timestamps=arrays.get('packet_timestamps'),
+        packet_sizes=arrays.get('packet_sizes'),
+        gap_map=arrays.get('gap_map'),
+        timebase=arrays.get('timebase'),
+        chunk_samples=chunk_samples,
+    )
+
+
+if __name__ == '__main__':
+    # --- QA of every recording in data/ through the binary cache ---
+    sys.path.append(os.path.dirname(__file__))
+    from recording_cache import load_recording_arrays
+
+    data_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+    for name in sorted(f for f in os.listdir(data_dir) if f.endswith('.json')):
+        arrays = load_recording_arrays(os.path.join(data_dir, name), verbose=False)
+        start = time.perf_counter()
+        report = assess_recording(arrays, nominal_fs=833.0)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        print(f"\n{name} ({elapsed_ms:.1f} ms)")
+        print(report.format())
@@ -0,0 +1,261 @@
+import time
+
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+# ==============================================================================
+# SPECTRAL ACCUMULATOR: spectral_accumulator.py
+# Purpose: Incremental Welch PSD and downsampled spectrogram for whole-shift
+#          recordings. Chunks are fed as they are loaded or streamed; only the
+#          last partial segment and the running sums are kept, so memory is
+#          bounded by nperseg x spectrogram rows instead of the recording length.
+# ==============================================================================
+
+# --- 1. Accumulator Constants ---
+# Welch segment length and overlap, as in compute_welch_psd()
+WINDOW_SEC = 1.0
+OVERLAP_RATIO = 0.5
+# Time resolution of the spectrogram before any merging
+SPECTROGRAM_INTERVAL_S = 10.0
+# Upper bound on spectrogram rows; above it adjacent rows are merged (resolution halves)
+MAX_SPECTROGRAM_ROWS = 512
+# Segments transformed per FFT call
+SEGMENT_BATCH = 256
+
+
+class SpectralAccumulator:
+    """
+    Running Welch average and time-frequency summary of one or more channels.
+
+    psd() returns the same estimate as signal.welch(x, fs, window, nperseg, noverlap)
+    over everything fed so far (detrend='constant', scaling='density').
+
+    Example:
+        acc = SpectralAccumulator(fs=833.0)
+        for chunk in chunks:                  # chunk: shape (n,) or (n, n_channels)
+            acc.update(chunk)
+        freqs, psd = acc.psd()
+        times_s, freqs, sxx = acc.spectrogram()
+    """
+
+    def __init__(self, fs, window_sec=WINDOW_SEC, overlap_ratio=OVERLAP_RATIO, window='hann',
+                 spectrogram_interval_s=SPECTROGRAM_INTERVAL_S, max_rows=MAX_SPECTROGRAM_ROWS):
+        """
+        Parameters:
+        - fs (float): Sampling frequency (Hz).
+        - window_sec (float): Welch segment length (s).
+        - overlap_ratio (float): Segment overlap, 0 <= ratio < 1.
+        - window (str): Taper passed to signal.get_window.
+        - spectrogram_interval_s (float): Initial duration of one spectrogram row (s).
+        - max_rows (int): Maximum number of spectrogram rows kept (at least 2).
+        """
+        self.nperseg = int(window_sec * fs)
+        self.noverlap = int(self.nperseg * overlap_ratio)
+        if self.nperseg < 2 or not 0 <= self.noverlap < self.nperseg:
+            raise ValueError("window_sec must cover at least 2 samples and overlap_ratio must be in [0, 1).")
+        if max_rows < 2:
+            raise ValueError("max_rows must be at least 2.")
+
+        self.fs = float(fs)
+        self.step = self.nperseg - self.noverlap
+        self.max_rows = max_rows
+        self.initial_row_segments = max(1, int(round(spectrogram_interval_s * fs / self.step)))
+
+        self.taper = signal.get_window(window, self.nperseg)
+        self.freqs = scipy.fft.rfftfreq(self.nperseg, d=1.0 / fs)
+        scale = np.full(len(self.freqs), 2.0 / (fs * np.sum(self.taper ** 2)))
+        scale[0] /= 2.0
+        if self.nperseg % 2 == 0:
+            scale[-1] /= 2.0
+        self.scale = scale
+        self.reset()
+
+    def reset(self):
+        """
+        Drops everything accumulated so far.
+        """
+        self.pending = None          # Samples not yet covered by a complete segment
+        self.n_samples = 0           # Samples fed in total
+        self.n_segments = 0          # Segments averaged so far
+        self.psd_sum = None
+        self.row_segments = self.initial_row_segments
+        self.row_sums = None
+        self.row_counts = np.zeros(self.max_rows, dtype=np.int64)
+        self.squeeze = False
+
+    def _allocate(self, n_channels):
+        self.psd_sum = np.zeros((len(self.freqs), n_channels))
+        self.row_sums = np.zeros((self.max_rows, len(self.freqs), n_channels))
+
+    def _merge_rows(self):
+        """
+        Halves the time resolution: every pair of adjacent rows becomes one row.
+        """
+        n_pairs = self.max_rows // 2
+        self.row_sums[:n_pairs] = self.row_sums[0:2 * n_pairs:2] + self.row_sums[1:2 * n_pairs:2]
+        self.row_counts[:n_pairs] = self.row_counts[0:2 * n_pairs:2] + self.row_counts[1:2 * n_pairs:2]
+        kept = n_pairs
+        if self.max_rows % 2:
+            # An odd last row has no partner and becomes the last merged row
+            self.row_sums[kept] = self.row_sums[-1]
+            self.row_counts[kept] = self.row_counts[-1]
+            kept += 1
+        self.row_sums[kept:] = 0.0
+        self.row_counts[kept:] = 0
+        self.row_segments *= 2
+
+    def _add_segments(self, segments, first_index):
+        """
+        Accumulates a batch of segments, shape (n_seg, n_channels, nperseg);
+        first_index is the running number of the first segment.
+        """
+        segments = segments - segments.mean(axis=-1, keepdims=True)
+        spectrum = scipy.fft.rfft(segments * self.taper, axis=-1)
+        # (n_seg, n_channels, n_freqs) -> (n_seg, n_freqs, n_channels)
+        psd = ((spectrum.real ** 2 + spectrum.imag ** 2) * self.scale).transpose(0, 2, 1)
+        self.psd_sum += psd.sum(axis=0)
+
+        seg_index = first_index + np.arange(len(psd))
+        while seg_index[-1] // self.row_segments >= self.max_rows:
+            self._merge_rows()
+        rows = seg_index // self.row_segments
+        # Segment indices are sorted, so each row is one contiguous run
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        self.row_sums[rows[starts]] += np.add.reduceat(psd, starts, axis=0)
+        self.row_counts[rows[starts]] += np.diff(np.r_[starts, len(rows)])
+
+    def update(self, chunk):
+        """
+        Feeds the next chunk of samples.
+
+        Parameters:
+        - chunk (np.array): Shape (n,) or (n, n_channels); the channel count must stay
+          the same between calls.
+
+        Returns:
+        - int: Number of new Welch segments completed by this chunk.
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.ndim == 1:
+            self.squeeze = True
+            chunk = chunk[:, None]
+        if self.psd_sum is None:
+            self._allocate(chunk.shape[1])
+        elif chunk.shape[1] != self.psd_sum.shape[1]:
+            raise ValueError(f"Expected {self.psd_sum.shape[1]} channels, got {chunk.shape[1]}.")
+        self.n_samples += len(chunk)
+
+        data = chunk if self.pending is None else np.concatenate([self.pending, chunk])
+        if len(data) < self.nperseg:
+            self.pending = data.copy()
+            return 0
+
+        # (n_seg, n_channels, nperseg) strided view; nothing is copied here
+        segments = sliding_window_view(data, self.nperseg, axis=0)[::self.step]
+        for start in range(0, len(segments), SEGMENT_BATCH):
+            batch = segments[start:start + SEGMENT_BATCH]
+            self._add_segments(batch, self.n_segments + start)
+
+        n_new = len(segments)
+        self.n_segments += n_new
+        self.pending = data[n_new * self.step:].copy()
+        return n_new
+
+    def _shape(self, array):
+        return array[..., 0] if self.squeeze else array
+
+    def psd(self):
+        """
+        Welch PSD over all complete segments so far.
+
+        Returns:
+        - (np.array, np.array): freqs (n_freqs,) and psd (n_freqs,) or (n_freqs, n_channels).
+        """
+        if self.n_segments == 0:
+            raise ValueError(f"Need at least {self.nperseg} samples for a Welch estimate.")
+        return self.freqs, self._shape(self.psd_sum / self.n_segments)
+
+    def spectrogram(self):
+        """
+        Mean PSD per time row.
+
+        Returns:
+        - (np.array, np.array, np.array): times_s (n_rows,) at the start of each row,
+          freqs (n_freqs,) and sxx (n_rows, n_freqs[, n_channels]).
+        """
+        if self.n_segments == 0:
+            raise ValueError(f"Need at least {self.nperseg} samples for a spectrogram.")
+        n_rows = int(np.flatnonzero(self.row_counts)[-1]) + 1
+        counts = self.row_counts[:n_rows]
+        sxx = self.row_sums[:n_rows] / np.maximum(counts, 1)[:, None, None]
+        sxx[counts == 0] = np.nan
+        times_s = np.arange(n_rows) * self.row_segments * self.step / self.fs
+        return times_s, self.freqs, self._shape(sxx)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the accumulator state (bytes), independent of recording length.
+        """
+        held = [self.psd_sum, self.row_sums, self.row_counts, self.pending]
+        return sum(array.nbytes for array in held if array is not None)
+
+
+def accumulate_spectrum(data, fs, chunk_size=1 << 16, **kwargs):
+    """
+    Runs a SpectralAccumulator over an array (or memory map) chunk by chunk.
+
+    Parameters:
+    - data (np.array): Shape (n,) or (n, n_channels).
+    - fs (float): Sampling frequency (Hz).
+    - chunk_size (int): Samples per update() call.
+    - kwargs: Passed to SpectralAccumulator.
+
+    Returns:
+    - SpectralAccumulator
+    """
+    accumulator = SpectralAccumulator(fs, **kwargs)
+    for start in range(0, len(data), chunk_size):
+        accumulator.update(data[start:start + chunk_size])
+    return accumulator
+
+
+if __name__ == '__main__':
+    # --- Example: 8 h synthetic shift at 833 Hz, streamed in 1 s chunks ---
+    fs = 833.0
+    chunk_s = 1.0
+    n_chunks = 8 * 3600
+    rng = np.random.default_rng(0)
+    chunk_t = np.arange(int(chunk_s * fs)) / fs
+
+    accumulator = SpectralAccumulator(fs)
+    start = time.perf_counter()
+    for i in range(n_chunks):
+        # Tool running (70 Hz) during the second half of every hour
+        on = (i % 3600) >= 1800
+        chunk = rng.normal(0, 0.2, (len(chunk_t), 3))
+        if on:
+            chunk += 5.0 * np.sin(2 * np.pi * 70 * (chunk_t + i * chunk_s))[:, None]
+        accumulator.update(chunk)
+    elapsed = time.perf_counter() - start
+
+    freqs, psd = accumulator.psd()
+    times_s, _, sxx = accumulator.spectrogram()
+    print("--- Spectral Accumulator ---")
+    print(f"Samples: {accumulator.n_samples:,} ({accumulator.n_samples / fs / 3600:.1f} h), "
+          f"segments: {accumulator.n_segments:,}, time: {elapsed:.1f} s")
+    print(f"State: {accumulator.nbytes / 1e6:.1f} MB (raw signal would be "
+          f"{accumulator.n_samples * 3 * 8 / 1e6:.0f} MB)")
+    print(f"PSD peak: {freqs[np.argmax(psd[:, 0])]:.1f} Hz")
+    print(f"Spectrogram: {sxx.shape[0]} rows of {times_s[1] - times_s[0]:.0f} s")
+
+    # Cross-check against signal.welch on a short signal fed in uneven chunks
+    x = rng.normal(0, 1, (50_000, 2))
+    check = SpectralAccumulator(fs)
+    for chunk in np.array_split(x, [100, 1234, 1300, 20_000]):
+        check.update(chunk)
+    _, reference = signal.welch(x, fs, window='hann', nperseg=check.nperseg, noverlap=check.noverlap, axis=0)
+    print(f"Max relative deviation from signal.welch: "
+          f"{np.max(np.abs(check.psd()[1] - reference) / reference.max()):.1e}")
@@ -0,0 +1,380 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# ==============================================================================
+# SYNTHETIC RECORDINGS: synthetic_recording.py
+# Purpose: Reproducible Movesense recordings of any length for benchmarks and
+#          pipeline tests: a shift of idle / walking / stairs / drill / grinder
+#          segments in a configurable mix, at 50, 104 or 833 Hz (or any rate), with
+#          a configurable packet size, packet dropouts (independent or in bursts),
+#          timestamp jitter and clock drift.
+#
+# Output formats:
+#   <name>.json   Movesense JSON ({"data": [{"acc": {"Timestamp", "ArrayAcc"}}]}),
+#                 read by vibration.ingest.load_movesense_arrays / iter_movesense_chunks
+#   <name>.npy    Binary packet file (vibration.ingest.movesense_packet_dtype),
+#                 read by load_movesense_binary / iter_movesense_binary_chunks
+# Next to each recording:
+#   <name>.truth.json   The generation settings and the true segments (class, start, stop)
+#   <name>.labels.npy   Class code of every delivered packet (index into CLASS_NAMES)
+#
+# Everything is generated block by block, so an 8 h, 833 Hz recording (24 M samples,
+# ~1 GB of JSON, 0.3 GB binary) is written with a few MB of memory. The same
+# settings and seed always give the same file.
+# Usage:   python utils/synthetic_recording.py OUT [--minutes M] [--fs FS]
+#                 [--packet-size N] [--mix shift|tools|noise|CLASS=W,...]
+#                 [--dropout P] [--dropout-burst N] [--format json|binary]
+# ==============================================================================
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from replay import Impairments
+from vibration.ingest import movesense_packet_dtype
+
+# --- 1. Generator Constants ---
+# Sampling rates of the Movesense accelerometer used in this project
+MOVESENSE_FS = (50.0, 104.0, 833.0)
+DEFAULT_PACKET_SIZE = 8
+# Packets generated per step; bounds the memory of the generator
+BLOCK_PACKETS = 8192
+# Mean length of one activity segment (s); lengths are exponentially distributed
+MEAN_SEGMENT_S = 30.0
+MIN_SEGMENT_S = 1.0
+GRAVITY = np.array([0.0, -2.3, 9.5])
+SENSOR_NOISE = 0.05  # m/s^2 per axis
+
+# Class codes of the labels: index into CLASS_NAMES. Folder names as in 01_data_collection/raw
+CLASS_NAMES = ('idle', 'noise_walking', 'noise_stairs', 'tool_drill', 'tool_grinder')
+
+# Signal model per class. Steps are half-sine impacts at step_hz; tools are a tone
+# (plus harmonics) on all three axes. Tones above Nyquist alias, as they would
+# without the sensor's anti-aliasing filter.
+CLASS_PROFILES = {
+    'idle': {},
+    'noise_walking': {'step_hz': 1.8, 'step_amplitude': 3.0, 'sway': 0.8},
+    'noise_stairs': {'step_hz': 1.3, 'step_amplitude': 5.0, 'sway': 1.0},
+    'tool_drill': {'tool_hz': 70.0, 'harmonics': (1.0, 0.3), 'tool_amplitude': 5.0, 'broadband': 0.3},
+    'tool_grinder': {'tool_hz': 140.0, 'harmonics': (1.0, 0.5, 0.2), 'tool_amplitude': 8.0, 'broadband': 1.0},
+}
+TOOL_AXES = np.array([1.0, 0.8, 0.6])
+
+# Share of the recording time per class
+MIXES = {
+    'shift': {'idle': 0.3, 'noise_walking': 0.2, 'noise_stairs': 0.05, 'tool_drill': 0.25, 'tool_grinder': 0.2},
+    'tools': {'tool_drill': 0.5, 'tool_grinder': 0.5},
+    'noise': {'idle': 0.4, 'noise_walking': 0.4, 'noise_stairs': 0.2},
+}
+FORMATS = {'json': '.json', 'binary': '.npy'}
+TRUTH_SUFFIX = '.truth.json'
+LABELS_SUFFIX = '.labels.npy'
+
+
+def parse_mix(mix):
+    """
+    Class weights from a preset name (MIXES), a class name, 'class=weight,...' or a dict.
+
+    Returns:
+    - dict: {class_name: weight}, weights summing to 1.
+    """
+    if isinstance(mix, str):
+        if mix in MIXES:
+            mix = MIXES[mix]
+        elif mix in CLASS_PROFILES:
+            mix = {mix: 1.0}
+        else:
+            try:
+                mix = {name.strip(): float(weight) for name, weight in
+                       (item.split('=') for item in mix.split(','))}
+            except ValueError:
+                raise ValueError(f"Invalid mix '{mix}': use {sorted(MIXES)}, a class name or CLASS=W,...")
+    unknown = set(mix) - set(CLASS_PROFILES)
+    if unknown:
+        raise ValueError(f"Unknown classes in mix: {sorted(unknown)} (known: {list(CLASS_NAMES)}).")
+    total = float(sum(mix.values()))
+    if total <= 0 or min(mix.values()) < 0:
+        raise ValueError("Mix weights must be non-negative and not all zero.")
+    return {name: mix[name] / total for name in CLASS_NAMES if mix.get(name)}
+
+
+class SyntheticRecording:
+    """
+    Settings and block-wise generator of one synthetic recording.
+
+    Example:
+        recording = SyntheticRecording(minutes=60, fs=104.0, dropout=0.01)
+        recording.write('shift_104hz.json')     # or .npy for the binary format
+    """
+
+    def __init__(self, minutes=10.0, fs=833.0, packet_size=DEFAULT_PACKET_SIZE, mix='shift',
+                 dropout=0.0, dropout_burst=1.0, jitter_ms=2.0, drift_ppm=0.0, start_ms=0,
+                 mean_segment_s=MEAN_SEGMENT_S, seed=0):
+        """
+        Parameters:
+        - minutes (float): Length of the recording (before dropouts).
+        - fs (float): Sampling rate (Hz); the sensor uses MOVESENSE_FS.
+        - packet_size (int): Samples per packet.
+        - mix (str or dict): Share of each class, see parse_mix().
+        - dropout (float): Fraction of packets lost, at most dropout_burst / (1 + dropout_burst).
+        - dropout_burst (float): Mean number of packets per loss (1 = independent losses).
+        - jitter_ms (float): Standard deviation of the Timestamp jitter (ms).
+        - drift_ppm (float): Sample clock drift against the Timestamp clock; positive = samples
+          come faster than fs.
+        - start_ms (int): Timestamp of the first sample (the uint32 counter rolls over).
+        - mean_segment_s (float): Mean length of one activity segment (s).
+        - seed (int): Seed of every random choice.
+        """
+        if minutes <= 0 or fs <= 0:
+            raise ValueError("minutes and fs must be positive.")
+        if packet_size < 1:
+            raise ValueError(f"packet_size must be >= 1, got {packet_size}.")
+        if jitter_ms < 0:
+            raise ValueError(f"jitter_ms must be >= 0, got {jitter_ms}.")
+        self.minutes = float(minutes)
+        self.fs = float(fs)
+        self.packet_size = int(packet_size)
+        self.mix = parse_mix(mix)
+        # Validates dropout / dropout_burst
+        self.impairments = Impairments(dropout, dropout_burst, seed=seed)
+        self.jitter_ms = float(jitter_ms)
+        self.drift_ppm = float(drift_ppm)
+        self.start_ms = int(start_ms)
+        self.mean_segment_s = float(mean_segment_s)
+        self.seed = int(seed)
+
+        self.n_packets = int(self.minutes * 60.0 * self.fs) // self.packet_size
+        self.n_samples = self.n_packets * self.packet_size
+        self.segments = self._plan_segments()
+        self.keep = self.impairments.keep_mask(self.n_packets, np.random.default_rng([self.seed, 1]))
+        self.n_delivered = int(self.keep.sum())
+
+    def settings(self):
+        return {
+            'minutes': self.minutes, 'fs': self.fs, 'packet_size': self.packet_size, 'mix': self.mix,
+            'dropout': self.impairments.loss, 'dropout_burst': self.impairments.burst_packets,
+            'jitter_ms': self.jitter_ms, 'drift_ppm': self.drift_ppm, 'start_ms': self.start_ms,
+            'mean_segment_s': self.mean_segment_s, 'seed': self.seed,
+        }
+
+    def _plan_segments(self):
+        """
+        Activity segments covering the recording: structured array (code, start_s, stop_s).
+        Consecutive segments of the same class are merged.
+        """
+        rng = np.random.default_rng([self.seed, 0])
+        duration_s = self.n_samples / self.fs
+        codes = np.array([CLASS_NAMES.index(name) for name in self.mix])
+        weights = np.array(list(self.mix.values()))
+        # Segment lengths do not depend on the class, so time shares follow the weights
+        n = int(duration_s / self.mean_segment_s * 2) + 16
+        while True:
+            lengths = MIN_SEGMENT_S + rng.exponential(max(self.mean_segment_s - MIN_SEGMENT_S, 1e-3), n)
+            if lengths.sum() >= duration_s:
+                break
+            n *= 2
+        segment_codes = rng.choice(codes, size=n, p=weights)
+        bounds = np.concatenate([[0.0], np.cumsum(lengths)])
+        n_used = int(np.searchsorted(bounds, duration_s))
+        segment_codes, starts = segment_codes[:n_used], bounds[:n_used]
+
+        change = np.concatenate([[True], segment_codes[1:] != segment_codes[:-1]])
+        segments = np.empty(int(change.sum()), dtype=[('code', np.int8), ('start_s', np.float64),
+                                                      ('stop_s', np.float64)])
+        segments['code'] = segment_codes[change]
+        segments['start_s'] = starts[change]
+        segments['stop_s'] = np.append(starts[change][1:], duration_s)
+        return segments
+
+    def sample_codes(self, sample_index):
+        """
+        Class code of each (undropped) sample index.
+        """
+        t = np.asarray(sample_index) / self.fs
+        return self.segments['code'][np.searchsorted(self.segments['start_s'], t, side='right') - 1]
+
+    def _signal(self, sample_index, rng):
+        """
+        Acceleration (n, 3) float32 of consecutive samples starting at sample_index[0].
+        """
+        t = sample_index / self.fs
+        codes = self.sample_codes(sample_index)
+        acc = np.empty((len(t), 3))
+        acc[:] = GRAVITY
+        acc += rng.normal(0.0, SENSOR_NOISE, acc.shape)
+        # Slow wrist orientation changes in every segment
+        acc[:, 0] += 0.3 * np.sin(2 * np.pi * 0.11 * t)
+        acc[:, 1] += 0.2 * np.sin(2 * np.pi * 0.07 * t + 1.0)
+
+        for code in np.unique(codes):
+            profile = CLASS_PROFILES[CLASS_NAMES[code]]
+            on = codes == code
+            t_on = t[on]
+            if 'step_hz' in profile:
+                # Half-sine heel strikes on the vertical axis, sway on the others
+                phase = (t_on * profile['step_hz']) % 1.0
+                impact = np.where(phase < 0.15, np.sin(np.pi * phase / 0.15), 0.0)
+                acc[on, 2] += profile['step_amplitude'] * impact
+                sway = profile['sway'] * np.sin(2 * np.pi * profile['step_hz'] / 2 * t_on)
+                acc[on, 0] += sway
+                acc[on, 1] += 0.5 * sway
+            if 'tool_hz' in profile:
+                tone = sum(weight * np.sin(2 * np.pi * profile['tool_hz'] * (h + 1) * t_on)
+                           for h, weight in enumerate(profile['harmonics']))
+                acc[on] += profile['tool_amplitude'] * tone[:, None] * TOOL_AXES
+                acc[on] += rng.normal(0.0, profile['broadband'], (len(t_on), 3))
+        return acc.astype(np.float32)
+
+    def iter_blocks(self, block_packets=BLOCK_PACKETS):
+        """
+        Generates the delivered packets block by block.
+
+        Yields:
+        - (timestamps, acc, codes): uint32 Timestamps (ms, last sample of each packet),
+          float32 samples of shape (n_packets, packet_size, 3) and the int8 class code
+          of each packet (class at its first sample).
+        """
+        rng = np.random.default_rng([self.seed, 2])
+        k = self.packet_size
+        clock = 1000.0 / self.fs * (1.0 - self.drift_ppm * 1e-6)
+        for first in range(0, self.n_packets, block_packets):
+            n = min(block_packets, self.n_packets - first)
+            sample_index = np.arange(first * k, (first + n) * k)
+            # Draw the signal for dropped packets too, so the signal does not depend on the losses
+            acc = self._signal(sample_index, rng).reshape(n, k, 3)
+            last_sample = sample_index[k - 1::k]
+            t_ms = self.start_ms + last_sample * clock
+            if self.jitter_ms:
+                t_ms = t_ms + rng.normal(0.0, self.jitter_ms, n)
+            timestamps = (np.round(t_ms).astype(np.int64) % 2 ** 32).astype(np.uint32)
+            codes = self.sample_codes(sample_index[::k]).astype(np.int8)
+            keep = self.keep[first:first + n]
+            yield timestamps[keep], acc[keep], codes[keep]
+
+    def write_json(self, path):
+        """
+        Writes the Movesense JSON file. Returns the per-packet class codes.
+        """
+        # One %-format per packet: Timestamp plus packet_size x/y/z triples
+        sample = '{"x":%.5g,"y":%.5g,"z":%.5g}'
+        packet_format = '{"acc":{"Timestamp":%d,"ArrayAcc":[' + ','.join([sample] * self.packet_size) + ']}}'
+        codes = []
+        with open(path, 'w') as f:
+            f.write('{"data": [\n')
+            first = True
+            for timestamps, acc, block_codes in self.iter_blocks():
+                if not len(timestamps):
+                    continue
+                rows = np.column_stack([timestamps, acc.reshape(len(acc), -1).astype(np.float64)])
+                text = ',\n'.join([packet_format % tuple(row) for row in rows.tolist()])
+                f.write(text if first else ',\n' + text)
+                first = False
+                codes.append(block_codes)
+            f.write('\n]}\n')
+        return np.concatenate(codes) if codes else np.empty(0, dtype=np.int8)
+
+    def write_binary(self, path):
+        """
+        Writes the binary packet file (.npy). Returns the per-packet class codes.
+        """
+        packets = np.lib.format.open_memmap(path, mode='w+', dtype=movesense_packet_dtype(self.packet_size),
+                                            shape=(self.n_delivered,))
+        codes = np.empty(self.n_delivered, dtype=np.int8)
+        n = 0
+        for timestamps, acc, block_codes in self.iter_blocks():
+            packets['timestamp'][n:n + len(timestamps)] = timestamps
+            packets['acc'][n:n + len(timestamps)] = acc
+            codes[n:n + len(timestamps)] = block_codes
+            n += len(timestamps)
+        packets.flush()
+        del packets
+        return codes
+
+    def write(self, path):
+        """
+        Writes the recording (format from the extension, see FORMATS) plus its
+        .truth.json and .labels.npy files.
+
+        Returns:
+        - dict: The truth record (settings, segments, counts, file size).
+        """
+        base, ext = os.path.splitext(path)
+        if ext == FORMATS['json']:
+            codes = self.write_json(path)
+        elif ext == FORMATS['binary']:
+            codes = self.write_binary(path)
+        else:
+            raise ValueError(f"Unknown recording format '{ext}' (use {sorted(FORMATS.values())}).")
+        np.save(base + LABELS_SUFFIX, codes)
+
+        truth = {
+            'settings': self.settings(),
+            'format': ext.lstrip('.'),
+            'class_names': list(CLASS_NAMES),
+            'n_packets': self.n_packets,
+            'n_delivered_packets': self.n_delivered,
+            'n_samples': self.n_delivered * self.packet_size,
+            'file_bytes': os.path.getsize(path),
+            'segments': [{'class_name': CLASS_NAMES[code], 'start_s': round(float(start), 6),
+                          'stop_s': round(float(stop), 6)} for code, start, stop in self.segments.tolist()],
+        }
+        with open(base + TRUTH_SUFFIX, 'w') as f:
+            json.dump(truth, f, indent=1)
+        return truth
+
+
+def load_truth(path):
+    """
+    The .truth.json record and the per-packet class codes of a generated recording.
+
+    Returns:
+    - (dict, np.array)
+    """
+    base = os.path.splitext(path)[0]
+    with open(base + TRUTH_SUFFIX, 'r') as f:
+        truth = json.load(f)
+    return truth, np.load(base + LABELS_SUFFIX)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Movesense recording.")
+    parser.add_argument('out', help="Output file (.json or .npy) or folder.")
+    parser.add_argument('--minutes', type=float, default=10.0, help="Length (default: 10 min; 480 = 8 h).")
+    parser.add_argument('--fs', type=float, default=833.0, help=f"Sampling rate (Movesense: {MOVESENSE_FS}).")
+    parser.add_argument('--packet-size', type=int, default=DEFAULT_PACKET_SIZE, help="Samples per packet.")
+    parser.add_argument('--mix', default='shift', help=f"{sorted(MIXES)}, a class name or CLASS=W,...")
+    parser.add_argument('--dropout', type=float, default=0.0, help="Fraction of packets lost (at most burst / (1 + burst)).")
+    parser.add_argument('--dropout-burst', type=float, default=1.0, help="Mean packets per loss.")
+    parser.add_argument('--jitter-ms', type=float, default=2.0, help="Timestamp jitter (ms).")
+    parser.add_argument('--drift-ppm', type=float, default=0.0, help="Sensor clock drift (ppm).")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='json',
+                        help="Used when OUT is a folder (default: json).")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    recording = SyntheticRecording(args.minutes, args.fs, args.packet_size, args.mix, args.dropout,
+                                   args.dropout_burst, args.jitter_ms, args.drift_ppm, seed=args.seed)
+    path = args.out
+    if os.path.isdir(path) or not os.path.splitext(path)[1]:
+        os.makedirs(path, exist_ok=True)
+        path = os.path.join(path, f"synthetic_{args.minutes:g}min_{args.fs:g}hz{FORMATS[args.format]}")
+
+    start = time.perf_counter()
+    truth = recording.write(path)
+    elapsed_s = time.perf_counter() - start
+    print(f"Wrote {path}: {truth['n_samples']:,} samples in {truth['n_delivered_packets']:,} packets "
+          f"({truth['n_packets'] - truth['n_delivered_packets']:,} dropped), "
+          f"{truth['file_bytes'] / 1e6:.1f} MB in {elapsed_s:.1f} s")
+    shares = {}
+    for segment in truth['segments']:
+        name = segment['class_name']
+        shares[name] = shares.get(name, 0.0) + segment['stop_s'] - segment['start_s']
+    duration_s = recording.n_samples / recording.fs
+    print("Class shares: " + ', '.join(f"{name} {share / duration_s:.0%}" for name, share in shares.items()))
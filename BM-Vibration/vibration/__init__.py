@@ -0,0 +1,62 @@
+import importlib
+
+# ==============================================================================
+# VIBRATION CORE: the headless part of the BM-Vibration signal chain
+#   vibration.ingest        streaming Movesense JSON / binary packet parsing
+#   vibration.timebase      per-sample timestamps, dropouts, resampling
+#   vibration.filtering     high-pass filters (whole recording, blockwise, streaming)
+#   vibration.segmentation  overlapping windows and window labels
+#   vibration.spectral      FFT and Welch PSD
+#   vibration.exposure      ISO 5349 Wh weighting and daily exposure A(8)
+#
+# Nothing here imports matplotlib. SciPy's signal module is imported on the first
+# filter / Welch call, and pandas only by the functions that return DataFrames.
+# The names below are also available from the package itself, e.g.
+#   from vibration import load_movesense_arrays
+# and the submodule behind a name is only imported when that name is first used.
+# Import time is checked by benchmarks/bench_import.py.
+#
+# Entry point: BM-Vibration/ on the import path (run from it, or PYTHONPATH=BM-Vibration);
+# the package itself never touches sys.path. The script folders (utils/,
+# signal/0N_*/...) are plain folders run as scripts, and their numbered names are not
+# valid package names, so each of their modules adds its own folder and BM-Vibration/
+# once at import, e.g.
+#   sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+# Pool workers inherit the parent's sys.path, so for them these lines change nothing.
+# ==============================================================================
+
+_EXPORTS = {
+    'ingest': [
+        'iter_movesense_packets', 'iter_movesense_chunks', 'probe_sampling_rate',
+        'load_movesense_arrays', 'load_movesense_json', 'movesense_packet_dtype',
+        'iter_movesense_binary_chunks', 'load_movesense_binary',
+    ],
+    'timebase': ['reconstruct_timebase', 'gap_mask', 'resample_uniform'],
+    'filtering': [
+        'design_highpass_sos', 'butter_highpass_filter', 'StreamingHighpassFilter', 'StreamingFiltfilt',
+        'blockwise_filtfilt', 'filter_triaxial_data',
+    ],
+    'segmentation': [
+        'window_starts', 'create_overlapping_windows', 'load_windows_from_npy',
+        'summarize_window_labels', 'create_window_labels',
+    ],
+    'spectral': ['compute_fft', 'compute_welch_psd'],
+    'exposure': ['design_wh_sos', 'wh_weighting_factor', 'ExposureMeter', 'daily_exposure'],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULE_OF)
+
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module 'vibration' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    # Cache on the package, so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
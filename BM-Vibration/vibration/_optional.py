@@ -0,0 +1,46 @@
+import sys
+
+# ==============================================================================
+# OPTIONAL IMPORTS: _optional.py
+# Purpose: Keep `import vibration.*` cheap for headless workers. SciPy's signal
+#          module is imported on first use, and pandas is only used when the
+#          caller already works with DataFrames (or explicitly asks for one).
+# ==============================================================================
+
+
+def scipy_signal():
+    """
+    scipy.signal, imported on first use (it takes longer to import than the rest of
+    the package together; after the first call this is a dictionary lookup).
+    """
+    from scipy import signal
+    return signal
+
+
+def loaded_pandas():
+    """
+    The pandas module if something in the process already imported it, else None.
+    An object can only be a DataFrame / Series if pandas is loaded, so type checks
+    never need to import it.
+    """
+    return sys.modules.get('pandas')
+
+
+def require_pandas():
+    """
+    Imports pandas for functions that return DataFrames.
+
+    Raises:
+    - ImportError: If pandas is not installed (use the NumPy variant of the function).
+    """
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError("pandas is required to return a DataFrame; "
+                          "use the array-returning variant of this function instead.") from e
+    return pandas
+
+
+def is_dataframe(obj):
+    pd = loaded_pandas()
+    return pd is not None and isinstance(obj, pd.DataFrame)
@@ -0,0 +1,312 @@
+from functools import lru_cache
+
+import numpy as np
+
+from ._optional import is_dataframe, scipy_signal
+from .instrument import stage
+
+# ==============================================================================
+# EXPOSURE: vibration/exposure.py
+# Purpose: Hand-arm vibration exposure after ISO 5349-1, computed while streaming:
+#          Wh frequency weighting (cached SOS per Fs), weighted RMS per axis,
+#          vibration total value a_hv and the daily exposure A(8), accumulated
+#          chunk by chunk in constant memory and gated by the ON/OFF state.
+#
+#   a_hw,k = sqrt(1/T * integral a_w,k(t)^2 dt)     weighted RMS of axis k over
+#                                                   the exposure time T (tool ON)
+#   a_hv   = sqrt(a_hw,x^2 + a_hw,y^2 + a_hw,z^2)   vibration total value
+#   A(8)   = a_hv * sqrt(T / T0), T0 = 8 h
+#
+# Only the running sum of a_w^2 dt per axis and the ON time are kept, so the
+# (partial) exposure can be read at any time, and the exposures of several
+# recordings of one day add up (A(8)^2 is additive).
+#
+# The weighting is defined up to the 1250 Hz band. At 833 Hz the band-limiting
+# low-pass lies above Nyquist and is left out; at 50 / 104 Hz the content above
+# 25 / 52 Hz is not sampled at all, so A(8) is a lower bound there.
+# ==============================================================================
+
+# --- 1. Weighting and Exposure Constants ---
+# Wh after ISO 5349-1 / ISO 8041: band limiting (2-pole Butterworth high-pass f1 and
+# low-pass f2) and the transition filter with f3 = f4 and Q4
+WH_F1 = 6.310
+WH_F2 = 1258.9
+WH_Q1 = WH_Q2 = 1.0 / np.sqrt(2.0)
+WH_F3 = WH_F4 = 15.915
+WH_Q4 = 0.64
+# Lowest sampling rate the digital Wh can be designed for: Nyquist must exceed f3/f4
+MIN_WH_FS = 2.0 * max(WH_F3, WH_F4)
+
+# Reference duration of the daily exposure A(8)
+REFERENCE_DURATION_S = 8 * 3600.0
+# EU Directive 2002/44/EC daily exposure action and limit values, A(8) in m/s^2
+EXPOSURE_ACTION_VALUE = 2.5
+EXPOSURE_LIMIT_VALUE = 5.0
+
+# ON/OFF transitions may be back-dated by up to this much (OnOffDetector: RMS window
+# plus min_on_ms / min_off_ms); the weighted energy of this many past samples is kept
+# to re-gate them
+DEFAULT_GATE_DELAY_MS = 100.0
+
+# Frequencies (per Fs) at which the free zero of the digital transition filter is fitted
+FIT_POINTS = 64
+FIT_UPPER_NYQUIST = 0.8
+
+
+def _prewarp(f, fs):
+    """
+    Analog angular frequency that the bilinear transform maps onto f (Hz).
+    """
+    return 2.0 * fs * np.tan(np.pi * f / fs)
+
+
+def _bilinear_roots(roots, fs):
+    return (2.0 * fs + roots) / (2.0 * fs - roots)
+
+
+@lru_cache(maxsize=32)
+def design_wh_sos(fs):
+    """
+    Designs the Wh hand-arm weighting filter as second-order sections for one
+    sampling rate.
+
+    The band-limiting high-pass (and low-pass, left out when f2 is at or above
+    Nyquist) are mapped with the bilinear transform, pre-warped at their corner
+    frequencies. The transition filter has one zero fewer than poles, and the
+    bilinear transform puts the missing zero at Nyquist (z = -1), which bends the
+    1/f slope of Wh down towards Nyquist (-3 dB at 250 Hz for Fs = 833 Hz). Here that
+    zero sits at z = -c instead, with c fitted to the analog response between f1 and
+    0.8 x Nyquist: at 833 Hz the magnitude stays within 0.2 dB of the analog Wh.
+
+    The transition corners f3/f4 (15.9 Hz) must lie below Nyquist: lower sampling
+    rates (Fs <= 31.8 Hz) raise a ValueError, as would a design with a pole on or
+    outside the unit circle.
+
+    The result is cached per fs and shared between callers; it must not be modified.
+
+    Returns:
+    - np.array: SOS array, shape (n_sections, 6).
+    """
+    if fs <= MIN_WH_FS:
+        raise ValueError(f"fs={fs:g} Hz is too low for the Wh weighting (needs more than {MIN_WH_FS:.1f} Hz).")
+    signal = scipy_signal()
+    w1 = _prewarp(WH_F1, fs)
+    analog = [([1.0, 0.0, 0.0], [1.0, w1 / WH_Q1, w1 ** 2])]
+    if WH_F2 < fs / 2.0:
+        w2 = _prewarp(WH_F2, fs)
+        analog.append(([0.0, 0.0, w2 ** 2], [1.0, w2 / WH_Q2, w2 ** 2]))
+    sections = []
+    for b, a in analog:
+        bz, az = signal.bilinear(b, a, fs)
+        sections.append(np.concatenate([np.pad(bz, (3 - len(bz), 0)), az]))
+
+    # Transition filter (s + w3) w4^2 / (w3 (s^2 + w4/Q4 s + w4^2)), DC gain 1
+    w4 = _prewarp(WH_F4, fs)
+    w3 = w4 * WH_F3 / WH_F4
+    a = np.real(np.poly(_bilinear_roots(np.roots([1.0, w4 / WH_Q4, w4 ** 2]), fs)))
+    z3 = _bilinear_roots(-w3, fs)
+
+    def transition(c):
+        b = np.real(np.poly([z3, -c]))
+        return np.concatenate([b * (a.sum() / b.sum()), a])
+
+    # Relative to a zero at the origin (c = 0), a zero at -c scales the response by
+    # |e^jw + c| / (1 + c): one response evaluation covers every candidate c
+    freqs = np.geomspace(WH_F1, FIT_UPPER_NYQUIST * fs / 2.0, FIT_POINTS)
+    _, h = signal.sosfreqz(np.array(sections + [transition(0.0)]), worN=freqs, fs=fs)
+    c = np.linspace(0.0, 1.0, 201)[:, None]
+    scale = np.abs(np.exp(2j * np.pi * freqs / fs) + c) / (1.0 + c)
+    error_db = np.abs(20.0 * np.log10(np.abs(h) * scale / wh_weighting_factor(freqs)))
+    best = c[np.argmin(error_db.max(axis=1)), 0]
+    sos = np.array(sections + [transition(best)])
+    if any(np.any(np.abs(np.roots(section[3:])) >= 1.0) for section in sos):
+        raise ValueError(f"Wh weighting for fs={fs:g} Hz is unstable.")
+    return sos
+
+
+def wh_weighting_factor(freqs):
+    """
+    Magnitude of the analog Wh weighting at the given frequencies (Hz), e.g. to
+    check a digital design or to weight a spectrum (about 1.0 at 8-16 Hz, 0.2 at
+    80 Hz).
+    """
+    s = 2j * np.pi * np.asarray(freqs, dtype=np.float64)
+    w1, w2, w3, w4 = 2 * np.pi * np.array([WH_F1, WH_F2, WH_F3, WH_F4])
+    high = s ** 2 / (s ** 2 + w1 / WH_Q1 * s + w1 ** 2)
+    low = w2 ** 2 / (s ** 2 + w2 / WH_Q2 * s + w2 ** 2)
+    transition = (s + w3) * w4 ** 2 / (w3 * (s ** 2 + w4 / WH_Q4 * s + w4 ** 2))
+    return np.abs(high * low * transition)
+
+
+def _as_triaxial(data):
+    """
+    (n, 3) float64 array from an array or a DataFrame with accel_x/y/z columns
+    (raw, or the *_filtered columns of filter_triaxial_data).
+    """
+    if is_dataframe(data):
+        columns = [c for c in data.columns if str(c).startswith('accel_')]
+        data = data[columns]
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim != 2 or data.shape[1] != 3:
+        raise ValueError(f"Expected acceleration of shape (n, 3), got {data.shape}.")
+    return data
+
+
+# --- 2. Streaming Exposure ---
+class ExposureMeter:
+    """
+    Running Wh-weighted hand-arm exposure of one tri-axial stream (m/s^2), fed
+    chunk by chunk.
+
+    Raw Movesense samples and high-pass filtered ones (filter_triaxial_data,
+    ChunkedPreprocessor) both work: the Wh band limit removes gravity and anything
+    below ~6 Hz either way. Only the time the gate is ON counts as exposure. The
+    gate is either a mask / bool per chunk, or the transitions of an OnOffDetector
+    fed the same samples; those may be back-dated into earlier chunks, which is
+    corrected for up to gate_delay_ms.
+
+    Example:
+        meter = ExposureMeter(fs=833.0)
+        detector = OnOffDetector(fs=833.0)
+        for chunk in chunks:                  # chunk: shape (n, 3)
+            meter.process(chunk, transitions=detector.process(chunk))
+        print(meter.summary()['a8'])
+    """
+
+    def __init__(self, fs, gate_delay_ms=DEFAULT_GATE_DELAY_MS, reference_duration_s=REFERENCE_DURATION_S):
+        """
+        Parameters:
+        - fs (float): Sampling frequency (Hz).
+        - gate_delay_ms (float): Longest back-dating of an ON/OFF transition.
+        - reference_duration_s (float): T0 of the daily exposure (8 h).
+        """
+        self.fs = float(fs)
+        self.sos = design_wh_sos(self.fs)
+        self.reference_duration_s = float(reference_duration_s)
+        self.tail_samples = max(1, int(np.ceil(gate_delay_ms * self.fs / 1000.0)))
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the filter state and the accumulated exposure.
+        """
+        self.zi = None
+        self.state = False
+        self.n_samples = 0
+        self.on_samples = 0
+        # Sum of a_w^2 over the ON samples, per axis ((m/s^2)^2; times 1/fs for the integral)
+        self.energy = np.zeros(3)
+        # Squared weighted samples and their gate, for the last tail_samples samples
+        self.tail_energy = np.empty((0, 3))
+        self.tail_gate = np.empty(0, dtype=bool)
+
+    def weight(self, chunk):
+        """
+        Wh-weighted acceleration of the next chunk (filter state carried over).
+        """
+        chunk = _as_triaxial(chunk)
+        if not len(chunk):
+            return chunk.copy()
+        signal = scipy_signal()
+        if self.zi is None:
+            # Steady state for the first sample: a DC offset (gravity) gives no transient
+            self.zi = signal.sosfilt_zi(self.sos)[:, :, None] * chunk[0]
+        weighted, self.zi = signal.sosfilt(self.sos, chunk, axis=0, zi=self.zi)
+        return weighted
+
+    def process(self, chunk, on=None, transitions=None):
+        """
+        Weights the next chunk and adds its ON samples to the exposure.
+
+        Parameters:
+        - chunk (np.array or pd.DataFrame): Shape (n, 3), m/s^2.
+        - on (bool or np.array): Gate of the chunk: one bool, or a bool mask per sample.
+        - transitions (np.array): OnOffDetector transitions ('sample_index' counted from
+          the first sample of the stream, 'state'), e.g. detector.process(chunk).
+          Without `on` and `transitions` the previous gate state is kept (initially
+          OFF when transitions are used, so pass on=True for an ungated meter).
+
+        Returns:
+        - np.array: The Wh-weighted chunk, shape (n, 3).
+        """
+        with stage('exposure.weighting', samples=len(chunk)):
+            weighted = self.weight(chunk)
+        n = len(weighted)
+        tail = len(self.tail_gate)
+        region_start = self.n_samples - tail
+
+        # Gate of the tail (possibly re-gated) followed by the new samples
+        if on is not None:
+            self.state = bool(np.asarray(on).reshape(-1)[-1]) if np.ndim(on) else bool(on)
+            chunk_gate = np.broadcast_to(np.asarray(on, dtype=bool), (n,))
+            gate = np.concatenate([self.tail_gate, chunk_gate])
+        else:
+            gate = np.concatenate([self.tail_gate, np.full(n, self.state)])
+            if transitions is not None and len(transitions):
+                # Each state holds until the next transition; transitions older than
+                # the tail are applied from the tail start
+                index = np.clip(transitions['sample_index'].astype(np.int64) - region_start, 0, len(gate))
+                states = transitions['state'].astype(bool)
+                gate[index[0]:] = np.repeat(states, np.diff(np.append(index, len(gate))))
+                self.state = bool(states[-1])
+
+        # Only the short tail is concatenated; the chunk's squares are summed in place
+        squared = np.square(weighted)
+        tail_delta = gate[:tail].astype(np.int8) - self.tail_gate
+        self.energy += tail_delta @ self.tail_energy + gate[tail:].astype(np.float64) @ squared
+        self.on_samples += int(tail_delta.sum()) + int(np.count_nonzero(gate[tail:]))
+        self.n_samples += n
+
+        keep = min(self.tail_samples, len(gate))
+        self.tail_energy = np.concatenate([self.tail_energy, squared[max(n - keep, 0):]])[-keep:]
+        self.tail_gate = gate[len(gate) - keep:].copy()
+        return weighted
+
+    def summary(self):
+        """
+        Exposure so far.
+
+        Returns:
+        - dict: 'duration_s' (all samples), 'exposure_s' (ON time), 'a_hw' (weighted
+          RMS x, y, z over the ON time, m/s^2), 'a_hv' (vibration total value),
+          'a8' (daily exposure A(8)), 'energy' (integral of a_w^2 dt per axis; add
+          these to combine recordings), 'time_to_eav_s' / 'time_to_elv_s' (exposure
+          time at the current a_hv that reaches the action / limit value; None
+          while a_hv is 0).
+        """
+        exposure_s = self.on_samples / self.fs
+        energy = self.energy / self.fs
+        a_hw = np.sqrt(energy / exposure_s) if exposure_s > 0 else np.zeros(3)
+        a_hv = float(np.sqrt(np.sum(a_hw ** 2)))
+        a8 = float(np.sqrt(energy.sum() / self.reference_duration_s))
+
+        def time_to(limit):
+            return self.reference_duration_s * (limit / a_hv) ** 2 if a_hv > 0 else None
+
+        return {
+            'duration_s': self.n_samples / self.fs,
+            'exposure_s': exposure_s,
+            'a_hw': a_hw.tolist(),
+            'a_hv': a_hv,
+            'a8': a8,
+            'energy': energy.tolist(),
+            'time_to_eav_s': time_to(EXPOSURE_ACTION_VALUE),
+            'time_to_elv_s': time_to(EXPOSURE_LIMIT_VALUE),
+        }
+
+
+def daily_exposure(summaries, reference_duration_s=REFERENCE_DURATION_S):
+    """
+    A(8) and total exposure time of several ExposureMeter summaries (e.g. the
+    recordings of one worker's day): A(8) = sqrt(sum of a_hv,i^2 T_i / T0).
+
+    Returns:
+    - dict: 'exposure_s', 'a_hv' (over the total exposure time), 'a8'.
+    """
+    energy = sum(np.sum(s['energy']) for s in summaries)
+    exposure_s = sum(s['exposure_s'] for s in summaries)
+    return {
+        'exposure_s': exposure_s,
+        'a_hv': float(np.sqrt(energy / exposure_s)) if exposure_s > 0 else 0.0,
+        'a8': float(np.sqrt(energy / reference_duration_s)),
+    }
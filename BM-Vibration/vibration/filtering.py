@@ -0,0 +1,358 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from ._optional import is_dataframe, require_pandas, scipy_signal
+from .instrument import traced
+
+# ==============================================================================
+# FILTERING: vibration/filtering.py
+# Purpose: Butterworth high-pass (gravity / walking removal) for whole recordings,
+#          long recordings in blocks, and live streams chunk by chunk.
+#          scipy.signal is imported on the first filter call, and pandas only for
+#          DataFrame input / output. The signal/02_preprocessing/scripts/
+#          highpass_filter.py script re-exports everything here.
+# ==============================================================================
+
+# --- Project Constants (Adjust these values based on testing) ---
+# The Movesense sensor samples at 52Hz (approx), but let's assume a common rate for now.
+# NOTE: Replace '50.0' with the actual sampling rate (fs) of your Movesense sensor
+FS = 50.0  # Sampling Frequency (Hz). CHECK YOUR SENSOR'S RATE! #TODO check what Fs was in each recording (833 Hz?) and try to align in order not to get aliasing effect in processing
+
+# Cutoff frequency (fc) determines what gets filtered out.
+# Gravity and walking are typically below 1 Hz. A cutoff of 0.5-1.5 Hz is common
+# to remove these low-frequency components.
+# Lower frequency = more noise passes. Higher frequency = tool vibration might be lost.
+CUTOFF_FREQ = 0.5  # Hz. Needs empirical testing on your 'noise_walking' data! #TODO first PSD or FFT walking dataset to understand the freq content
+
+# The order (N) of the filter. Higher order = sharper cutoff, but more computation/instability.
+# Order 4-10 is a good starting point for IIR filters.
+ORDER = 4
+
+# Block-wise zero-phase filtering (blockwise_filtfilt) matches a single
+# signal.sosfiltfilt pass over the whole recording to within this tolerance,
+# relative to the largest absolute input value.
+FILTFILT_BLOCK_TOLERANCE = 1e-6
+# Samples per block for blockwise_filtfilt (plus the overlap on both sides)
+FILTFILT_BLOCK_SIZE = 1 << 20
+
+
+@lru_cache(maxsize=32)
+def design_highpass_sos(cutoff, fs, order):
+    """
+    Designs a Butterworth high-pass filter as second-order sections (SOS).
+
+    The result is cached per (cutoff, fs, order), so repeated calls (per axis, per
+    chunk, per recording) do not redesign the filter. The returned array is shared
+    between callers and must not be modified.
+    """
+    # Normalize the cutoff frequency to the Nyquist frequency (0 to 1 range)
+    normalized_cutoff = cutoff / (0.5 * fs)
+    return scipy_signal().butter(order, normalized_cutoff, btype='highpass', analog=False, output='sos')
+
+
+@lru_cache(maxsize=32)
+def settling_samples(cutoff, fs, order, tolerance=FILTFILT_BLOCK_TOLERANCE):
+    """
+    Number of samples after which the remaining impulse response of the filter sums to
+    less than `tolerance`. Used as the block overlap in blockwise_filtfilt.
+    """
+    sos = design_highpass_sos(cutoff, fs, order)
+    # Long enough for the slowest pole of any sensible cutoff/fs combination
+    n = int(200 * fs / cutoff) + 1
+    impulse = np.zeros(n)
+    impulse[0] = 1.0
+    tail = np.cumsum(np.abs(scipy_signal().sosfilt(sos, impulse))[::-1])[::-1]
+    below = np.flatnonzero(tail < tolerance)
+    return int(below[0]) if len(below) else n
+
+
+def butter_highpass_filter(data, cutoff, fs, order):
+    """
+    Designs and applies a Butterworth High-Pass Filter to a signal.
+    
+    This function uses signal.sosfiltfilt for zero phase shift, which is critical
+    for preserving the timing accuracy needed for your 'On/Off Classifier'.
+    
+    Parameters:
+    - data (np.array): The input signal array (e.g., one axis of acceleration data).
+    - cutoff (float): The cutoff frequency of the filter (Hz).
+    - fs (float): The sampling frequency of the data (Hz).
+    - order (int): The order of the filter.
+
+    Returns:
+    - np.array: The filtered signal array.
+    """
+    
+    # 1. Get the (cached) filter coefficients as second-order sections.
+    # SOS is numerically safer than the 'ba' polynomials, especially at high orders
+    # or very low normalized cutoffs (e.g. 0.5 Hz at 833 Hz).
+    # TODO undertand what is the cut-off frequency (the specific number), 
+    # adaptive cut-off might be good, but only after working with dataset (Power Spectrum Density, FFT, Welch FFT) and understanding the limits of freq for each tool or walking
+    sos = design_highpass_sos(cutoff, fs, order)
+    
+    # 2. Apply the filter forward and backward to eliminate phase shift
+    # This is crucial for keeping your vibration events accurately timed.
+    filtered_data = scipy_signal().sosfiltfilt(sos, data, axis=0)
+    
+    return filtered_data
+
+
+class StreamingHighpassFilter:
+    """
+    Causal high-pass filter for chunked or live data with bounded memory.
+
+    The SOS coefficients are designed once (cached per cutoff/fs/order) and the filter
+    state (zi) is carried across calls, so feeding a recording chunk by chunk gives the
+    same output as one signal.sosfilt call over the whole array. Unlike filtfilt this is
+    not zero-phase (it delays the signal slightly); use blockwise_filtfilt for offline
+    zero-phase filtering of long recordings.
+
+    Example:
+        hp = StreamingHighpassFilter(cutoff=0.5, fs=833.0)
+        for packet in packets:            # packet: shape (n, 3)
+            filtered = hp.process(packet)
+
+    With axis=1 one filter object runs many streams at once, e.g. packets of shape
+    (n_streams, n, 3).
+    """
+
+    def __init__(self, cutoff=CUTOFF_FREQ, fs=FS, order=ORDER, axis=0):
+        self.cutoff = cutoff
+        self.fs = fs
+        self.order = order
+        self.axis = axis
+        self.sos = design_highpass_sos(cutoff, fs, order)
+        self.zi = None
+
+    def reset(self):
+        """
+        Forgets the filter state; the next chunk starts a new stream.
+        """
+        self.zi = None
+
+    def process(self, chunk):
+        """
+        Filters the next chunk of samples along the time axis (self.axis).
+
+        Parameters:
+        - chunk (np.array): Shape (n,) or (n, n_axes) for axis=0. Must keep the same
+          shape apart from the time axis between calls.
+
+        Returns:
+        - np.array: Filtered chunk, same shape as the input.
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.shape[self.axis] == 0:
+            return chunk.copy()
+
+        if self.zi is None:
+            # Start in steady state for the first sample, so a DC offset (gravity)
+            # does not produce a step transient at the beginning of the stream.
+            # zi has shape (n_sections, ..., 2, ...) with the 2 on the time axis
+            zi_unit = scipy_signal().sosfilt_zi(self.sos)
+            shape = [len(self.sos)] + [1] * chunk.ndim
+            shape[1 + self.axis] = 2
+            first = np.take(chunk, [0], axis=self.axis)
+            self.zi = zi_unit.reshape(shape) * first[None]
+
+        filtered, self.zi = scipy_signal().sosfilt(self.sos, chunk, axis=self.axis, zi=self.zi)
+        return filtered
+
+
+class StreamingFiltfilt:
+    """
+    Zero-phase high-pass filter for chunked data, the streaming form of
+    blockwise_filtfilt.
+
+    A sample is emitted once `overlap` samples after it have arrived (the filter's
+    settling time by default, e.g. 9827 samples = 11.8 s at 833 Hz), and flush() emits
+    the rest at the end of the stream. Every block is filtered with signal.sosfiltfilt
+    together with `overlap` samples of context on both sides, so the concatenated
+    output matches one sosfiltfilt pass over the whole recording (butter_highpass_filter)
+    to within FILTFILT_BLOCK_TOLERANCE * max(|data|). Memory is bounded by the chunk
+    size plus twice the overlap.
+
+    Example:
+        hp = StreamingFiltfilt(cutoff=0.5, fs=833.0)
+        parts = [hp.process(chunk) for chunk in chunks]   # chunk: shape (n, 3)
+        parts.append(hp.flush())
+    """
+
+    def __init__(self, cutoff=CUTOFF_FREQ, fs=FS, order=ORDER, overlap=None):
+        self.cutoff = cutoff
+        self.fs = fs
+        self.order = order
+        self.sos = design_highpass_sos(cutoff, fs, order)
+        self.overlap = settling_samples(cutoff, fs, order) if overlap is None else overlap
+        self.reset()
+
+    def reset(self):
+        """
+        Drops the buffered samples; the next chunk starts a new stream.
+        """
+        # Raw samples: `context` already emitted ones (left context), then the pending ones
+        self.buffer = None
+        self.context = 0
+
+    def process(self, chunk):
+        """
+        Adds the next chunk (n,) or (n, n_axes) and returns the filtered samples whose
+        right-hand context is complete (possibly none, shape (0, ...)).
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        buffer = chunk if self.buffer is None else np.concatenate([self.buffer, chunk])
+        ready = len(buffer) - self.context - self.overlap
+        # Filter at least `overlap` new samples per call, so the context is not
+        # re-filtered for every small chunk
+        if ready < max(self.overlap, 1):
+            self.buffer = buffer
+            return buffer[:0].copy()
+
+        filtered = scipy_signal().sosfiltfilt(self.sos, buffer, axis=0)
+        out = filtered[self.context:self.context + ready]
+        end = self.context + ready
+        start = max(end - self.overlap, 0)
+        self.buffer = buffer[start:]
+        self.context = end - start
+        return out
+
+    def flush(self):
+        """
+        Filters and returns the remaining samples (the end of the stream) and resets.
+        """
+        if self.buffer is None or len(self.buffer) <= self.context:
+            out = np.empty((0,) + (self.buffer.shape[1:] if self.buffer is not None else ()))
+        else:
+            out = scipy_signal().sosfiltfilt(self.sos, self.buffer, axis=0)[self.context:]
+        self.reset()
+        return out
+
+
+def _blockwise_span(sos, data, start, stop, overlap, block_size, out, left, right):
+    """
+    Filters data[start:stop] block by block into out[start:stop].
+
+    `left` / `right` are raw samples just outside the span (up to `overlap` each),
+    copied before any writes so that `out` may alias `data`.
+    """
+    context = left
+    for b0 in range(start, stop, block_size):
+        b1 = min(b0 + block_size, stop)
+        hi = min(b1 + overlap, stop)
+
+        # Read the block and its right overlap before out[b0:b1] is written
+        parts = [context, np.asarray(data[b0:hi], dtype=np.float64)]
+        if b1 + overlap > stop:
+            parts.append(right[:b1 + overlap - stop])
+        segment = np.concatenate(parts)
+        filtered = scipy_signal().sosfiltfilt(sos, segment, axis=0)
+
+        keep = len(context) + (b1 - b0)
+        out[b0:b1] = filtered[len(context):keep]
+        context = segment[max(keep - overlap, 0):keep]
+
+
+@traced('filtering.blockwise_filtfilt', samples=lambda data, *args, **kwargs: len(data))
+def blockwise_filtfilt(data, cutoff=CUTOFF_FREQ, fs=FS, order=ORDER,
+                       block_size=FILTFILT_BLOCK_SIZE, overlap=None, out=None, n_threads=1):
+    """
+    Zero-phase high-pass filtering of a long recording in overlapping blocks.
+
+    Each block is extended by `overlap` samples on both sides, filtered with
+    signal.sosfiltfilt, and only its centre is kept. With the default overlap
+    (settling_samples of the filter) the result matches a single sosfiltfilt pass over
+    the whole array to within FILTFILT_BLOCK_TOLERANCE * max(|data|), while the
+    temporary memory is bounded by the block size. Works on memory-mapped input.
+
+    Parameters:
+    - data (np.array): Shape (N,) or (N, n_axes).
+    - cutoff, fs, order: Filter parameters (see butter_highpass_filter).
+    - block_size (int): Samples kept per block.
+    - overlap (int): Extra samples on each side of a block (default: settling time).
+    - out (np.array): Optional output array (may be `data` itself for in-place use,
+      since each block is read before it is written).
+    - n_threads (int): Split the recording into this many spans filtered on a thread
+      pool (SciPy releases the GIL inside sosfilt).
+
+    Returns:
+    - np.array: The filtered signal (`out` if given).
+    """
+    sos = design_highpass_sos(cutoff, fs, order)
+    if overlap is None:
+        overlap = settling_samples(cutoff, fs, order)
+    if out is None:
+        out = np.empty(data.shape, dtype=np.result_type(data.dtype, np.float64))
+
+    n = len(data)
+    n_threads = max(1, min(n_threads, n // max(block_size // 4, 1) or 1))
+    bounds = np.linspace(0, n, n_threads + 1).astype(int)
+
+    # Copy the raw samples around every span boundary before any thread writes
+    spans = [
+        (sos, data, start, stop, overlap, block_size, out,
+         np.array(data[max(start - overlap, 0):start], dtype=np.float64),
+         np.array(data[stop:min(stop + overlap, n)], dtype=np.float64))
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+    if n_threads == 1:
+        _blockwise_span(*spans[0])
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            list(pool.map(lambda args: _blockwise_span(*args), spans))
+
+    return out
+
+
+@traced('filtering.filter_triaxial_data', samples=lambda data, *args, **kwargs: len(data))
+def filter_triaxial_data(df_raw, cutoff=CUTOFF_FREQ, fs=FS, order=ORDER,
+                         inplace=False, n_threads=1, return_array=False):
+    """
+    Applies the high-pass filter to all three acceleration axes (X, Y, Z).
+
+    The (N, 3) block is filtered in a single axis=0 SOS call instead of one call per
+    axis, and the result is wrapped in a DataFrame without another copy.
+    
+    Parameters:
+    - df_raw (pd.DataFrame or np.array): Raw triaxial acceleration data (columns: X, Y, Z).
+    - cutoff, fs, order: Filter parameters (see butter_highpass_filter).
+    - inplace (bool): Write the result into the input array (NumPy input) or into the
+      one array extracted from the DataFrame, so only one buffer is used. Uses
+      blockwise_filtfilt, which matches the default path within FILTFILT_BLOCK_TOLERANCE.
+    - n_threads (int): Split long recordings across a thread pool (blockwise_filtfilt).
+    - return_array (bool): Return the filtered (N, 3) array instead of a DataFrame.
+
+    Returns:
+    - pd.DataFrame: Columns accel_x_filtered, accel_y_filtered, accel_z_filtered
+      (or np.array of shape (N, 3) if return_array=True).
+    """
+    
+    # Ensure data is one contiguous (N, 3) NumPy array for Scipy compatibility
+    if is_dataframe(df_raw):
+        # np.array always copies, giving one writable buffer (to_numpy may return a
+        # read-only view of the frame)
+        data = np.array(df_raw[['accel_x', 'accel_y', 'accel_z']], dtype=np.float64)
+    elif inplace:
+        # Assuming the input is a NumPy array with columns X, Y, Z
+        data = df_raw
+    else:
+        data = np.ascontiguousarray(df_raw)
+    
+    if inplace or n_threads > 1:
+        filtered = blockwise_filtfilt(data, cutoff, fs, order,
+                                      out=data if inplace else None, n_threads=n_threads)
+    else:
+        filtered = butter_highpass_filter(data, cutoff, fs, order)
+
+    if return_array:
+        return filtered
+
+    # Wrap the filtered block without copying it
+    pd = require_pandas()
+    df_filtered = pd.DataFrame(
+        filtered, columns=['accel_x_filtered', 'accel_y_filtered', 'accel_z_filtered'], copy=False
+    )
+    
+    return df_filtered
@@ -0,0 +1,392 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from ._optional import require_pandas
+from .instrument import traced
+from .timebase import reconstruct_timebase
+
+# ==============================================================================
+# INGESTION: vibration/ingest.py
+# Purpose: Streaming Movesense JSON parsing (packet by packet, in sample chunks,
+#          or into NumPy arrays with a reconstructed time base), and the same for
+#          binary packet files. Imports NumPy only; load_movesense_json imports
+#          pandas when it is called.
+#          utils/loader_vizualizer_FFT_Welch.py re-exports these functions.
+# ==============================================================================
+
+# --- Streaming Ingestion Constants ---
+# Size of each text chunk read from disk while walking the packet stream.
+READ_CHUNK_CHARS = 1 << 20
+# A Movesense sample ({"x":..,"y":..,"z":..}) takes roughly 60-70 characters of JSON,
+# so this gives a generous first guess of the sample count from the file size.
+APPROX_CHARS_PER_SAMPLE = 48
+
+# Binary packet files (.npy) hold one record per packet: the 32-bit millisecond
+# Timestamp and the packet's samples, as in the sensor's /Meas/Acc notifications
+BINARY_SUFFIX = '.npy'
+
+_DATA_ARRAY_START = re.compile(r'"data"\s*:\s*\[')
+_JSON_DECODER = json.JSONDecoder()
+
+
+def iter_movesense_packets(file_path, chunk_chars=READ_CHUNK_CHARS):
+    """
+    Walks a Movesense JSON file packet by packet without loading the whole document.
+
+    Only one read chunk plus the packet being decoded is held in memory, so this works
+    for arbitrarily long shift recordings.
+
+    Parameters:
+    - file_path (str): Path to the Movesense JSON file.
+    - chunk_chars (int): Number of characters read from disk at a time.
+
+    Yields:
+    - dict: One entry of the "data" array, e.g. {"acc": {"Timestamp": ..., "ArrayAcc": [...]}}.
+
+    Raises:
+    - ValueError: If the file has no "data" array or a packet cannot be decoded.
+    """
+    with open(file_path, 'r') as f:
+        buf = ''
+        eof = False
+
+        # 1. Find the opening bracket of the "data" array
+        while True:
+            match = _DATA_ARRAY_START.search(buf)
+            if match:
+                pos = match.end()
+                break
+            if eof:
+                raise ValueError("JSON does not contain 'data' key.")
+            chunk = f.read(chunk_chars)
+            eof = not chunk
+            # Keep a short tail in case the key is split across two chunks
+            buf = buf[-16:] + chunk
+
+        # 2. Decode one packet object at a time
+        while True:
+            # Skip separators between packets
+            n = len(buf)
+            while pos < n and buf[pos] in ' \t\r\n,':
+                pos += 1
+
+            if pos < n and buf[pos] == ']':
+                return
+
+            if pos < n:
+                try:
+                    entry, end = _JSON_DECODER.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # Most likely the packet is split across chunks; read more below
+                    if eof:
+                        raise
+                else:
+                    # A decoded object always ends on its closing brace, so it is complete
+                    yield entry
+                    pos = end
+                    continue
+
+            if eof:
+                raise ValueError("Unexpected end of file inside the 'data' array.")
+
+            # Drop the consumed text and append the next chunk
+            chunk = f.read(chunk_chars)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def iter_movesense_chunks(file_path, chunk_samples=1 << 16):
+    """
+    Streams the acceleration samples of a Movesense JSON file in fixed-size chunks.
+
+    Memory stays constant (one read chunk plus one sample chunk) for any recording
+    length. Values match load_movesense_arrays()['acc'] sample for sample.
+
+    Parameters:
+    - file_path (str): Path to the Movesense JSON file.
+    - chunk_samples (int): Samples per yielded chunk (the last one may be shorter).
+
+    Yields:
+    - np.array: float32 chunks of shape (n, 3), columns X, Y, Z.
+    """
+    buf = np.empty((chunk_samples, 3), dtype=np.float32)
+    n = 0
+    for entry in iter_movesense_packets(file_path):
+        acc_data = entry.get('acc') if isinstance(entry, dict) else None
+        array_acc = acc_data.get('ArrayAcc') if acc_data is not None else None
+        if not array_acc:
+            continue
+
+        samples = np.array([(s.get('x', 0.0), s.get('y', 0.0), s.get('z', 0.0)) for s in array_acc],
+                           dtype=np.float32)
+        while len(samples):
+            k = min(chunk_samples - n, len(samples))
+            buf[n:n + k] = samples[:k]
+            samples = samples[k:]
+            n += k
+            if n == chunk_samples:
+                yield buf.copy()
+                n = 0
+    if n:
+        yield buf[:n].copy()
+
+
+def probe_sampling_rate(file_path, n_packets=256):
+    """
+    Estimates the sampling rate (Hz) from the first n_packets packets only, without
+    reading the rest of the file (JSON or binary packet file). Returns None if fewer
+    than two timestamps are found.
+    """
+    if file_path.endswith(BINARY_SUFFIX):
+        packets = open_movesense_binary(file_path)[:n_packets]
+        timestamps = packets['timestamp'].astype(np.float64).tolist()
+        sizes = [packets.dtype['acc'].shape[0]] * len(packets)
+        if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+            return None
+        return sum(sizes[1:]) / (timestamps[-1] - timestamps[0]) * 1000.0
+
+    timestamps = []
+    sizes = []
+    for entry in iter_movesense_packets(file_path):
+        acc_data = entry.get('acc') if isinstance(entry, dict) else None
+        if acc_data is None or not acc_data.get('ArrayAcc') or acc_data.get('Timestamp') is None:
+            continue
+        timestamps.append(acc_data['Timestamp'])
+        sizes.append(len(acc_data['ArrayAcc']))
+        if len(timestamps) >= n_packets:
+            break
+
+    if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+        return None
+    # Timestamps refer to the last sample of each packet
+    return sum(sizes[1:]) / (timestamps[-1] - timestamps[0]) * 1000.0
+
+
+@traced('ingest.load_movesense_arrays', result_samples=lambda arrays: len(arrays['acc']) if arrays else 0)
+def load_movesense_arrays(file_path, verbose=True):
+    """
+    Streams a Movesense JSON file straight into NumPy arrays.
+
+    Samples are written packet by packet into a growable float32 (N, 3) buffer, and the
+    per-sample timestamps are reconstructed in one vectorized step afterwards by
+    reconstruct_timebase() (dropouts, counter rollover, jitter and clock drift). Peak
+    memory stays close to the size of the final arrays instead of holding the parsed
+    document and per-sample Python lists.
+
+    Parameters:
+    - file_path (str): Path to the Movesense JSON file.
+    - verbose (bool): Print progress messages.
+
+    Returns:
+    - dict or None: With keys
+        'timestamp' (np.array float64, ms, one per sample),
+        'acc' (np.array float32, shape (N, 3), columns X, Y, Z),
+        'packet_timestamps' (np.array float64, NaN where missing),
+        'packet_sizes' (np.array int64), 'packet_flags' (np.array uint8),
+        'gap_map' (structured np.array, one row per dropout),
+        'sample_interval_ms' (float), 'timebase' (dict, see reconstruct_timebase).
+      None if the file cannot be parsed or holds no 'acc' data.
+    """
+    if verbose:
+        print(f"Loading file: {file_path}")
+
+    # Initial guess for the buffer size; grown geometrically if too small
+    capacity = max(os.path.getsize(file_path) // APPROX_CHARS_PER_SAMPLE, 1024)
+    acc = np.empty((capacity, 3), dtype=np.float32)
+    packet_timestamps = []
+    packet_sizes = []
+    n_samples = 0
+
+    try:
+        for entry in iter_movesense_packets(file_path):
+            acc_data = entry.get('acc') if isinstance(entry, dict) else None
+            if acc_data is None:
+                continue
+
+            timestamp = acc_data.get('Timestamp')
+            array_acc = acc_data.get('ArrayAcc')
+            if not array_acc:
+                continue
+
+            k = len(array_acc)
+            if n_samples + k > capacity:
+                capacity = max(capacity * 2, n_samples + k)
+                acc.resize((capacity, 3), refcheck=False)
+
+            acc[n_samples:n_samples + k] = [
+                (s.get('x', 0.0), s.get('y', 0.0), s.get('z', 0.0)) for s in array_acc
+            ]
+            n_samples += k
+            # Packets without 'Timestamp' are kept; their time is reconstructed
+            packet_timestamps.append(np.nan if timestamp is None else timestamp)
+            packet_sizes.append(k)
+    except ValueError as e:
+        # json.JSONDecodeError is a subclass of ValueError
+        if verbose:
+            print(f"Error decoding JSON: {e}")
+        return None
+
+    if not packet_sizes:
+        if verbose:
+            print("No valid 'acc' data found.")
+        return None
+
+    # Release the unused part of the buffer (realloc, no second copy)
+    acc.resize((n_samples, 3), refcheck=False)
+
+    t_packets = np.asarray(packet_timestamps, dtype=np.float64)
+    sizes = np.asarray(packet_sizes, dtype=np.int64)
+    del packet_timestamps, packet_sizes
+    return _packet_arrays(acc, t_packets, sizes, verbose)
+
+
+def _packet_arrays(acc, t_packets, sizes, verbose):
+    """
+    The load_movesense_arrays() dict from the samples and the packet timestamps / sizes.
+    """
+    # Gap-, rollover- and jitter-aware per-sample timestamps (see timebase.py)
+    timestamps, gap_map, timebase_info = reconstruct_timebase(t_packets, sizes)
+    packet_flags = timebase_info.pop('packet_flags')
+    sample_interval_ms = timebase_info['sample_interval_ms']
+
+    if verbose:
+        print(f"Estimated sample interval: {sample_interval_ms:.4f} ms")
+        if timebase_info['n_gaps']:
+            print(f"WARNING: {timebase_info['n_gaps']} dropout(s), "
+                  f"~{timebase_info['missing_samples']} samples missing.")
+
+    return {
+        'timestamp': timestamps,
+        'acc': acc,
+        'packet_timestamps': t_packets,
+        'packet_sizes': sizes,
+        'packet_flags': packet_flags,
+        'gap_map': gap_map,
+        'sample_interval_ms': float(sample_interval_ms),
+        'timebase': timebase_info,
+    }
+
+
+def movesense_packet_dtype(packet_size):
+    """
+    Record dtype of a binary packet file with packet_size samples per packet:
+    'timestamp' (uint32, ms, last sample of the packet) and 'acc' (float32,
+    shape (packet_size, 3)). Little endian, no padding.
+    """
+    return np.dtype([('timestamp', '<u4'), ('acc', '<f4', (packet_size, 3))])
+
+
+def _check_packet_dtype(dtype, file_path):
+    names = dtype.names or ()
+    if 'timestamp' not in names or 'acc' not in names or dtype['acc'].shape[1:] != (3,):
+        raise ValueError(f"{file_path} is not a Movesense packet file (dtype {dtype}).")
+
+
+def open_movesense_binary(file_path):
+    """
+    Memory-maps a binary packet file.
+
+    Returns:
+    - np.memmap: One record per packet (see movesense_packet_dtype).
+    """
+    packets = np.load(file_path, mmap_mode='r')
+    _check_packet_dtype(packets.dtype, file_path)
+    return packets
+
+
+def iter_movesense_binary_chunks(file_path, chunk_samples=1 << 16):
+    """
+    Streams the samples of a binary packet file in fixed-size chunks, like
+    iter_movesense_chunks() does for JSON. Each chunk is read with one plain file
+    read rather than through a memory map, so the pages already streamed do not
+    stay in the resident set.
+
+    Yields:
+    - np.array: float32 chunks of shape (n, 3), columns X, Y, Z.
+    """
+    with open(file_path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        _check_packet_dtype(dtype, file_path)
+        data_offset = f.tell()
+        packet_size = dtype['acc'].shape[0]
+        n_samples = shape[0] * packet_size
+        for start in range(0, n_samples, chunk_samples):
+            stop = min(start + chunk_samples, n_samples)
+            first = start // packet_size
+            f.seek(data_offset + first * dtype.itemsize)
+            packets = np.fromfile(f, dtype=dtype, count=-(-stop // packet_size) - first)
+            block = packets['acc'].reshape(-1, 3)
+            yield np.ascontiguousarray(block[start - first * packet_size:stop - first * packet_size])
+
+
+@traced('ingest.load_movesense_binary', result_samples=lambda arrays: len(arrays['acc']) if arrays else 0)
+def load_movesense_binary(file_path, verbose=True):
+    """
+    Loads a binary packet file into the same arrays as load_movesense_arrays().
+
+    Parameters:
+    - file_path (str): Path to the .npy packet file.
+    - verbose (bool): Print progress messages.
+
+    Returns:
+    - dict or None: See load_movesense_arrays(). None if the file holds no packets.
+    """
+    if verbose:
+        print(f"Loading file: {file_path}")
+    packets = open_movesense_binary(file_path)
+    if not len(packets):
+        if verbose:
+            print("No valid 'acc' data found.")
+        return None
+    acc = np.ascontiguousarray(packets['acc']).reshape(-1, 3)
+    t_packets = packets['timestamp'].astype(np.float64)
+    sizes = np.full(len(packets), packets.dtype['acc'].shape[0], dtype=np.int64)
+    return _packet_arrays(acc, t_packets, sizes, verbose)
+
+
+@traced('ingest.load_movesense_json', result_samples=lambda df: len(df) if df is not None else 0)
+def load_movesense_json(file_path, verbose=True):
+    """
+    Parses a Movesense JSON file and converts it into a DataFrame.
+    
+    Expected structure:
+    {
+        "data": [
+            {
+                "acc": {
+                    "Timestamp": <int>,
+                    "ArrayAcc": [
+                        {"x": <float>, "y": <float>, "z": <float>},
+                        ...
+                    ]
+                }
+            },
+            ...
+        ]
+    }
+
+    The file is parsed in streaming fashion by load_movesense_arrays(); the acceleration
+    columns are float32. Requires pandas (load_movesense_arrays does not).
+    """
+    pd = require_pandas()
+    arrays = load_movesense_arrays(file_path, verbose=verbose)
+    if arrays is None:
+        return None
+
+    acc = arrays['acc']
+    df = pd.DataFrame({
+        'timestamp': arrays['timestamp'],
+        'accel_x': acc[:, 0],
+        'accel_y': acc[:, 1],
+        'accel_z': acc[:, 2]
+    })
+    
+    return df
@@ -0,0 +1,498 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# ==============================================================================
+# INSTRUMENTATION: vibration/instrument.py
+# Purpose: Opt-in per-stage timing of the signal pipeline: wall and CPU time,
+#          samples/s, peak RSS, optionally bytes allocated (tracemalloc), and
+#          counters such as queue depths. Exported as a Chrome trace
+#          (chrome://tracing, https://ui.perfetto.dev) with a per-stage summary.
+#
+# Disabled (the default), stage() returns a shared no-op context manager and
+# @traced functions call straight through: one global lookup per call.
+#
+#   from vibration.instrument import stage, traced, counter
+#   with stage('pipeline.filter', samples=len(chunk)):
+#       ...
+#   @traced('ingest.load_movesense_arrays')
+#   def load_movesense_arrays(...): ...
+#
+# Enable in code with enable() / write_trace(path), or for a whole run, pool
+# workers included, with the environment variable
+#   VIBRATION_TRACE=<folder>     each process writes <folder>/trace_<pid>.json at exit
+#   VIBRATION_TRACE_MEMORY=1     also trace allocations (slow: several times the runtime)
+# and merge the per-process files with merge_traces() / `python -m vibration.instrument`.
+# ==============================================================================
+
+# --- 1. Instrumentation Constants ---
+TRACE_ENV = 'VIBRATION_TRACE'
+TRACE_MEMORY_ENV = 'VIBRATION_TRACE_MEMORY'
+# Individual events kept per process; beyond this only the per-stage totals are updated
+MAX_TRACE_EVENTS = 1_000_000
+
+# The active Tracer, or None when instrumentation is off
+_tracer = None
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage
+    resource = None
+
+
+def _maxrss_mb():
+    if resource is None:
+        return float('nan')
+    # ru_maxrss is in kB on Linux (bytes on macOS)
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process (MB), NaN where unavailable.
+
+    On Linux this is VmHWM, which starts again at exec. ru_maxrss is only the
+    fallback: it carries the parent's peak over fork and exec, so a small
+    subprocess of a large parent would report the parent's peak.
+    """
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return _maxrss_mb()
+
+
+class Tracer:
+    """
+    Collected events and per-stage totals of one process.
+    """
+
+    def __init__(self, memory=False):
+        """
+        Parameters:
+        - memory (bool): Trace allocations with tracemalloc (bytes allocated per stage).
+        """
+        self.pid = os.getpid()
+        self.memory = memory
+        # Common time base of all processes: wall clock at start + perf_counter offsets
+        self.epoch_us = time.time() * 1e6
+        self.perf_start = time.perf_counter()
+        # ('X', name, start_us, duration_us, thread id, args) / ('C', name, start_us, 0, thread id, args)
+        self.events = []
+        self.dropped_events = 0
+        # name -> [count, wall_s, cpu_s, samples, alloc_bytes (sum of stage peaks), peak_rss_mb]
+        self.stages = {}
+        # name -> [count, last, max, sum]
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # ru_maxrss is cheap but starts at the parent's peak; up to that value the
+        # (slower) peak_rss_mb() is read instead
+        maxrss = _maxrss_mb()
+        self._inherited_rss_mb = maxrss if maxrss > peak_rss_mb() else 0.0
+        if memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def now_us(self):
+        return self.epoch_us + (time.perf_counter() - self.perf_start) * 1e6
+
+    def _add_event(self, event):
+        if len(self.events) < MAX_TRACE_EVENTS:
+            self.events.append(event)
+        else:
+            self.dropped_events += 1
+
+    def record_stage(self, name, start, duration_s, cpu_s, samples, alloc_bytes, args):
+        rss_mb = _maxrss_mb()
+        if rss_mb <= self._inherited_rss_mb:
+            rss_mb = peak_rss_mb()
+        event_args = {'cpu_ms': round(cpu_s * 1000.0, 3)}
+        if samples:
+            event_args['samples'] = samples
+        if alloc_bytes is not None:
+            event_args['alloc_bytes'] = alloc_bytes
+        if args:
+            event_args.update(args)
+        start_us = self.epoch_us + (start - self.perf_start) * 1e6
+        with self._lock:
+            self._add_event(('X', name, start_us, duration_s * 1e6, threading.get_ident(), event_args))
+            totals = self.stages.get(name)
+            if totals is None:
+                totals = self.stages[name] = [0, 0.0, 0.0, 0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += duration_s
+            totals[2] += cpu_s
+            totals[3] += samples
+            totals[4] += alloc_bytes or 0
+            totals[5] = max(totals[5], rss_mb)
+
+    def record_counter(self, name, value, series):
+        with self._lock:
+            self._add_event(('C', name, self.now_us(), 0, threading.get_ident(), {series: value}))
+            totals = self.counters.get(name)
+            if totals is None:
+                totals = self.counters[name] = [0, value, value, 0]
+            totals[0] += 1
+            totals[1] = value
+            totals[2] = max(totals[2], value)
+            totals[3] += value
+
+    def summary(self):
+        """
+        Per-stage and per-counter totals.
+
+        Returns:
+        - dict: {'stages': {name: {count, wall_s, cpu_s, samples, samples_per_s,
+          alloc_bytes, peak_rss_mb}}, 'counters': {name: {count, last, max, mean}}}
+        """
+        stages = {}
+        for name, (count, wall_s, cpu_s, samples, alloc, rss) in self.stages.items():
+            stages[name] = {
+                'count': count,
+                'wall_s': wall_s,
+                'cpu_s': cpu_s,
+                'samples': samples,
+                'samples_per_s': samples / wall_s if samples and wall_s > 0 else None,
+                'alloc_bytes': alloc if self.memory else None,
+                'peak_rss_mb': rss,
+            }
+        counters = {name: {'count': n, 'last': last, 'max': peak, 'mean': total / n}
+                    for name, (n, last, peak, total) in self.counters.items()}
+        return {'stages': stages, 'counters': counters}
+
+    def trace_events(self):
+        """
+        The events in Chrome trace event format.
+        """
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                   'args': {'name': f"{os.path.basename(sys.argv[0]) or 'python'} ({self.pid})"}}]
+        for phase, name, start_us, duration_us, tid, args in self.events:
+            event = {'name': name, 'cat': name.split('.')[0], 'ph': phase, 'ts': round(start_us, 3),
+                     'pid': self.pid, 'tid': tid, 'args': args}
+            if phase == 'X':
+                event['dur'] = round(duration_us, 3)
+            events.append(event)
+        return events
+
+
+class _Stage:
+    """
+    Timing context of one stage execution (returned by stage() while enabled).
+    `samples` may be set inside the block when it is only known there.
+    """
+    __slots__ = ('tracer', 'name', 'samples', 'args', 'start', 'cpu_start', 'mem_start', 'outer')
+
+    def __init__(self, tracer, name, samples, args):
+        self.tracer = tracer
+        self.name = name
+        self.samples = samples
+        self.args = args
+
+    def __enter__(self):
+        if self.tracer.memory:
+            import tracemalloc
+            local = self.tracer._local
+            self.outer = getattr(local, 'stage', None)
+            current, peak = tracemalloc.get_traced_memory()
+            if self.outer is not None:
+                # Keep the enclosing stage's peak before resetting it for this one
+                self.outer.args['_peak'] = max(self.outer.args.get('_peak', 0), peak)
+            tracemalloc.reset_peak()
+            self.mem_start = current
+            self.args = dict(self.args)
+            local.stage = self
+        self.cpu_start = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu_start
+        alloc = None
+        if self.tracer.memory:
+            import tracemalloc
+            peak = max(tracemalloc.get_traced_memory()[1], self.args.pop('_peak', 0))
+            # Most memory held at once during the stage, above what was held at its start
+            alloc = max(peak - self.mem_start, 0)
+            self.tracer._local.stage = self.outer
+            if self.outer is not None:
+                self.outer.args['_peak'] = max(self.outer.args.get('_peak', 0), peak)
+        self.tracer.record_stage(self.name, self.start, duration, cpu, int(self.samples or 0), alloc, self.args)
+        return False
+
+
+class _NullStage:
+    """
+    Shared no-op stage used while instrumentation is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    # Writes to .samples inside a disabled stage are ignored
+    samples = property(lambda self: 0, lambda self, value: None)
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, samples=0, **args):
+    """
+    Context manager timing one stage.
+
+    Parameters:
+    - name (str): Stage name, 'area.step' (the part before the dot is the trace category).
+    - samples (int): Samples processed (for samples/s); can also be set on the returned
+      object inside the block.
+    - args: Extra values stored with the trace event (e.g. file name).
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_STAGE
+    return _Stage(tracer, name, samples, args)
+
+
+def traced(name=None, samples=None, result_samples=None):
+    """
+    Decorator timing every call of a function as one stage.
+
+    Parameters:
+    - name (str): Stage name (default: module.function).
+    - samples (callable): Called with the function's arguments, returns the number of
+      samples processed by that call.
+    - result_samples (callable): Alternatively called with the return value (for
+      loaders, where the sample count is only known afterwards).
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            n = samples(*args, **kwargs) if samples is not None else 0
+            with _Stage(tracer, stage_name, n, {}) as timed:
+                result = func(*args, **kwargs)
+                if result_samples is not None:
+                    timed.samples = result_samples(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def counter(name, value, series='value'):
+    """
+    Records a counter value (e.g. a queue depth) at the current time.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record_counter(name, value, series)
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def enable(memory=False):
+    """
+    Starts collecting (a new Tracer replaces any previous one).
+
+    Returns:
+    - Tracer
+    """
+    global _tracer
+    _tracer = Tracer(memory)
+    return _tracer
+
+
+def disable():
+    """
+    Stops collecting.
+
+    Returns:
+    - Tracer or None: The tracer that was active (its data stays available).
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and tracer.memory:
+        import tracemalloc
+        tracemalloc.stop()
+    return tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def write_trace(path, tracer=None):
+    """
+    Writes a Chrome trace JSON file: 'traceEvents', plus the per-stage summary under
+    'stages' / 'counters'.
+
+    Returns:
+    - str: The path written.
+    """
+    tracer = tracer or _tracer
+    if tracer is None:
+        raise ValueError("Instrumentation is not enabled.")
+    summary = tracer.summary()
+    trace = {
+        'traceEvents': tracer.trace_events(),
+        'displayTimeUnit': 'ms',
+        'stages': {str(tracer.pid): summary['stages']},
+        'counters': {str(tracer.pid): summary['counters']},
+        'dropped_events': tracer.dropped_events,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(trace, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def merge_traces(paths, out_path=None):
+    """
+    Merges the trace files of several processes into one trace.
+
+    Parameters:
+    - paths (list): Trace files (write_trace output).
+    - out_path (str): Merged file to write, optional.
+
+    Returns:
+    - dict: The merged trace; 'summary' holds the stage totals over all processes.
+    """
+    merged = {'traceEvents': [], 'displayTimeUnit': 'ms', 'stages': {}, 'counters': {}, 'dropped_events': 0}
+    for path in paths:
+        with open(path, 'r') as f:
+            trace = json.load(f)
+        merged['traceEvents'].extend(trace['traceEvents'])
+        merged['stages'].update(trace.get('stages', {}))
+        merged['counters'].update(trace.get('counters', {}))
+        merged['dropped_events'] += trace.get('dropped_events', 0)
+    merged['summary'] = combine_summaries(merged['stages'].values())
+    if out_path is not None:
+        with open(out_path, 'w') as f:
+            json.dump(merged, f)
+    return merged
+
+
+def combine_summaries(stage_summaries):
+    """
+    Adds up the per-stage summaries of several processes (peak RSS: the largest).
+    """
+    combined = {}
+    for stages in stage_summaries:
+        for name, s in stages.items():
+            total = combined.setdefault(name, {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'samples': 0,
+                                               'alloc_bytes': None, 'peak_rss_mb': 0.0, 'processes': 0})
+            total['count'] += s['count']
+            total['wall_s'] += s['wall_s']
+            total['cpu_s'] += s['cpu_s']
+            total['samples'] += s['samples']
+            if s['alloc_bytes'] is not None:
+                total['alloc_bytes'] = (total['alloc_bytes'] or 0) + s['alloc_bytes']
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], s['peak_rss_mb'])
+            total['processes'] += 1
+    for total in combined.values():
+        total['samples_per_s'] = total['samples'] / total['wall_s'] if total['samples'] and total['wall_s'] else None
+    return combined
+
+
+def format_summary(stages):
+    """
+    Text table of a stage summary (Tracer.summary()['stages'] or combine_summaries()),
+    slowest stage first.
+    """
+    lines = [f"{'stage':<40} {'calls':>7} {'wall s':>9} {'cpu s':>9} {'Msamples/s':>11} "
+             f"{'alloc MB':>9} {'peak RSS MB':>12}"]
+    for name, s in sorted(stages.items(), key=lambda item: -item[1]['wall_s']):
+        rate = f"{s['samples_per_s'] / 1e6:.2f}" if s['samples_per_s'] else '-'
+        alloc = f"{s['alloc_bytes'] / 2 ** 20:.1f}" if s['alloc_bytes'] is not None else '-'
+        lines.append(f"{name:<40} {s['count']:>7} {s['wall_s']:>9.3f} {s['cpu_s']:>9.3f} {rate:>11} "
+                     f"{alloc:>9} {s['peak_rss_mb']:>12.1f}")
+    return '\n'.join(lines)
+
+
+# --- 2. Environment-driven tracing (whole runs, including pool workers) ---
+def _write_env_trace():
+    tracer = _tracer
+    if tracer is not None and (tracer.events or tracer.stages):
+        write_trace(os.path.join(os.environ[TRACE_ENV], f'trace_{tracer.pid}.json'), tracer)
+
+
+def enable_env_tracing(folder, memory=False):
+    """
+    Traces this process and every process started from it from now on (they inherit
+    the environment variables); each writes <folder>/trace_<pid>.json at exit.
+    """
+    os.makedirs(folder, exist_ok=True)
+    os.environ[TRACE_ENV] = os.path.abspath(folder)
+    os.environ[TRACE_MEMORY_ENV] = '1' if memory else '0'
+    _enable_from_env()
+
+
+def collect_traces(folder, out_name='trace.json'):
+    """
+    Writes this process's trace and merges it with the traces the finished worker
+    processes left in folder.
+
+    Returns:
+    - dict: The merged trace (see merge_traces), also written to <folder>/<out_name>.
+    """
+    _write_env_trace()
+    out_path = os.path.join(folder, out_name)
+    return merge_traces(trace_files(folder), out_path)
+
+
+def _enable_from_env():
+    import multiprocessing.util
+
+    enable(memory=os.environ.get(TRACE_MEMORY_ENV, '') not in ('', '0'))
+    # Runs at interpreter exit, and in multiprocessing children before they exit
+    # (plain atexit handlers are skipped there)
+    multiprocessing.util.Finalize(None, _write_env_trace, exitpriority=10)
+
+    def _after_fork(_):
+        # A forked worker starts with a fresh trace of its own
+        enable(memory=_tracer.memory if _tracer is not None else False)
+        multiprocessing.util.Finalize(None, _write_env_trace, exitpriority=10)
+    multiprocessing.util.register_after_fork(_enable_from_env, _after_fork)
+
+
+def trace_files(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.startswith('trace_') and name.endswith('.json'))
+
+
+if os.environ.get(TRACE_ENV):
+    _enable_from_env()
+
+
+if __name__ == '__main__':
+    # --- Merge the per-process traces of a VIBRATION_TRACE run and print the summary ---
+    # Usage: python -m vibration.instrument <trace folder> [merged.json]
+    if len(sys.argv) < 2:
+        print("Usage: python -m vibration.instrument <trace folder> [merged.json]")
+        sys.exit(1)
+    folder = sys.argv[1]
+    out_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(folder, 'trace.json')
+    paths = trace_files(folder)
+    merged = merge_traces(paths, out_path)
+    print(f"Merged {len(paths)} process trace(s) into {out_path} (open in https://ui.perfetto.dev)")
+    print(format_summary(merged['summary']))
@@ -0,0 +1,171 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ._optional import is_dataframe, loaded_pandas
+from .instrument import traced
+
+# ==============================================================================
+# SEGMENTATION: vibration/segmentation.py
+# Purpose: Fixed-size overlapping windows (strided views) and per-window labels.
+#          Works on NumPy arrays / memory maps; DataFrame / Series input is accepted
+#          without this module importing pandas. The signal/02_preprocessing/
+#          scripts/segmentation.py script re-exports everything here.
+# ==============================================================================
+
+# --- Project Constants (Base these on standard HAR practice) ---
+# NOTE: These values need to be finalized through testing, but 1.28s is common.
+
+# The window size defines the length of each segment analyzed by the classifier.
+WINDOW_SIZE = 64  # samples. (e.g., if FS=50Hz, 64 samples is 1.28 seconds)
+
+# The overlap defines how much the next window moves forward.
+# A 50% overlap (0.5) is common to prevent missing key events at window boundaries.
+OVERLAP_RATIO = 0.5  
+SLIDE_STEP = int(WINDOW_SIZE * OVERLAP_RATIO)  # e.g., 32 samples
+
+
+def window_starts(n_samples, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
+    """
+    Start index of every full window over a stream of n_samples samples.
+    The i-th window of create_overlapping_windows covers [starts[i], starts[i] + window_size).
+    """
+    return np.arange(0, max(n_samples - window_size + 1, 0), slide_step)
+
+
+@traced('segmentation.create_overlapping_windows', samples=lambda data, *args, **kwargs: len(data))
+def create_overlapping_windows(df_filtered, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP, copy=False):
+    """
+    Breaks a continuous, filtered sensor stream (DataFrame) into a 3D NumPy array
+    using fixed-size, overlapping windows.
+
+    This function prepares data for feature extraction (fft_feature_extract.py)
+    and subsequent classification (train_onoff.ipynb).
+
+    The windows are a read-only strided VIEW of the input (no copy), so 50% overlap
+    does not double memory and memory-mapped input stays on disk until a window is
+    read. Pass copy=True for a contiguous, writable array.
+
+    Parameters:
+    - df_filtered (pd.DataFrame or np.array): The input DataFrame containing filtered triaxial
+      acceleration data (columns: accel_x_filtered, accel_y_filtered, accel_z_filtered),
+      or an (N, 3) array (e.g. np.load(..., mmap_mode='r')).
+    - window_size (int): The number of samples in each window.
+    - slide_step (int): The number of samples to slide before creating the next window.
+    - copy (bool): Materialize the windows as a contiguous copy.
+
+    Returns:
+    - np.array: A 3D array of shape (N_windows, window_size, 3)
+                (where 3 represents the X, Y, Z axes).
+    """
+    
+    # 1. Prepare Data
+    if is_dataframe(df_filtered):
+        data_array = df_filtered[['accel_x_filtered', 'accel_y_filtered', 'accel_z_filtered']].to_numpy()
+    else:
+        # np.asarray keeps a memory map as a view instead of reading it
+        data_array = np.asarray(df_filtered)
+    
+    # Calculate the total length of the data
+    n_samples = len(data_array)
+    if n_samples < window_size:
+        return np.empty((0, window_size) + data_array.shape[1:], dtype=data_array.dtype)
+    
+    # 2. Strided view: every window start, then every slide_step-th of them.
+    # sliding_window_view puts the window axis last: (N - W + 1, 3, W) -> (N_windows, W, 3)
+    windows = sliding_window_view(data_array, window_size, axis=0)[::slide_step]
+    windows = np.moveaxis(windows, -1, 1)
+    
+    # 3. Final Output (optionally materialized)
+    if copy:
+        return np.ascontiguousarray(windows)
+    return windows
+
+
+def load_windows_from_npy(path, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
+    """
+    Windows an (N, 3) .npy file straight from disk through a memory map.
+    Only the windows that are actually read are paged in.
+    """
+    return create_overlapping_windows(np.load(path, mmap_mode='r'), window_size, slide_step)
+
+
+def encode_labels(labels):
+    """
+    Integer-codes a label stream.
+
+    Returns:
+    - codes (np.array int): Class index of every sample.
+    - classes (np.array): Class value of every index (sorted, or the category order
+      for a categorical Series).
+    """
+    pd = loaded_pandas()
+    if pd is not None and isinstance(labels, pd.Series) and isinstance(labels.dtype, pd.CategoricalDtype):
+        return labels.cat.codes.to_numpy(), labels.cat.categories.to_numpy()
+    classes, codes = np.unique(np.asarray(labels), return_inverse=True)
+    return codes, classes
+
+
+def window_label_counts(codes, n_classes, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP):
+    """
+    Number of samples of each class in every window, in O(N) per class using
+    cumulative counts sampled at the window grid of create_overlapping_windows.
+
+    Returns:
+    - np.array int: Shape (N_windows, n_classes).
+    """
+    starts = window_starts(len(codes), window_size, slide_step)
+    counts = np.empty((len(starts), n_classes), dtype=np.int64)
+    for k in range(n_classes):
+        cumulative = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(codes == k, out=cumulative[1:])
+        counts[:, k] = cumulative[starts + window_size] - cumulative[starts]
+    return counts
+
+
+def summarize_window_labels(df_raw_labels, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP, on_labels=None):
+    """
+    Computes all per-window labels in one pass, aligned with create_overlapping_windows.
+
+    Parameters:
+    - df_raw_labels (pd.Series or np.array): One label per sample.
+    - window_size, slide_step: Same values as used for the windows.
+    - on_labels (list): Label values that count as 'Vibration ON' (optional).
+
+    Returns:
+    - dict: 'majority' (most frequent label per window, ties -> first class, like
+      Series.mode()[0]); and if on_labels is given 'any_on' (bool) and 'fraction_on' (float).
+    """
+    codes, classes = encode_labels(df_raw_labels)
+    counts = window_label_counts(codes, len(classes), window_size, slide_step)
+
+    result = {'majority': classes[np.argmax(counts, axis=1)] if len(counts) else classes[:0]}
+    if on_labels is not None:
+        on_counts = counts[:, np.isin(classes, list(on_labels))].sum(axis=1)
+        result['any_on'] = on_counts > 0
+        result['fraction_on'] = on_counts / window_size
+    return result
+
+
+# Optional: Function to retrieve corresponding labels if you were doing full HAR
+def create_window_labels(df_raw_labels, window_size=WINDOW_SIZE, slide_step=SLIDE_STEP,
+                         method='majority', on_labels=None):
+    """
+    Retrieves the majority label (e.g., 'Vibration ON' or 'OFF') for each window.
+
+    Vectorized over all windows (see summarize_window_labels); the i-th label belongs to
+    the i-th window of create_overlapping_windows.
+
+    Parameters:
+    - method (str): 'majority' (majority vote), 'any' (True if ANY sample is in
+      on_labels, a simpler rule for the On/Off classifier) or 'fraction' (fraction
+      of samples in on_labels).
+    - on_labels (list): Label values that count as ON (required for 'any'/'fraction').
+    """
+    if method not in ['majority', 'any', 'fraction']:
+        raise ValueError("method must be 'majority', 'any' or 'fraction'.")
+    if method != 'majority' and on_labels is None:
+        raise ValueError(f"method='{method}' requires on_labels.")
+
+    labels = summarize_window_labels(df_raw_labels, window_size, slide_step, on_labels)
+    key = {'majority': 'majority', 'any': 'any_on', 'fraction': 'fraction_on'}[method]
+    return labels[key]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from ._optional import scipy_signal
+
+# ==============================================================================
+# SPECTRAL: vibration/spectral.py
+# Purpose: FFT magnitude and Welch PSD of one signal (scipy.signal is imported on
+#          the first Welch call).
+# ==============================================================================
+
+
+def compute_fft(signal_data, fs):
+    """
+    Computes the FFT of a signal.
+    """
+    n = len(signal_data)
+    fft_vals = np.fft.fft(signal_data)
+    fft_freq = np.fft.fftfreq(n, d=1/fs)
+    
+    # Keep only positive frequencies
+    pos_mask = fft_freq > 0
+    fft_freq = fft_freq[pos_mask]
+    fft_mag = np.abs(fft_vals)[pos_mask] / n  # Normalize
+    
+    return fft_freq, fft_mag
+
+def compute_welch_psd(signal_data, fs, window_sec=1.0, overlap_ratio=0.5):
+    """
+    Computes Power Spectral Density using Welch's method.
+    """
+    nperseg = int(window_sec * fs)
+    noverlap = int(nperseg * overlap_ratio)
+    
+    freqs, psd = scipy_signal().welch(signal_data, fs, window='hann', nperseg=nperseg, noverlap=noverlap)
+    return freqs, psd
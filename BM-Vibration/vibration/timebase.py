@@ -0,0 +1,305 @@
+from fractions import Fraction
+
+import numpy as np
+
+# ==============================================================================
+# TIME BASE: timebase.py
+# Purpose: Rebuild per-sample timestamps of a Movesense stream from its packet
+#          timestamps, detecting dropped packets (Bluetooth gaps), counter
+#          rollover, non-monotonic or missing timestamps and clock drift, and
+#          resample the stream onto a uniform grid at a declared Fs.
+#
+# Movesense packets carry one 'Timestamp' (ms, uint32 counter) referring to the
+# LAST sample of the packet. Everything here is vectorized over packets.
+# ==============================================================================
+
+# --- 1. Time Base Constants ---
+# The sensor timestamp is a 32-bit millisecond counter
+ROLLOVER_MS = 2 ** 32
+# A packet spacing longer than expected by more than this many packet durations is a gap
+GAP_FACTOR = 1.5
+# Sample clock is re-fitted every this many packets, to follow slow clock drift
+FIT_BLOCK_PACKETS = 4096
+DEFAULT_FS = 833.0
+
+# Per-packet flags (bitmask) returned in 'packet_flags'
+FLAG_MISSING_TIMESTAMP = 1
+FLAG_ROLLOVER = 2
+FLAG_NON_MONOTONIC = 4
+FLAG_GAP_BEFORE = 8
+
+GAP_MAP_DTYPE = np.dtype([
+    ('packet_index', np.int64),     # First packet after the gap
+    ('sample_index', np.int64),     # First sample after the gap
+    ('start_ms', np.float64),       # Time of the last sample before the gap
+    ('end_ms', np.float64),         # Time of the first sample after the gap
+    ('duration_ms', np.float64),    # Time that is not covered by any sample
+    ('missing_samples', np.int64),  # Estimated number of dropped samples
+])
+
+
+def _unwrap_rollover(t_valid, rollover_ms):
+    """
+    Adds rollover_ms after every backwards jump larger than half the counter range.
+    Returns (unwrapped timestamps, bool mask of packets right after a rollover).
+    """
+    wrapped = np.zeros(len(t_valid), dtype=bool)
+    wrapped[1:] = np.diff(t_valid) < -rollover_ms / 2
+    return t_valid + np.cumsum(wrapped) * float(rollover_ms), wrapped
+
+
+def _segment_fit(x, y, segment_ids, n_segments, fallback_slope):
+    """
+    Least-squares line y = a + b * x per segment, for all segments at once.
+    Segments with a single point get slope fallback_slope through that point.
+    """
+    n = np.bincount(segment_ids, minlength=n_segments).astype(np.float64)
+    sx = np.bincount(segment_ids, x, n_segments)
+    sy = np.bincount(segment_ids, y, n_segments)
+    mx = sx / np.maximum(n, 1)
+    my = sy / np.maximum(n, 1)
+    dx = x - mx[segment_ids]
+    dy = y - my[segment_ids]
+    sxx = np.bincount(segment_ids, dx * dx, n_segments)
+    sxy = np.bincount(segment_ids, dx * dy, n_segments)
+
+    slope = np.full(n_segments, float(fallback_slope))
+    fit = sxx > 0
+    slope[fit] = sxy[fit] / sxx[fit]
+    intercept = my - slope * mx
+    return intercept, slope
+
+
+def reconstruct_timebase(packet_timestamps, packet_sizes, nominal_fs=None,
+                         rollover_ms=ROLLOVER_MS, gap_factor=GAP_FACTOR,
+                         fit_block_packets=FIT_BLOCK_PACKETS):
+    """
+    Rebuilds per-sample timestamps from Movesense packet timestamps.
+
+    Steps (all vectorized over packets):
+    1. Unwrap 32-bit counter rollover; drop non-monotonic and missing timestamps.
+    2. Estimate the sample interval as the median over consecutive packets.
+    3. Split the stream at dropouts (packet spacing longer than expected by more
+       than gap_factor packet durations) and record them in the gap map.
+    4. Fit a line (time vs. sample count) per segment, re-fitted every
+       fit_block_packets packets, which removes packet jitter and follows drift.
+
+    Parameters:
+    - packet_timestamps (np.array): Packet timestamps in ms (NaN where missing).
+    - packet_sizes (np.array): Number of samples in each packet.
+    - nominal_fs (float): Declared sampling rate, used for the drift estimate and
+      as the sample interval if no two packets have timestamps.
+    - rollover_ms (float): Range of the timestamp counter.
+    - gap_factor (float): Gap detection threshold in packet durations.
+    - fit_block_packets (int): Maximum packets per line fit.
+
+    Returns:
+    - timestamps (np.array float64): One timestamp (ms) per sample.
+    - gap_map (np.array): Structured array (GAP_MAP_DTYPE), one row per dropout.
+    - info (dict): sample_interval_ms, estimated_fs, drift_ppm (sample rate vs.
+      nominal_fs, or last vs. first fit block; positive = faster), jitter_ms,
+      n_rollovers, n_non_monotonic, n_missing_timestamps, n_gaps, missing_samples
+      and 'packet_flags' (np.array uint8, FLAG_* bitmask per packet).
+    """
+    t = np.asarray(packet_timestamps, dtype=np.float64)
+    sizes = np.asarray(packet_sizes, dtype=np.int64)
+    n_packets = len(sizes)
+    n_samples = int(sizes.sum())
+    ends = np.cumsum(sizes)  # Sample count up to and including each packet
+    flags = np.zeros(n_packets, dtype=np.uint8)
+    default_dt = 1000.0 / (nominal_fs or DEFAULT_FS)
+
+    # --- 1. Clean packet timestamps ---
+    valid = ~np.isnan(t)
+    flags[~valid] |= FLAG_MISSING_TIMESTAMP
+    valid_idx = np.flatnonzero(valid)
+
+    t_valid, wrapped = _unwrap_rollover(t[valid_idx], rollover_ms)
+    flags[valid_idx[wrapped]] |= FLAG_ROLLOVER
+
+    # A timestamp not later than every earlier one is out of order
+    non_monotonic = np.zeros(len(t_valid), dtype=bool)
+    if len(t_valid) > 1:
+        non_monotonic[1:] = t_valid[1:] <= np.maximum.accumulate(t_valid)[:-1]
+    flags[valid_idx[non_monotonic]] |= FLAG_NON_MONOTONIC
+    valid_idx = valid_idx[~non_monotonic]
+    t_valid = t_valid[~non_monotonic]
+
+    info = {
+        'n_rollovers': int(wrapped.sum()),
+        'n_non_monotonic': int(non_monotonic.sum()),
+        'n_missing_timestamps': int(n_packets - valid.sum()),
+    }
+
+    if len(t_valid) == 0:
+        # Nothing to anchor on: assume the nominal rate from t = 0
+        timestamps = np.arange(n_samples, dtype=np.float64) * default_dt
+        info.update(sample_interval_ms=default_dt, estimated_fs=1000.0 / default_dt,
+                    drift_ppm=0.0, jitter_ms=0.0, n_gaps=0, missing_samples=0,
+                    packet_flags=flags)
+        return timestamps, np.zeros(0, dtype=GAP_MAP_DTYPE), info
+
+    x_valid = ends[valid_idx].astype(np.float64)
+
+    # --- 2. Coarse sample interval: median over consecutive valid packets ---
+    dt_t = np.diff(t_valid)
+    dt_x = np.diff(x_valid)
+    dt = float(np.median(dt_t / dt_x)) if len(dt_t) else default_dt
+
+    # --- 3. Dropouts, then refine the interval over the spans without gaps ---
+    # (the median alone is biased by the 1 ms resolution of the timestamps)
+    slack = gap_factor * sizes[valid_idx[1:]] * dt
+    is_gap = dt_t - dt_x * dt > slack
+    if (~is_gap).any():
+        dt = float(dt_t[~is_gap].sum() / dt_x[~is_gap].sum())
+
+    gap_before = np.zeros(len(t_valid), dtype=bool)
+    gap_before[1:] = is_gap
+    flags[valid_idx[gap_before]] |= FLAG_GAP_BEFORE
+
+    # --- 4. Piecewise line fit: new segment at each gap and every fit block ---
+    block_start = np.zeros(len(t_valid), dtype=bool)
+    block_start[1:] = (valid_idx[1:] // fit_block_packets) != (valid_idx[:-1] // fit_block_packets)
+    segment_ids = np.cumsum(gap_before | block_start)
+    segment_ids -= segment_ids[0]
+    n_segments = int(segment_ids[-1]) + 1
+
+    intercept, slope = _segment_fit(x_valid, t_valid, segment_ids, n_segments, dt)
+    residual = t_valid - (intercept[segment_ids] + slope[segment_ids] * x_valid)
+
+    # Every packet (also those without a usable timestamp) joins the segment of the
+    # last valid packet before it; packets before the first valid one join segment 0
+    anchor = np.full(n_packets, -1, dtype=np.int64)
+    anchor[valid_idx] = np.arange(len(valid_idx))
+    anchor = np.maximum.accumulate(anchor)
+    packet_segment = segment_ids[np.maximum(anchor, 0)]
+
+    sample_segment = np.repeat(packet_segment, sizes)
+    sample_x = np.arange(1, n_samples + 1, dtype=np.float64)
+    timestamps = intercept[sample_segment] + slope[sample_segment] * sample_x
+
+    # --- 5. Gap map: each gap lies right before the first valid packet after it ---
+    gap_packets = valid_idx[1:][is_gap]
+    gap_samples = ends[gap_packets] - sizes[gap_packets]
+    gap_map = np.zeros(len(gap_packets), dtype=GAP_MAP_DTYPE)
+    gap_map['packet_index'] = gap_packets
+    gap_map['sample_index'] = gap_samples
+    gap_map['start_ms'] = timestamps[gap_samples - 1]
+    gap_map['end_ms'] = timestamps[gap_samples]
+    gap_map['duration_ms'] = gap_map['end_ms'] - gap_map['start_ms'] - dt
+    gap_map['missing_samples'] = np.rint(gap_map['duration_ms'] / dt).astype(np.int64)
+
+    # Drift: fitted sample clock vs. nominal rate (or first vs. last fit block)
+    seg_weight = np.bincount(segment_ids, minlength=n_segments).astype(np.float64)
+    mean_slope = float(np.average(slope, weights=seg_weight))
+    if nominal_fs:
+        drift_ppm = ((1000.0 / nominal_fs) / mean_slope - 1.0) * 1e6
+    else:
+        drift_ppm = (slope[0] / slope[-1] - 1.0) * 1e6
+
+    info.update(
+        sample_interval_ms=mean_slope,
+        estimated_fs=1000.0 / mean_slope if mean_slope > 0 else 0.0,
+        drift_ppm=float(drift_ppm),
+        jitter_ms=float(np.std(residual)),
+        n_gaps=int(len(gap_map)),
+        missing_samples=int(gap_map['missing_samples'].sum()),
+        packet_flags=flags,
+    )
+    return timestamps, gap_map, info
+
+
+def gap_mask(timestamps, gap_map):
+    """
+    Returns a bool mask, True where a timestamp falls inside a recorded gap.
+    """
+    mask = np.zeros(len(timestamps), dtype=bool)
+    if len(gap_map) == 0:
+        return mask
+    # Gaps are sorted and disjoint: inside one if more gaps started than ended before t
+    started = np.searchsorted(gap_map['start_ms'], timestamps, side='left')
+    ended = np.searchsorted(gap_map['end_ms'], timestamps, side='right')
+    mask[started > ended] = True
+    return mask
+
+
+def resample_uniform(timestamps, data, fs, gap_map=None, method='linear', fill_value=np.nan):
+    """
+    Resamples a (possibly irregular) stream onto a uniform time grid at fs.
+
+    Parameters:
+    - timestamps (np.array): Sample times in ms (from reconstruct_timebase).
+    - data (np.array): Samples, shape (N,) or (N, n_axes).
+    - fs (float): Declared output sampling rate (Hz).
+    - gap_map (np.array): Optional gap map; grid points inside gaps get fill_value.
+    - method (str): 'linear' (np.interp) or 'polyphase' (linear onto the native
+      rate, then scipy.signal.resample_poly to fs with anti-alias filtering).
+    - fill_value (float): Value for grid points inside gaps (None keeps the interpolation).
+
+    Returns:
+    - t_uniform (np.array float64): Grid times (ms).
+    - data_uniform (np.array float64): Resampled data, same number of axes as data.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    data = np.asarray(data)
+    squeeze = data.ndim == 1
+    if squeeze:
+        data = data[:, None]
+
+    t0, t1 = timestamps[0], timestamps[-1]
+    step_ms = 1000.0 / fs
+
+    if method == 'linear':
+        t_uniform = t0 + np.arange(int((t1 - t0) / step_ms) + 1) * step_ms
+        out = np.empty((len(t_uniform), data.shape[1]), dtype=np.float64)
+        for axis in range(data.shape[1]):
+            out[:, axis] = np.interp(t_uniform, timestamps, data[:, axis])
+
+    elif method == 'polyphase':
+        # Uniform grid at the native rate first, then a rational rate change
+        native_step = float(np.median(np.diff(timestamps)))
+        native_fs = 1000.0 / native_step
+        t_native = t0 + np.arange(int((t1 - t0) / native_step) + 1) * native_step
+        native = np.empty((len(t_native), data.shape[1]), dtype=np.float64)
+        for axis in range(data.shape[1]):
+            native[:, axis] = np.interp(t_native, timestamps, data[:, axis])
+
+        # scipy.signal is only needed here; importing it takes longer than the rest of the package
+        from scipy import signal
+        ratio = Fraction(fs / native_fs).limit_denominator(1000)
+        out = signal.resample_poly(native, ratio.numerator, ratio.denominator, axis=0)
+        t_uniform = t0 + np.arange(len(out)) * step_ms
+
+    else:
+        raise ValueError("method must be 'linear' or 'polyphase'.")
+
+    if gap_map is not None and fill_value is not None and len(gap_map):
+        out[gap_mask(t_uniform, gap_map)] = fill_value
+
+    return t_uniform, (out[:, 0] if squeeze else out)
+
+
+if __name__ == '__main__':
+    # --- Example: 833 Hz stream with jitter, drift, a dropout, a rollover and a lost timestamp ---
+    rng = np.random.default_rng(0)
+    fs_true = 833.0 * (1 + 50e-6)  # Sensor clock 50 ppm fast
+    sizes = np.full(2000, 8)
+    ends = np.cumsum(sizes)
+    t_true = ROLLOVER_MS - 5000 + ends * 1000.0 / fs_true
+    t_packets = np.round(t_true + rng.normal(0, 1.5, len(sizes))) % ROLLOVER_MS
+
+    keep = np.ones(len(sizes), dtype=bool)
+    keep[1000:1040] = False          # 40 packets dropped over Bluetooth
+    t_packets, sizes = t_packets[keep], sizes[keep]
+    t_packets[500] = np.nan          # Packet without 'Timestamp'
+
+    timestamps, gaps, info = reconstruct_timebase(t_packets, sizes, nominal_fs=833.0)
+
+    print("--- Time Base Reconstruction ---")
+    for key in ['estimated_fs', 'drift_ppm', 'jitter_ms', 'n_rollovers',
+                'n_missing_timestamps', 'n_gaps', 'missing_samples']:
+        print(f"{key}: {info[key]}")
+    print(f"Gap map: {gaps}")
+
+    t_uniform, z = resample_uniform(timestamps, np.sin(timestamps / 50.0), 833.0, gaps)
+    print(f"Uniform grid: {len(t_uniform)} samples, {np.isnan(z).sum()} inside gaps")